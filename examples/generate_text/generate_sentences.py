@@ -26,7 +26,8 @@ import argparse
 import itertools
 
 from glabra import text
-from glabra import seq_analyze
+from glabra import analyze
+from glabra import vocabulary
 
 WORD_DELIM_PATTERN = r"\s|\,|:|;|\""
 SENTENCE_DELIM_PATTERN = r"\."
@@ -73,8 +74,8 @@ def main():
   bounds = text.parse_bounds(args.bounds or BOUNDS_DEFAULT)
 
   # print help and exit if no files were specified
-  if len(args.filenames or []) == 0:
-    print "Must specify at least one filename."
+  if len(args.filenames or []) == 0 and args.load_filename == None:
+    print "Must specify at least one filename, or an analyzer to load."
     parser.print_help()
     exit(1)
 
@@ -82,9 +83,17 @@ def main():
   args.word_delim = args.word_delim.decode("string-escape")
   args.sentence_delim = args.sentence_delim.decode("string-escape")
 
-  # parse files and analyze contents
-  sequence_analyzer = get_sequence_analyzer(
-    args.filenames, args.sentence_delim, args.word_delim)
+  # load the analyzer if one was saved before, else parse files and analyze contents
+  if args.load_filename != None:
+    sequence_analyzer = analyze.load_sequence_analyzer(args.load_filename)
+  else:
+    sequence_analyzer = get_sequence_analyzer(
+      args.filenames, args.sentence_delim, args.word_delim, ngram_lengths=bounds.keys(),
+      processes=args.processes)
+
+  # save the analyzer for later runs
+  if args.save_filename != None:
+    analyze.save_sequence_analyzer(sequence_analyzer, args.save_filename)
 
   # create the generator by putting a space between each word and ending with '.'
   text_generator = text.TextGenerator(
@@ -103,28 +112,38 @@ def main():
     for sentence in itertools.islice(text_generator.get_all_texts(args.unique), args.all_limit):
       print sentence
 
-def get_sequence_analyzer(filenames, sentence_delim, word_delim):
+def get_sequence_analyzer(filenames, sentence_delim, word_delim, ngram_lengths=None,
+    processes=1):
   """Parse and analyzer sentence files.
 
   Files are parsed using the provided patterns. One SequenceAnalyzer is
-  created for each file, they are weighted equally and merged.
+  created for each file, they are weighted equally and merged. Words are
+  encoded with a Vocabulary shared by all files.
 
   Args:
     filenames: Files with sentences separated by sentence_delim.
     sentence_delim: Pattern for sentence separation.
     word_delim: Pattern for word separation.
+    ngram_lengths: Lengths of n-grams to count up front.
+    processes: Number of processes to parse files with, 0 meaning one per CPU.
 
   Returns:
     A SequenceAnalyzer with all files weighted equally.
   """
   # analyze data files
+  words = vocabulary.Vocabulary()
+  if processes != 1:
+    return analyze.merge_normalized_sequence_analyzers(text.get_sequence_analyzers(
+      filenames, sentence_delim, element_delimiter_pattern=word_delim,
+      ngram_lengths=ngram_lengths, vocabulary=words, processes=processes or None))
   sequence_analyzers = []
   for filename in filenames:
     sequence_analyzers.append(text.get_sequence_analyzer(
-      filename, sentence_delim, element_delimiter_pattern=word_delim))
+      filename, sentence_delim, element_delimiter_pattern=word_delim,
+      ngram_lengths=ngram_lengths, vocabulary=words))
 
   # merge all analyzers into one
-  return seq_analyze.merge_normalized_sequence_analyzers(sequence_analyzers)
+  return analyze.merge_normalized_sequence_analyzers(sequence_analyzers)
 
 def get_arg_parser():
   parser = argparse.ArgumentParser(
@@ -166,6 +185,24 @@ def get_arg_parser():
     dest="unique",
     action="store_true",
     help="Don't allow sentences in training data.")
+  parser.add_argument("--save-analyzer",
+    dest="save_filename",
+    metavar="FILENAME",
+    default=None,
+    help="Save the analyzed training data to a file. (default: %(default)s)")
+  parser.add_argument("--load-analyzer",
+    dest="load_filename",
+    metavar="FILENAME",
+    default=None,
+    help="Load analyzed training data saved with --save-analyzer, instead of "
+      "parsing files. (default: %(default)s)")
+  parser.add_argument("--processes",
+    dest="processes",
+    metavar="NUMBER_OF_PROCESSES",
+    default=1,
+    type=int,
+    help="Number of processes to parse files with, 0 meaning one per CPU. "
+      "(default: %(default)s)")
   return parser
 
 if __name__ == "__main__":
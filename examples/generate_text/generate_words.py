@@ -89,8 +89,8 @@ def main():
   bounds = text.parse_bounds(args.bounds or BOUNDS_DEFAULT)
 
   # print help and exit if no files were specified
-  if len(args.filenames or []) + len(args.freq_filenames or []) == 0:
-    print "Must specify at least one filename."
+  if len(args.filenames or []) + len(args.freq_filenames or []) == 0 and args.load_filename == None:
+    print "Must specify at least one filename, or an analyzer to load."
     parser.print_help()
     exit(1)
 
@@ -98,9 +98,17 @@ def main():
   args.word_delim = args.word_delim.decode("string-escape")
   args.freq_delim = args.freq_delim.decode("string-escape")
 
-  # parse files and analyze contents
-  sequence_analyzer = get_sequence_analyzer(
-    args.filenames, args.freq_filenames, args.word_delim, args.freq_delim, args.freq_grouping)
+  # load the analyzer if one was saved before, else parse files and analyze contents
+  if args.load_filename != None:
+    sequence_analyzer = analyze.load_sequence_analyzer(args.load_filename)
+  else:
+    sequence_analyzer = get_sequence_analyzer(
+      args.filenames, args.freq_filenames, args.word_delim, args.freq_delim, args.freq_grouping,
+      ngram_lengths=bounds.keys(), processes=args.processes)
+
+  # save the analyzer for later runs
+  if args.save_filename != None:
+    analyze.save_sequence_analyzer(sequence_analyzer, args.save_filename)
 
   # create the generator
   text_generator = text.TextGenerator(bounds, sequence_analyzer)
@@ -118,7 +126,8 @@ def main():
     for word in itertools.islice(text_generator.get_all_texts(args.unique), args.all_limit):
       print word
 
-def get_sequence_analyzer(filenames, freq_filenames, word_delim, freq_delim, freq_grouping):
+def get_sequence_analyzer(filenames, freq_filenames, word_delim, freq_delim, freq_grouping,
+    ngram_lengths=None, processes=1):
   """Parse and analyzer word files.
 
   Files are parsed using the provided patterns. One SequenceAnalyzer is
@@ -132,20 +141,37 @@ def get_sequence_analyzer(filenames, freq_filenames, word_delim, freq_delim, fre
     word_delim: Pattern for word separation.
     freq_delim: Pattern for word-frequencey separation.
     freq_grouping: Reqex for matching word and frequency.
+    ngram_lengths: Lengths of n-grams to count up front.
+    processes: Number of processes to parse files with, 0 meaning one per CPU.
 
   Returns:
     A SequenceAnalyzer with all files weighted equally.
   """
   # analyze data files, both frequency files and others
   sequence_analyzers = []
+  if processes != 1:
+    if filenames:
+      sequence_analyzers.extend(text.get_sequence_analyzers(
+        filenames, word_delim, ngram_lengths=ngram_lengths, processes=processes or None))
+    if freq_filenames:
+      sequence_analyzers.extend(text.get_sequence_analyzers(
+        freq_filenames,
+        freq_delim,
+        element_delimiter_pattern=None,
+        frequency_grouping_pattern=freq_grouping,
+        ngram_lengths=ngram_lengths,
+        processes=processes or None))
+    return analyze.merge_normalized_sequence_analyzers(sequence_analyzers)
   for filename in filenames or []:
-    sequence_analyzers.append(text.get_sequence_analyzer(filename, word_delim))
+    sequence_analyzers.append(text.get_sequence_analyzer(
+      filename, word_delim, ngram_lengths=ngram_lengths))
   for filename in freq_filenames or []:
     sequence_analyzers.append(text.get_sequence_analyzer(
       filename,
       freq_delim,
       element_delimiter_pattern=None,
-      frequency_grouping_pattern=freq_grouping))
+      frequency_grouping_pattern=freq_grouping,
+      ngram_lengths=ngram_lengths))
 
   # merge all analyzers into one
   return analyze.merge_normalized_sequence_analyzers(sequence_analyzers)
@@ -200,6 +226,24 @@ def get_arg_parser():
     dest="unique",
     action="store_true",
     help="Don't return words in training data.")
+  parser.add_argument("--save-analyzer",
+    dest="save_filename",
+    metavar="FILENAME",
+    default=None,
+    help="Save the analyzed training data to a file. (default: %(default)s)")
+  parser.add_argument("--load-analyzer",
+    dest="load_filename",
+    metavar="FILENAME",
+    default=None,
+    help="Load analyzed training data saved with --save-analyzer, instead of "
+      "parsing files. (default: %(default)s)")
+  parser.add_argument("--processes",
+    dest="processes",
+    metavar="NUMBER_OF_PROCESSES",
+    default=1,
+    type=int,
+    help="Number of processes to parse files with, 0 meaning one per CPU. "
+      "(default: %(default)s)")
   return parser
 
 if __name__ == "__main__":
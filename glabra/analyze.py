@@ -23,7 +23,66 @@
 __author__ = 'Christofer Hedbrandh (chedbrandh@gmail.com)'
 __copyright__ = 'Copyright (c) 2015 Christofer Hedbrandh'
 
+import array
+import bisect
+import codecs
 import copy
+import itertools
+import json
+import mmap
+import operator
+import struct
+import sys
+
+# numpy is optional, and only used to build percentile indices faster
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+from glabra import external
+from glabra import sketch
+from glabra import suffix
+from glabra import vocabulary as vocabulary_module
+
+# for python 2 and python 3 compatibility
+if sys.version_info < (3,):
+  def _accumulate(values):
+    total = None
+    for value in values:
+      total = value if total is None else total + value
+      yield total
+else:
+  _accumulate = itertools.accumulate
+
+# kinds of n-grams, i.e. all n-grams, leading n-grams, and trailing n-grams
+KIND_NGRAMS = "ngrams"
+KIND_LEADING = "leading"
+KIND_TRAILING = "trailing"
+KINDS = (KIND_NGRAMS, KIND_LEADING, KIND_TRAILING)
+
+# stored frequencies within this fraction of zero are removed
+_REMOVAL_TOLERANCE = 1e-9
+
+# number of sequences concatenated at a time when packing a stream of them
+_CONCAT_BLOCK_SIZE = 4096
+
+# bounds at most this fraction of the percentiles apart, holding at most this
+# fraction of the n-grams, are selected from the frequencies rather than from
+# a percentile index
+_SELECT_MAX_FRACTION = 0.25
+
+# snapshot files start with the magic, the version, and the header size
+_SNAPSHOT_MAGIC = b"GLABRASA"
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_PREAMBLE = struct.Struct("<8sII")
+# data sections of snapshot files are aligned to this many bytes
+_SNAPSHOT_ALIGNMENT = 8
+# {element type:(encoding, bytes per element)} of snapshot sequences
+_SNAPSHOT_ELEMENT_TYPES = {"text": ("utf-32-le", 4), "bytes": (None, 1)}
+# sequence offsets of snapshot files are 32-bit unsigned integers
+_SNAPSHOT_OFFSET_TYPECODE = 'I'
+_SNAPSHOT_MAX_OFFSET = 2 ** 32 - 1
 
 class SequenceAnalyzer(object):
   """Provides analytics for some given sequences.
@@ -39,6 +98,21 @@ class SequenceAnalyzer(object):
   operator, and frequencies of an instance can be multiplied by a number with
   the * operator.
 
+  Multiplication does not touch the stored frequencies. Instead a scale
+  factor is kept, by which all stored frequencies are multiplied when read.
+  The result of the * operator therefore shares its frequency tables with
+  the original instance, and the tables are copied first when either
+  instance is mutated.
+
+  Once all sequences have been added an instance can be frozen, converting
+  its frequency tables to compact arrays. A frozen instance can still be
+  multiplied, but not added to or added with other instances.
+
+  Sequences of elements, e.g. sentences as tuples of words, can be encoded
+  with a Vocabulary. Sequences and n-grams are then stored, and returned, as
+  encoded strings. Instances can only be added if they share the same
+  Vocabulary.
+
   Glossary:
     Leading n-gram: An n-gram that shares its first element with the
     first element of the sequence it was derived from.
@@ -47,16 +121,59 @@ class SequenceAnalyzer(object):
     last element of the sequence it was derived from.
   """
 
-  def __init__(self, sequences_frequencies):
+  # false if instances can not be added with the + operator, or merged
+  _addable = True
+
+  def __init__(self, sequences_frequencies, ngram_lengths=None, vocabulary=None,
+      use_suffix_array=False, derive_leading_trailing=False):
     """Sequences are added for analysis at initialization.
 
+    Counting n-grams of every length is quadratic in the sequence length.
+    If only some n-gram lengths are of interest they can be specified with
+    ngram_lengths. n-grams of other lengths are then counted the first time
+    they are requested.
+
+    E.g.
+    ngram_lengths = [4] counts only 4-grams up front.
+    ngram_lengths = range(1, 5) counts n-grams of length at most 4.
+
     Args:
       sequences_frequencies: Tuples of (sequence, frequency) where
         frequency indicates the frequency of the sequence.
+      ngram_lengths: Lengths of n-grams to count at initialization. If None,
+        n-grams of all lengths are counted.
+      vocabulary: Vocabulary to encode the sequences with. If None, sequences
+        are not encoded.
+      use_suffix_array: If True, n-grams are counted with a suffix array over
+        all distinct sequences rather than one occurrence at a time. See
+        suffix.count_ngrams. Every distinct n-gram is then sliced once rather
+        than once per occurrence, which pays off for long sequences sharing
+        long subsequences. Otherwise counting one occurrence at a time is
+        faster.
+      derive_leading_trailing: If True, leading and trailing n-grams are not
+        stored, but derived from the sequences for each length the first
+        time they are requested. Only the n-grams of requested lengths are
+        then held, and only in their percentile indices.
     """
     if len(sequences_frequencies) == 0:
       raise ValueError("Must provide some sequences.")
 
+    self._init_tables(ngram_lengths, vocabulary)
+    self._use_suffix_array = use_suffix_array
+    self._derive_leading_trailing = derive_leading_trailing
+
+    # add sequences and n-grams
+    self._add_seqs(sequences_frequencies)
+
+  def _init_tables(self, ngram_lengths, vocabulary):
+    """Initialize empty frequency tables.
+
+    Args:
+      ngram_lengths: Lengths of n-grams to count, None meaning all lengths.
+      vocabulary: Vocabulary sequences are encoded with, or None.
+    """
+    self._vocabulary = vocabulary
+
     # {len_ng:{ng:freq}}
     self._freq_dict = {}
     self._freq_dict_leading = {}
@@ -73,56 +190,383 @@ class SequenceAnalyzer(object):
     # {seq:total_freq}
     self._seq_freq_dict = {}
 
-    # add sequences and n-grams
-    self._add_seqs(sequences_frequencies)
+    # set of counted n-gram lengths, None meaning that all lengths are counted
+    self._ngram_lengths = None if ngram_lengths is None else set(ngram_lengths)
+
+    # {(kind, len_ng):_PercentileIndex} built on request
+    self._percentile_indices = {}
+
+    # incremented whenever n-grams or their percentiles may have changed
+    self._version = 0
+
+    # factor applied to all stored frequencies when read
+    self._scale = 1.0
+
+    # true if the tables above may be shared with other instances
+    self._shares_tables = False
+
+    # true if the tables above have been converted to arrays
+    self._frozen = False
+
+    # true if n-grams are counted with suffix.count_ngrams
+    self._use_suffix_array = False
+
+    # true if leading and trailing n-grams are derived from the sequences
+    # when requested, leaving their frequency dictionaries empty
+    self._derive_leading_trailing = False
 
   def _add_seqs(self, seqs_freqs):
     """Add all sequences with assosiated frequency.
 
-    For every sequence also add every possible n-gram, leading
-    n-gram, and trailing n-gram.
+    For every sequence also add every n-gram, leading n-gram, and trailing
+    n-gram of the counted n-gram lengths.
+
+    Occurrences of the same sequence are added up before n-grams are
+    counted, so the n-grams of a sequence are sliced once no matter how many
+    times it occurs, e.g. once per distinct word in a text.
 
     Args:
       seqs_freqs: Tuples of (sequence, frequency).
     """
+    # {seq:freq} of the added sequences, in order of first occurrence
+    added_seq_freq_dict = {}
     for seq, freq in seqs_freqs:
       if freq <= 0:
         raise ValueError("Sequence frequency must be greater than zero.")
+      if self._vocabulary is not None:
+        seq = self._vocabulary.encode(seq)
       # set self._seq_freq_dict
       self._seq_freq_dict[seq] = self._seq_freq_dict.get(seq, 0) + freq
       # set self._seq_len_dict
       self._seq_len_dict[len(seq)] = self._seq_len_dict.get(len(seq), 0) + freq
-      # for all n-gram lengths
-      for len_ng in range(1, len(seq) + 1):
-        # set self._freq_dict_leading and self._total_freq_dict_leading
-        ng = seq[:len_ng]
-        d = self._freq_dict_leading.setdefault(len_ng, {})
-        d[ng] = d.get(ng, 0) + freq
-        self._total_freq_dict_leading[len_ng] = \
-            self._total_freq_dict_leading.get(len_ng, 0) + freq
-        # set self._freq_dict_trailing and self._total_freq_dict_trailing
-        ng = seq[-len_ng:]
-        d = self._freq_dict_trailing.setdefault(len_ng, {})
-        d[ng] = d.get(ng, 0) + freq
-        self._total_freq_dict_trailing[len_ng] = \
-            self._total_freq_dict_trailing.get(len_ng, 0) + freq
-        # set self._freq_dict and self._total_freq_dict
-        for i in range(len(seq) - len_ng + 1):
-          ng = seq[i : i + len_ng]
-          d = self._freq_dict.setdefault(len_ng, {})
+      added_seq_freq_dict[seq] = added_seq_freq_dict.get(seq, 0) + freq
+    if self._use_suffix_array:
+      self._add_ngram_counts(suffix.count_ngrams(
+          added_seq_freq_dict.items(), self._ngram_lengths))
+      return
+    for (seq, freq) in added_seq_freq_dict.items():
+      # for all counted n-gram lengths
+      if self._ngram_lengths is None:
+        lengths = range(1, len(seq) + 1)
+      else:
+        lengths = [len_ng for len_ng in self._ngram_lengths if len_ng <= len(seq)]
+      for len_ng in lengths:
+        self._add_ngrams(seq, freq, len_ng)
+
+  def _add_ngram_counts(self, ngram_counts):
+    """Add n-grams, leading and trailing n-grams counted elsewhere.
+
+    Args:
+      ngram_counts: Tuple of dictionaries ({len_ng:{ng:freq}},
+        {len_ng:{ng:freq}}, {len_ng:{ng:freq}}) of n-grams, leading n-grams
+        and trailing n-grams.
+    """
+    for (kind, kind_counts) in zip(KINDS, ngram_counts):
+      (freq_dict, total_freq_dict) = self._get_freq_dicts(kind)
+      for (len_ng, counts) in kind_counts.items():
+        if kind != KIND_NGRAMS and self._derive_leading_trailing:
+          total_freq_dict[len_ng] = total_freq_dict.get(len_ng, 0) + sum(counts.values())
+          continue
+        if len_ng not in freq_dict:
+          freq_dict[len_ng] = counts
+          total_freq_dict[len_ng] = total_freq_dict.get(len_ng, 0) + sum(counts.values())
+          continue
+        d = freq_dict[len_ng]
+        for (ng, freq) in counts.items():
           d[ng] = d.get(ng, 0) + freq
-          self._total_freq_dict[len_ng] = \
-              self._total_freq_dict.get(len_ng, 0) + freq
+          total_freq_dict[len_ng] = total_freq_dict.get(len_ng, 0) + freq
+
+  def _add_ngrams(self, seq, freq, len_ng):
+    """Add all n-grams, leading and trailing n-grams of some length of a sequence.
+
+    Args:
+      seq: Sequence to add n-grams of.
+      freq: Frequency of the sequence.
+      len_ng: Length of n-grams to add. Must not be greater than len(seq).
+    """
+    # set self._freq_dict_leading and self._total_freq_dict_leading
+    if not self._derive_leading_trailing:
+      ng = seq[:len_ng]
+      d = self._freq_dict_leading.setdefault(len_ng, {})
+      d[ng] = d.get(ng, 0) + freq
+    self._total_freq_dict_leading[len_ng] = \
+        self._total_freq_dict_leading.get(len_ng, 0) + freq
+    # set self._freq_dict_trailing and self._total_freq_dict_trailing
+    if not self._derive_leading_trailing:
+      ng = seq[-len_ng:]
+      d = self._freq_dict_trailing.setdefault(len_ng, {})
+      d[ng] = d.get(ng, 0) + freq
+    self._total_freq_dict_trailing[len_ng] = \
+        self._total_freq_dict_trailing.get(len_ng, 0) + freq
+    # set self._freq_dict and self._total_freq_dict
+    d = self._freq_dict.setdefault(len_ng, {})
+    num_ngs = len(seq) - len_ng + 1
+    for i in range(num_ngs):
+      ng = seq[i : i + len_ng]
+      d[ng] = d.get(ng, 0) + freq
+    self._total_freq_dict[len_ng] = \
+        self._total_freq_dict.get(len_ng, 0) + freq * num_ngs
+
+  def _remove_ngrams(self, seq, freq, len_ng):
+    """Remove all n-grams, leading and trailing n-grams of some length of a sequence.
+
+    Args:
+      seq: Sequence to remove n-grams of.
+      freq: Frequency of the sequence to remove.
+      len_ng: Length of n-grams to remove. Must not be greater than len(seq).
+    """
+    for (kind, ngs) in [
+        (KIND_NGRAMS, [seq[i : i + len_ng] for i in range(len(seq) - len_ng + 1)]),
+        (KIND_LEADING, [seq[:len_ng]]),
+        (KIND_TRAILING, [seq[-len_ng:]])]:
+      (freq_dict, total_freq_dict) = self._get_freq_dicts(kind)
+      if kind != KIND_NGRAMS and self._derive_leading_trailing:
+        # derived n-grams run out together with the n-grams
+        if len_ng in self._freq_dict:
+          total_freq_dict[len_ng] -= freq
+        else:
+          del total_freq_dict[len_ng]
+        continue
+      d = freq_dict[len_ng]
+      for ng in ngs:
+        _subtract(d, ng, freq)
+        total_freq_dict[len_ng] -= freq
+      # no n-grams left, e.g. after removing the only long sequence
+      if len(d) == 0:
+        del freq_dict[len_ng]
+        del total_freq_dict[len_ng]
+
+  def _count_ngrams(self, *ngram_lengths):
+    """Count n-grams of some lengths if they have not been counted already.
+
+    n-grams are counted from the distinct sequences and their total
+    frequencies, all lengths in one pass over the sequences.
+
+    Args:
+      ngram_lengths: Lengths of n-grams to count.
+    """
+    if self._ngram_lengths is None:
+      return
+    lengths = sorted(set(ngram_lengths) - self._ngram_lengths)
+    if len(lengths) == 0:
+      return
+    if self._use_suffix_array:
+      self._add_ngram_counts(suffix.count_ngrams(self._seq_freq_dict.items(), lengths))
+    else:
+      for (seq, freq) in self._seq_freq_dict.items():
+        for len_ng in lengths:
+          if len_ng <= len(seq):
+            self._add_ngrams(seq, freq, len_ng)
+    self._ngram_lengths.update(lengths)
+    if self._frozen:
+      for len_ng in lengths:
+        self._pack_ngrams(len_ng)
+
+  def _restrict_ngram_lengths(self, ngram_lengths):
+    """Discard n-grams of lengths not in ngram_lengths.
+
+    Discarded n-gram lengths are counted again from the sequences if
+    requested later on.
+
+    Args:
+      ngram_lengths: Set of n-gram lengths to keep, None meaning all.
+    """
+    if ngram_lengths is None:
+      return
+    for self_dict in \
+        [self._freq_dict,
+        self._freq_dict_leading,
+        self._freq_dict_trailing,
+        self._total_freq_dict,
+        self._total_freq_dict_leading,
+        self._total_freq_dict_trailing]:
+      for len_ng in list(self_dict.keys()):
+        if len_ng not in ngram_lengths:
+          del self_dict[len_ng]
+    for (kind, len_ng) in list(self._percentile_indices.keys()):
+      if len_ng not in ngram_lengths:
+        del self._percentile_indices[(kind, len_ng)]
+    self._ngram_lengths = set(ngram_lengths)
+
+  def _share_tables(self):
+    """Get a new instance sharing the frequency tables of self.
+
+    The tables are copied by whichever instance is mutated first.
+
+    Returns:
+      A shallow copy of self.
+    """
+    result = copy.copy(self)
+    self._shares_tables = True
+    result._shares_tables = True
+    return result
+
+  def _unshare_tables(self):
+    """Copy frequency tables possibly shared with other instances.
+
+    Must be called before the tables are mutated. Tables are copied only one
+    level deep, since the values are numbers or immutable indices.
+    """
+    if not self._shares_tables:
+      return
+    self._freq_dict = _copy_dict_dict(self._freq_dict)
+    self._freq_dict_leading = _copy_dict_dict(self._freq_dict_leading)
+    self._freq_dict_trailing = _copy_dict_dict(self._freq_dict_trailing)
+    self._total_freq_dict = self._total_freq_dict.copy()
+    self._total_freq_dict_leading = self._total_freq_dict_leading.copy()
+    self._total_freq_dict_trailing = self._total_freq_dict_trailing.copy()
+    self._seq_len_dict = self._seq_len_dict.copy()
+    self._seq_freq_dict = self._seq_freq_dict.copy()
+    if self._ngram_lengths is not None:
+      self._ngram_lengths = set(self._ngram_lengths)
+    self._percentile_indices = self._percentile_indices.copy()
+    self._shares_tables = False
+
+  def freeze(self):
+    """Convert the frequency tables to compact arrays.
+
+    For every counted n-gram length and kind of n-gram, the n-grams are
+    sorted by frequency and stored back to back, together with arrays of
+    cumulative frequencies and percentiles. The sequences are stored back to
+    back with arrays of offsets and frequencies. The n-gram frequency
+    dictionaries are discarded.
+
+    A frozen instance provides the same n-grams, sequences and frequencies
+    as before, but can not be added to or added with other instances.
+
+    Returns:
+      The frozen instance itself.
+    """
+    if self._frozen:
+      return self
+    self._unshare_tables()
+    for len_ng in list(self._total_freq_dict.keys()):
+      self._pack_ngrams(len_ng)
+    self._seq_freq_dict = _pack_seq_freq_dict(self._seq_freq_dict.items())
+    self._frozen = True
+    return self
 
-  @staticmethod
-  def _get_ngs(lower_bound, upper_bound, freq_dict, total_freq):
-    """Generates all n-grams for some length and bounds.
+  def is_frozen(self):
+    """Returns True if the frequency tables have been converted to arrays."""
+    return self._frozen
+
+  def _pack_ngrams(self, len_ng):
+    """Replace the n-gram frequency dictionaries of some length with packed indices.
+
+    Args:
+      len_ng: Length of n-grams to pack.
+    """
+    for kind in KINDS:
+      # derived n-grams are packed when requested
+      if kind != KIND_NGRAMS and self._derive_leading_trailing and \
+          (kind, len_ng) not in self._percentile_indices:
+        continue
+      index = self._get_percentile_index(kind, len_ng)
+      if index is not None:
+        self._percentile_indices[(kind, len_ng)] = index.pack(len_ng)
+      (freq_dict, _) = self._get_freq_dicts(kind)
+      freq_dict.pop(len_ng, None)
+
+  def _get_freq_dicts(self, kind):
+    """Get the n-gram and total frequency dictionaries of some kind of n-grams.
+
+    Args:
+      kind: One of KIND_NGRAMS, KIND_LEADING, and KIND_TRAILING.
+
+    Returns:
+      Tuple of dictionaries ({len_ng:{ng:freq}}, {len_ng:total_freq}).
+    """
+    if kind == KIND_NGRAMS:
+      return (self._freq_dict, self._total_freq_dict)
+    if kind == KIND_LEADING:
+      return (self._freq_dict_leading, self._total_freq_dict_leading)
+    if kind == KIND_TRAILING:
+      return (self._freq_dict_trailing, self._total_freq_dict_trailing)
+    raise ValueError("Unknown kind of n-grams '%s'." % kind)
+
+  def _get_percentile_index(self, kind, len_ng):
+    """Get the, possibly cached, percentile index of some n-grams.
 
     Args:
+      kind: Kind of n-grams, e.g. KIND_LEADING.
+      len_ng: Length of n-grams.
+
+    Returns:
+      The _PercentileIndex of the n-grams, or None if the total frequency of
+      the n-grams is zero.
+    """
+    key = (kind, len_ng)
+    if key not in self._percentile_indices:
+      (freq_dict, total_freq_dict) = self._get_freq_dicts(kind)
+      total_freq = total_freq_dict.get(len_ng, 0)
+      if total_freq == 0:
+        return None
+      if kind != KIND_NGRAMS and self._derive_leading_trailing:
+        index = _build_percentile_index(self._derive_freq_dict(kind, len_ng), total_freq)
+        # frozen instances only hold packed indices
+        if self._frozen:
+          index = index.pack(len_ng)
+      else:
+        index = _build_percentile_index(freq_dict.get(len_ng, {}), total_freq)
+      self._percentile_indices[key] = index
+    return self._percentile_indices[key]
+
+  def _derive_freq_dict(self, kind, len_ng):
+    """Count leading or trailing n-grams of some length from the sequences.
+
+    n-grams are ordered by first occurrence, just as if they had been counted
+    when the sequences were added.
+
+    Args:
+      kind: KIND_LEADING or KIND_TRAILING.
+      len_ng: Length of n-grams.
+
+    Returns:
+      n-gram to frequency dictionary {n-gram:freq}.
+    """
+    result = {}
+    for (seq, freq) in self._seq_freq_dict.items():
+      if len(seq) >= len_ng:
+        ng = seq[:len_ng] if kind == KIND_LEADING else seq[len(seq) - len_ng:]
+        result[ng] = result.get(ng, 0) + freq
+    return result
+
+  def _discard_leading_trailing(self):
+    """Derive leading and trailing n-grams from the sequences from now on."""
+    self._derive_leading_trailing = True
+    self._freq_dict_leading.clear()
+    self._freq_dict_trailing.clear()
+    for (kind, len_ng) in list(self._percentile_indices.keys()):
+      if kind != KIND_NGRAMS:
+        del self._percentile_indices[(kind, len_ng)]
+
+  def _invalidate_percentile_indices(self, ngram_lengths=None):
+    """Discard cached percentile indices of some n-gram lengths.
+
+    Args:
+      ngram_lengths: n-gram lengths whose indices to discard, None meaning all.
+    """
+    self._version += 1
+    if ngram_lengths is None:
+      self._percentile_indices.clear()
+      return
+    for (kind, len_ng) in list(self._percentile_indices.keys()):
+      if len_ng in ngram_lengths:
+        del self._percentile_indices[(kind, len_ng)]
+
+  def _get_ngs(self, kind, len_ng, lower_bound, upper_bound):
+    """Generates all n-grams of some kind and length between some bounds.
+
+    n-grams are sorted by frequency and the percentile of an n-gram is given
+    by the cumulative frequency up to and including the n-gram. The first
+    n-gram at or above the lower bound is always included, even if it is
+    above the upper bound.
+
+    Args:
+      kind: Kind of n-grams, e.g. KIND_LEADING.
+      len_ng: Length of n-grams.
       lower_bound: Percentile specifying the lower bound.
       upper_bound: Percentile specifying the upper bound.
-      freq_dict: n-gram to frequency dictionary {n-gram:freq}.
-      total_freq: Total frequency for all n-grams of the length.
 
     Returns:
       n-grams between specified bounds.
@@ -130,19 +574,67 @@ class SequenceAnalyzer(object):
     if not 0 <= lower_bound <= upper_bound <= 100:
       raise ValueError("Bounds must be 0 <= lower <= upper <= 100")
     # return nothing if total frequency is zero
-    if total_freq == 0:
+    if self._scale == 0:
       return
-    # sort by frequency, iterate and track the cumulative frequency
-    cum_freq = 0.0
-    passed_lower = False
-    for (ng, freq) in sorted(freq_dict.items(), key=lambda x: x[1]):
-      cum_freq += freq
-      percentile = int(round(100 * cum_freq / total_freq))
-      # yield if after lower and before upper, or if just passed both
-      if lower_bound <= percentile and \
-          (percentile <= upper_bound or not passed_lower):
-        passed_lower = True
+    ngs = self._select_ngs(kind, len_ng, lower_bound, upper_bound)
+    if ngs is not None:
+      for ng in ngs:
         yield ng
+      return
+    index = self._get_percentile_index(kind, len_ng)
+    if index is None:
+      return
+    (start, stop) = index.get_range(lower_bound, upper_bound)
+    for i in range(start, stop):
+      yield index.ngrams[i]
+
+  def _select_ngs(self, kind, len_ng, lower_bound, upper_bound):
+    """Select the n-grams of some kind and length between some bounds.
+
+    Rather than sorting all n-grams to build a percentile index, only their
+    frequencies are sorted and accumulated to find the range of the bounds,
+    and only the n-grams within that range are sorted. The n-grams are the
+    same, in the same order, as those of the percentile index.
+
+    The index is built and cached instead if the bounds are wider than
+    _SELECT_MAX_FRACTION of the percentiles, or the range holds more than
+    that fraction of the n-grams, since the index then answers later
+    requests at a lower cost.
+
+    Args:
+      kind: Kind of n-grams, e.g. KIND_LEADING.
+      len_ng: Length of n-grams.
+      lower_bound: Percentile specifying the lower bound.
+      upper_bound: Percentile specifying the upper bound.
+
+    Returns:
+      List of n-grams between the bounds, or None if they are to be taken
+      from the percentile index.
+    """
+    # frozen and derived n-grams are only held by percentile indices
+    if (kind, len_ng) in self._percentile_indices or self._frozen or \
+        (kind != KIND_NGRAMS and self._derive_leading_trailing):
+      return None
+    if upper_bound - lower_bound > 100 * _SELECT_MAX_FRACTION:
+      return None
+    (freq_dict, total_freq_dict) = self._get_freq_dicts(kind)
+    total_freq = total_freq_dict.get(len_ng, 0)
+    if total_freq == 0:
+      return []
+    freq_dict = freq_dict.get(len_ng, {})
+    freqs = sorted(freq_dict.values())
+    (start, stop) = _get_percentile_range(
+        list(_accumulate(freqs)), total_freq, lower_bound, upper_bound)
+    if start == stop:
+      return []
+    if stop - start > _SELECT_MAX_FRACTION * len(freqs):
+      return None
+    # n-grams of the frequencies in the range, ties in order of first occurrence
+    (lower_freq, upper_freq) = (freqs[start], freqs[stop - 1])
+    offset = bisect.bisect_left(freqs, lower_freq)
+    ngs_freqs = sorted(((ng, freq) for (ng, freq) in freq_dict.items()
+        if lower_freq <= freq <= upper_freq), key=operator.itemgetter(1))
+    return [ng for (ng, _) in ngs_freqs[start - offset : stop - offset]]
 
   def get_ngrams(self, length, lower_bound, upper_bound):
     """Gives all n-grams of some length between some bounds.
@@ -158,18 +650,90 @@ class SequenceAnalyzer(object):
     Returns:
       n-grams of specified length and between specified bounds.
     """
-    return self._get_ngs(lower_bound, upper_bound,
-      self._freq_dict.get(length, {}), self._total_freq_dict.get(length, 0))
+    self._count_ngrams(length)
+    return self._get_ngs(KIND_NGRAMS, length, lower_bound, upper_bound)
+
+  def get_ngrams_multi(self, bounds, kind=KIND_NGRAMS):
+    """Gives the n-grams of some kind between some bounds, for many lengths.
+
+    The n-grams of all lengths not yet counted are counted in one pass over
+    the sequences. If NumPy is available, the n-grams of each length are
+    sorted and their percentiles computed with vectorized operations.
+
+    E.g.
+    bounds = {2: (50, 100), 3: (0, 100)}
+    returns {2: [...], 3: [...]} with the n-grams of get_ngrams(2, 50, 100)
+    and get_ngrams(3, 0, 100).
+
+    Args:
+      bounds: Dictionary {length:(lower_bound, upper_bound)} of percentile
+        bounds.
+      kind: Kind of n-grams, e.g. KIND_LEADING.
+
+    Returns:
+      Dictionary {length:[n-grams]} of the n-grams of each length between
+      its bounds.
+    """
+    # validate the kind before counting
+    self._get_freq_dicts(kind)
+    self._count_ngrams(*bounds.keys())
+    return dict((length, list(self._get_ngs(kind, length, lower_bound, upper_bound)))
+        for (length, (lower_bound, upper_bound)) in bounds.items())
+
+  def get_ngram_ranges(self, length, bounds_list, kind=KIND_NGRAMS):
+    """Gives the n-grams of some length sorted by frequency, and many ranges of them.
+
+    The n-grams between some bounds, as given by get_ngrams, are a range of
+    all the n-grams sorted by frequency. This gives the range of each of
+    many bounds, all of the same sorted n-grams.
+
+    E.g.
+    ngrams, ranges = sa.get_ngram_ranges(2, [(0, 50), (50, 100)])
+    gives ngrams[start:stop] == list(sa.get_ngrams(2, 0, 50)) where
+    (start, stop) = ranges[0].
+
+    Args:
+      length: Length of n-grams.
+      bounds_list: Tuples of (lower_bound, upper_bound).
+      kind: Kind of n-grams, e.g. KIND_LEADING.
+
+    Returns:
+      Tuple (ngrams, ranges) of the list of n-grams sorted by frequency, and
+      a tuple (start, stop) of n-gram indices for each of bounds_list.
+    """
+    self._get_freq_dicts(kind)
+    for (lower_bound, upper_bound) in bounds_list:
+      if not 0 <= lower_bound <= upper_bound <= 100:
+        raise ValueError("Bounds must be 0 <= lower <= upper <= 100")
+    self._count_ngrams(length)
+    # no n-grams if total frequency is zero
+    index = None if self._scale == 0 else self._get_percentile_index(kind, length)
+    if index is None:
+      return ([], [(0, 0) for _ in bounds_list])
+    return (list(index.ngrams),
+        [index.get_range(lower_bound, upper_bound) for (lower_bound, upper_bound) in bounds_list])
 
   def get_ngrams_leading(self, length, lower_bound, upper_bound):
     """Gives all leading n-grams of some length between some bounds."""
-    return self._get_ngs(lower_bound, upper_bound,
-      self._freq_dict_leading.get(length, {}), self._total_freq_dict_leading.get(length, 0))
+    self._count_ngrams(length)
+    return self._get_ngs(KIND_LEADING, length, lower_bound, upper_bound)
 
   def get_ngrams_trailing(self, length, lower_bound, upper_bound):
     """Gives all trailing n-grams of some length between some bounds."""
-    return self._get_ngs(lower_bound, upper_bound,
-      self._freq_dict_trailing.get(length, {}), self._total_freq_dict_trailing.get(length, 0))
+    self._count_ngrams(length)
+    return self._get_ngs(KIND_TRAILING, length, lower_bound, upper_bound)
+
+  def get_version(self):
+    """Get the version of the n-grams and their percentiles.
+
+    The version changes whenever the instance is mutated such that the
+    n-grams returned for some bounds may have changed, e.g. when sequences
+    are added. It can be used to tell if n-grams cached elsewhere are stale.
+
+    Returns:
+      The version, an integer.
+    """
+    return self._version
 
   def get_sequence_length_freq_dict(self):
     """Get the sequence length to frequency dictionary.
@@ -178,16 +742,136 @@ class SequenceAnalyzer(object):
       A dictionary from sequence length to the total frequency of all
       sequences of that length.
     """
-    return self._seq_len_dict
+    return dict((len_seq, freq * self._scale)
+        for (len_seq, freq) in self._seq_len_dict.items())
 
   def get_sequences(self):
     """Get the original sequences used when creating the SequenceAnalyzer.
 
     Returns:
-      The input sequences (excluding the frequencies).
+      The input sequences (excluding the frequencies), encoded if the
+      SequenceAnalyzer has a Vocabulary.
     """
     return self._seq_freq_dict.keys()
 
+  def get_vocabulary(self):
+    """Get the Vocabulary sequences and n-grams are encoded with.
+
+    Returns:
+      The Vocabulary, or None if sequences are not encoded.
+    """
+    return self._vocabulary
+
+  def reencode(self, vocabulary, table=None):
+    """Re-encode all sequences and n-grams, and set the Vocabulary.
+
+    Typically used for analyzers counted in other processes, each with its
+    own Vocabulary, before they are added.
+
+    Args:
+      vocabulary: Vocabulary the sequences are to be encoded with.
+      table: Translation table from the current encoding to the encoding of
+        vocabulary, see Vocabulary.get_translation. If None, the sequences
+        must already be encoded with vocabulary.
+    """
+    if self._frozen:
+      raise ValueError("Can not re-encode frozen instances.")
+    if table is not None and not self._addable:
+      raise ValueError("Can not re-encode approximate instances.")
+    self._vocabulary = vocabulary
+    if table is None:
+      return
+    self._unshare_tables()
+
+    # translate keys of dict of type {key:value}
+    def translate_dict(self_dict):
+      return dict((key.translate(table), value) for (key, value) in self_dict.items())
+
+    for kind in KINDS:
+      (freq_dict, _) = self._get_freq_dicts(kind)
+      for (len_ng, ng_freq_dict) in freq_dict.items():
+        freq_dict[len_ng] = translate_dict(ng_freq_dict)
+    self._seq_freq_dict = translate_dict(self._seq_freq_dict)
+    self._invalidate_percentile_indices()
+
+  def add_sequences(self, sequences_frequencies):
+    """Add sequences to the analyzed sequences.
+
+    The n-gram, length and total frequency tables are updated in place, and
+    cached percentiles are discarded only for the n-gram lengths of the
+    added sequences.
+
+    Args:
+      sequences_frequencies: Tuples of (sequence, frequency) where
+        frequency indicates the frequency of the sequence.
+
+    Raises:
+      ValueError: If the instance is frozen, or a frequency is not greater
+        than zero.
+    """
+    if self._frozen:
+      raise ValueError("Can not add sequences to frozen instances.")
+    seqs_freqs = list(sequences_frequencies)
+    if len(seqs_freqs) == 0:
+      return
+    self._unshare_tables()
+    if self._scale == 0:
+      self._apply_scale()
+    # frequencies are added in the scale of self
+    self._add_seqs((seq, freq / self._scale) for (seq, freq) in seqs_freqs)
+    self._invalidate_percentile_indices(
+        set(range(1, max(len(seq) for (seq, _) in seqs_freqs) + 1)))
+
+  def remove_sequences(self, sequences_frequencies):
+    """Remove sequences from the analyzed sequences.
+
+    Removes what add_sequences, or initialization, added. The n-gram, length
+    and total frequency tables are updated in place, and n-grams and
+    sequences whose frequency drops to zero are discarded. Cached
+    percentiles are discarded only for the n-gram lengths of the removed
+    sequences.
+
+    Args:
+      sequences_frequencies: Tuples of (sequence, frequency) where
+        frequency indicates the frequency of the sequence to remove.
+
+    Raises:
+      ValueError: If the instance is frozen, a frequency is not greater than
+        zero, or a sequence is removed more frequently than it was added.
+    """
+    if self._frozen:
+      raise ValueError("Can not remove sequences from frozen instances.")
+    if self._scale == 0:
+      raise ValueError("Can not remove sequences from instances scaled by zero.")
+
+    # validate all sequences before mutating any table
+    removed = {}
+    for (seq, freq) in sequences_frequencies:
+      if freq <= 0:
+        raise ValueError("Sequence frequency must be greater than zero.")
+      if self._vocabulary is not None:
+        seq = self._vocabulary.encode(seq)
+      removed[seq] = removed.get(seq, 0) + freq / self._scale
+    for (seq, freq) in removed.items():
+      if freq > self._seq_freq_dict.get(seq, 0) * (1 + _REMOVAL_TOLERANCE):
+        raise ValueError("Can not remove sequence %r more frequently than it "
+            "was added." % (seq,))
+    if len(removed) == 0:
+      return
+
+    self._unshare_tables()
+    for (seq, freq) in removed.items():
+      _subtract(self._seq_freq_dict, seq, freq)
+      _subtract(self._seq_len_dict, len(seq), freq)
+      if self._ngram_lengths is None:
+        lengths = range(1, len(seq) + 1)
+      else:
+        lengths = [len_ng for len_ng in self._ngram_lengths if len_ng <= len(seq)]
+      for len_ng in lengths:
+        self._remove_ngrams(seq, freq, len_ng)
+    self._invalidate_percentile_indices(
+        set(range(1, max(len(seq) for seq in removed) + 1)))
+
   def __imul__(self, other):
     """x.__imul__(y) <==> x*=y"""
     try:
@@ -198,22 +882,37 @@ class SequenceAnalyzer(object):
     if other < 0:
       raise ValueError("can not multiply with negative numbers")
 
-    # multiply other with value of dict of type {key1:{key2:value}}
-    def mul_dict_dict(self_dict, other):
+    # stored frequencies are multiplied with the scale factor when read
+    self._scale *= other
+    # n-grams are not returned at all if scaled by zero
+    self._version += 1
+    return self
+
+  def _apply_scale(self):
+    """Multiply all stored frequencies with the scale factor.
+
+    The scale factor is reset to one. Percentiles are not affected by scaling,
+    so this is only needed before adding to an instance scaled by zero.
+    """
+    self._unshare_tables()
+    scale = self._scale
+
+    # multiply scale with value of dict of type {key1:{key2:value}}
+    def mul_dict_dict(self_dict, scale):
       for self_dict1 in self_dict.values():
         for (key2, value) in self_dict1.items():
-          self_dict1[key2] = value * other
+          self_dict1[key2] = value * scale
 
-    # multiply other with value of dict of type {key:value}
-    def mul_dict(self_dict, other):
+    # multiply scale with value of dict of type {key:value}
+    def mul_dict(self_dict, scale):
       for (key, value) in self_dict.items():
-        self_dict[key] = value * other
+        self_dict[key] = value * scale
 
     for self_dict in \
         [self._freq_dict,
         self._freq_dict_leading,
         self._freq_dict_trailing]:
-      mul_dict_dict(self_dict, other)
+      mul_dict_dict(self_dict, scale)
 
     for self_dict in \
         [self._total_freq_dict,
@@ -221,9 +920,10 @@ class SequenceAnalyzer(object):
         self._total_freq_dict_trailing,
         self._seq_len_dict,
         self._seq_freq_dict]:
-      mul_dict(self_dict, other)
+      mul_dict(self_dict, scale)
 
-    return self
+    self._scale = 1.0
+    self._invalidate_percentile_indices()
 
   def __mul__(self, other):
     """x.__mul__(n) <==> x*n
@@ -240,7 +940,7 @@ class SequenceAnalyzer(object):
       TypeError: Multiplying with something that can not be casted to a float.
       ValueError: Multiplying with numbers lesser than zero.
     """
-    result = copy.deepcopy(self)
+    result = self._share_tables()
     result *= other
     return result
 
@@ -252,24 +952,69 @@ class SequenceAnalyzer(object):
     """x.__iadd__(y) <==> x+=y"""
     if not isinstance(other, type(self)):
       raise TypeError("unsupported operand type(s) for +: '%s' and '%s'" % (self, other))
+    if other._vocabulary is not self._vocabulary:
+      raise ValueError("Can only add instances with the same vocabulary.")
+    if self._frozen or other._frozen:
+      raise ValueError("Can not add frozen instances.")
+    if not (self._addable and other._addable):
+      raise ValueError("Can not add approximate instances.")
+
+    self._unshare_tables()
+
+    # leading and trailing n-grams of other are not stored
+    if other._derive_leading_trailing and not self._derive_leading_trailing:
+      self._discard_leading_trailing()
+
+    # only n-gram lengths counted by both instances are kept
+    self._restrict_ngram_lengths(
+        _intersect_ngram_lengths(self._ngram_lengths, other._ngram_lengths))
+
+    # frequencies of other are added in the scale of self
+    if self._scale == 0:
+      self._apply_scale()
+    self._add_frequencies(other, other._scale / self._scale)
+    return self
+
+  def _add_frequencies(self, other, factor):
+    """Add the stored frequencies of another instance multiplied by a factor.
+
+    n-grams of lengths not counted by self are skipped. The tables of self
+    must not be shared.
+
+    Args:
+      other: Instance whose frequencies to add.
+      factor: Factor to multiply the stored frequencies of other with.
+    """
+    ngram_lengths = self._ngram_lengths
 
     # add values in dicts of type {key:value}
     def add_dict(self_dict, other_dict):
       for (other_key, other_value) in other_dict.items():
-        self_dict[other_key] = self_dict.get(other_key, 0) + other_value
+        self_dict[other_key] = self_dict.get(other_key, 0) + other_value * factor
+
+    # add values in dicts of type {key:value}, skipping uncounted n-gram lengths
+    def add_ngram_dict(self_dict, other_dict):
+      for (other_key, other_value) in other_dict.items():
+        if ngram_lengths is None or other_key in ngram_lengths:
+          self_dict[other_key] = self_dict.get(other_key, 0) + other_value * factor
 
     # add values in dicts of type {key1:{key2:value}}
     def add_dict_dict(self_dict, other_dict):
       for (other_key1, other_dict1) in other_dict.items():
+        if ngram_lengths is not None and other_key1 not in ngram_lengths:
+          continue
         self_dict1 = self_dict.setdefault(other_key1, {})
         for (other_key2, other_value) in other_dict1.items():
-          self_dict1[other_key2] = self_dict1.get(other_key2, 0) + other_value
+          self_dict1[other_key2] = self_dict1.get(other_key2, 0) + other_value * factor
 
     for (self_dict, other_dict) in \
         [(self._total_freq_dict, other._total_freq_dict),
         (self._total_freq_dict_leading, other._total_freq_dict_leading),
-        (self._total_freq_dict_trailing, other._total_freq_dict_trailing),
-        (self._seq_len_dict, other._seq_len_dict),
+        (self._total_freq_dict_trailing, other._total_freq_dict_trailing)]:
+      add_ngram_dict(self_dict, other_dict)
+
+    for (self_dict, other_dict) in \
+        [(self._seq_len_dict, other._seq_len_dict),
         (self._seq_freq_dict, other._seq_freq_dict)]:
       add_dict(self_dict, other_dict)
 
@@ -277,9 +1022,13 @@ class SequenceAnalyzer(object):
         [(self._freq_dict, other._freq_dict),
         (self._freq_dict_leading, other._freq_dict_leading),
         (self._freq_dict_trailing, other._freq_dict_trailing)]:
+      # leading and trailing n-grams of self are derived if not stored
+      if self._derive_leading_trailing and self_dict is not self._freq_dict:
+        continue
       add_dict_dict(self_dict, other_dict)
 
-    return self
+    # only n-gram lengths present in other have changed
+    self._invalidate_percentile_indices(set(other._total_freq_dict.keys()))
 
   def __add__(self, other):
     """x.__add__(y) <==> x+y
@@ -294,10 +1043,12 @@ class SequenceAnalyzer(object):
 
     Raises:
       TypeError: Adding with anything other than an instance of the same type.
+      ValueError: Adding instances with different vocabularies, or frozen
+        instances.
     """
-    result = copy.deepcopy(self)
-    result += other
-    return result
+    if not isinstance(other, type(self)):
+      raise TypeError("unsupported operand type(s) for +: '%s' and '%s'" % (self, other))
+    return _merge([self, other], [self._scale, other._scale])
 
   @property
   def total_freq(self):
@@ -306,19 +1057,376 @@ class SequenceAnalyzer(object):
     Setting total_freq to n is the equivalent of the operation
     self *= n / self.total_freq
     """
-    return sum(self._seq_len_dict.values())
+    return sum(self._seq_len_dict.values()) * self._scale
 
   @total_freq.setter
   def total_freq(self, value):
     if self.total_freq != 0:
       self *= float(value) / self.total_freq
 
+class ApproximateSequenceAnalyzer(SequenceAnalyzer):
+  """SequenceAnalyzer counting n-grams approximately in bounded memory.
+
+  For every counted n-gram length and kind of n-gram, only the capacity most
+  frequent n-grams are kept, in a sketch.HeavyHitters table. Once a table is
+  full the frequencies of all further n-grams are added to a count-min
+  sketch, and an n-gram is tracked when its estimated frequency exceeds that
+  of the least frequent tracked n-gram. Memory per table is therefore
+  bounded by capacity n-grams plus (e / epsilon) * ln(1 / delta) counters.
+
+  Total frequencies, sequences, and sequence lengths are exact. Tracked
+  frequencies are never below the true frequencies, and with probability
+  1 - delta at most epsilon times the total frequency above them.
+
+  Untracked n-grams are the least frequent ones, so percentiles are computed
+  as if they were all below the tracked n-grams. Windows in the upper
+  percentiles, e.g. 50 to 100, are therefore approximated well, while
+  windows entirely among the untracked n-grams give only the least frequent
+  tracked n-gram.
+
+  Approximate instances can be multiplied and frozen, but not added to or
+  added with other instances.
+  """
+
+  _addable = False
+
+  def __init__(self, sequences_frequencies, ngram_lengths=None, vocabulary=None,
+      capacity=10000, epsilon=0.001, delta=0.01):
+    """Sequences are added for analysis at initialization.
+
+    Args:
+      sequences_frequencies: Tuples of (sequence, frequency) where
+        frequency indicates the frequency of the sequence.
+      ngram_lengths: Lengths of n-grams to count at initialization. If None,
+        n-grams of all lengths are counted.
+      vocabulary: Vocabulary to encode the sequences with. If None, sequences
+        are not encoded.
+      capacity: Maximum number of n-grams kept per n-gram length and kind.
+      epsilon: Relative error of the count-min sketches.
+      delta: Probability of exceeding the relative error.
+    """
+    self._capacity = capacity
+    self._epsilon = epsilon
+    self._delta = delta
+    SequenceAnalyzer.__init__(self, sequences_frequencies, ngram_lengths, vocabulary)
+
+  def _get_table(self, kind, len_ng):
+    """Get the, possibly new, HeavyHitters of some kind and length of n-grams."""
+    (freq_dict, _) = self._get_freq_dicts(kind)
+    if len_ng not in freq_dict:
+      freq_dict[len_ng] = sketch.HeavyHitters(self._capacity, self._epsilon, self._delta)
+    return freq_dict[len_ng]
+
+  def _add_ngrams(self, seq, freq, len_ng):
+    """Add all n-grams, leading and trailing n-grams of some length of a sequence.
+
+    Args:
+      seq: Sequence to add n-grams of.
+      freq: Frequency of the sequence.
+      len_ng: Length of n-grams to add. Must not be greater than len(seq).
+    """
+    self._get_table(KIND_LEADING, len_ng).add(seq[:len_ng], freq)
+    self._total_freq_dict_leading[len_ng] = \
+        self._total_freq_dict_leading.get(len_ng, 0) + freq
+    self._get_table(KIND_TRAILING, len_ng).add(seq[-len_ng:], freq)
+    self._total_freq_dict_trailing[len_ng] = \
+        self._total_freq_dict_trailing.get(len_ng, 0) + freq
+    table = self._get_table(KIND_NGRAMS, len_ng)
+    num_ngs = len(seq) - len_ng + 1
+    for i in range(num_ngs):
+      table.add(seq[i : i + len_ng], freq)
+    self._total_freq_dict[len_ng] = \
+        self._total_freq_dict.get(len_ng, 0) + freq * num_ngs
+
+  def remove_sequences(self, sequences_frequencies):
+    """Not supported, since discarded n-grams can not be restored."""
+    raise ValueError("Can not remove sequences from approximate instances.")
+
+  def _select_ngs(self, kind, len_ng, lower_bound, upper_bound):
+    """Always use the percentile index, the tables holding at most capacity n-grams."""
+    return None
+
+  def _get_percentile_index(self, kind, len_ng):
+    """Get the, possibly cached, percentile index of the tracked n-grams.
+
+    The frequency of untracked n-grams is placed below all tracked n-grams.
+
+    Args:
+      kind: Kind of n-grams, e.g. KIND_LEADING.
+      len_ng: Length of n-grams.
+
+    Returns:
+      The _PercentileIndex of the n-grams, or None if the total frequency of
+      the n-grams is zero.
+    """
+    key = (kind, len_ng)
+    if key not in self._percentile_indices:
+      (freq_dict, total_freq_dict) = self._get_freq_dicts(kind)
+      total_freq = total_freq_dict.get(len_ng, 0)
+      if total_freq == 0:
+        return None
+      table = freq_dict.get(len_ng, {})
+      untracked_freq = 0
+      if isinstance(table, sketch.HeavyHitters) and not table.is_exact():
+        untracked_freq = max(0, total_freq - sum(table.values()))
+      self._percentile_indices[key] = _build_percentile_index(
+          table, total_freq, untracked_freq)
+    return self._percentile_indices[key]
+
+class _PercentileIndex(object):
+  """n-grams sorted by frequency, with cumulative frequencies and percentiles.
+
+  The percentile of an n-gram is the cumulative frequency of all n-grams up to
+  and including it, as a rounded percentage of the total frequency. Since
+  percentiles are non-decreasing, the n-grams within some bounds form a
+  contiguous range that is found with two binary searches.
+  """
+
+  def __init__(self, ngrams, cum_freqs, percentiles):
+    """Creates an index from n-grams already sorted by frequency.
+
+    Args:
+      ngrams: n-grams sorted by frequency.
+      cum_freqs: Cumulative frequency up to and including each n-gram.
+      percentiles: Percentile of each n-gram.
+    """
+    self.ngrams = ngrams
+    self.cum_freqs = cum_freqs
+    self.percentiles = percentiles
+
+  def get_range(self, lower_bound, upper_bound):
+    """Get the range of indices of n-grams between some bounds.
+
+    The range starts at the first n-gram at or above the lower bound, and
+    ends after the last n-gram at or below the upper bound. The first n-gram
+    is always in the range.
+
+    Args:
+      lower_bound: Percentile specifying the lower bound.
+      upper_bound: Percentile specifying the upper bound.
+
+    Returns:
+      Tuple (start, stop) of n-gram indices.
+    """
+    start = bisect.bisect_left(self.percentiles, lower_bound)
+    if start == len(self.percentiles):
+      return (start, start)
+    stop = bisect.bisect_right(self.percentiles, upper_bound)
+    return (start, max(start + 1, stop))
+
+  def pack(self, len_ng):
+    """Get a copy of the index with the n-grams stored back to back.
+
+    Args:
+      len_ng: Length of the n-grams.
+
+    Returns:
+      A new _PercentileIndex.
+    """
+    return _PercentileIndex(_PackedNGrams(_concat_seqs(self.ngrams), len_ng),
+        self.cum_freqs, self.percentiles)
+
+class _PackedNGrams(object):
+  """Read only list of n-grams of the same length, stored back to back.
+
+  E.g.
+  ["asd", "sdf", "qwe"] is stored as "asdsdfqwe", and element 1 is "sdf".
+  """
+
+  def __init__(self, elements, len_ng):
+    """Creates the list from the concatenated n-grams.
+
+    Args:
+      elements: Concatenation of n-grams, all of length len_ng.
+      len_ng: Length of the n-grams.
+    """
+    self._len_ng = len_ng
+    self._len = len(elements) // len_ng
+    self._elements = elements
+
+  def __len__(self):
+    return self._len
+
+  def __getitem__(self, i):
+    if not 0 <= i < self._len:
+      raise IndexError("n-gram index out of range")
+    start = i * self._len_ng
+    return self._elements[start : start + self._len_ng]
+
+class _PackedSequenceFreqs(object):
+  """Read only {seq:freq} dictionary with sequences stored back to back.
+
+  Only the parts of the dictionary interface used for iterating through the
+  sequences and their frequencies are provided.
+  """
+
+  def __init__(self, elements, offsets, freqs):
+    """Creates the dictionary from the concatenated sequences.
+
+    Args:
+      elements: Concatenation of all sequences.
+      offsets: Offset of each sequence in elements, followed by len(elements).
+      freqs: Frequency of each sequence.
+    """
+    self._elements = elements
+    self._offsets = offsets
+    self._freqs = freqs
+
+  def __len__(self):
+    return len(self._freqs)
+
+  def _get_seq(self, i):
+    return self._elements[self._offsets[i] : self._offsets[i + 1]]
+
+  def keys(self):
+    """Generates all sequences."""
+    for i in range(len(self._freqs)):
+      yield self._get_seq(i)
+
+  def values(self):
+    """Generates the frequencies of all sequences."""
+    return iter(self._freqs)
+
+  def items(self):
+    """Generates tuples of (sequence, frequency)."""
+    for i in range(len(self._freqs)):
+      yield (self._get_seq(i), self._freqs[i])
+
+def _build_percentile_index(freq_dict, total_freq, untracked_freq=0.0):
+  """Sorts n-grams by frequency and computes cumulative frequencies.
+
+  Args:
+    freq_dict: n-gram to frequency dictionary {n-gram:freq}.
+    total_freq: Total frequency for all n-grams. Must not be zero.
+    untracked_freq: Total frequency of n-grams not in freq_dict, all assumed
+      to be less frequent than the n-grams in freq_dict.
+
+  Returns:
+    _PercentileIndex of the n-grams.
+  """
+  if numpy is not None:
+    return _build_percentile_index_numpy(freq_dict, total_freq, untracked_freq)
+  return _build_sorted_percentile_index(
+      sorted(freq_dict.items(), key=lambda x: x[1]), total_freq, untracked_freq)
+
+def _build_percentile_index_numpy(freq_dict, total_freq, untracked_freq=0.0):
+  """Like _build_percentile_index, sorting and accumulating with NumPy.
+
+  The sort is stable and the frequencies are accumulated one at a time,
+  just as by _build_sorted_percentile_index, so the index is the same.
+  """
+  ngs_freqs = list(freq_dict.items())
+  freqs = numpy.fromiter((freq for (_, freq) in ngs_freqs),
+      dtype=numpy.float64, count=len(ngs_freqs))
+  order = numpy.argsort(freqs, kind="stable")
+  cum_freqs = numpy.cumsum(numpy.concatenate(([untracked_freq], freqs[order])))[1:]
+  # rounding as round does in _get_percentile, i.e. half to even on python 3
+  # and half away from zero on python 2
+  percentiles = 100 * cum_freqs / total_freq
+  if sys.version_info < (3,):
+    percentiles = numpy.floor(percentiles + 0.5)
+  else:
+    percentiles = numpy.rint(percentiles)
+  percentiles = numpy.minimum(100, percentiles)
+  return _PercentileIndex([ngs_freqs[i][0] for i in order.tolist()],
+      array.array('d', cum_freqs.tolist()),
+      array.array('b', percentiles.astype(numpy.int8).tolist()))
+
+def _build_sorted_percentile_index(ngs_freqs, total_freq, untracked_freq=0.0,
+    len_ng=None):
+  """Computes cumulative frequencies of n-grams already sorted by frequency.
+
+  Args:
+    ngs_freqs: Tuples of (n-gram, freq) sorted by frequency.
+    total_freq: Total frequency for all n-grams. Must not be zero.
+    untracked_freq: Total frequency of n-grams not in ngs_freqs, all assumed
+      to be less frequent than the n-grams in ngs_freqs.
+    len_ng: Length of the n-grams. If given, the n-grams are packed as they
+      are generated, without a list of all n-grams, like by
+      _PercentileIndex.pack.
+
+  Returns:
+    _PercentileIndex of the n-grams.
+  """
+  cum_freqs = array.array('d')
+  percentiles = array.array('b')
+
+  def get_ngrams():
+    cum_freq = float(untracked_freq)
+    for (ng, freq) in ngs_freqs:
+      cum_freq += freq
+      cum_freqs.append(cum_freq)
+      percentiles.append(_get_percentile(cum_freq, total_freq))
+      yield ng
+
+  if len_ng is None:
+    ngrams = list(get_ngrams())
+  else:
+    ngrams = _PackedNGrams(_concat_seq_stream(get_ngrams()), len_ng)
+  return _PercentileIndex(ngrams, cum_freqs, percentiles)
+
+def _get_percentile(cum_freq, total_freq):
+  """Get the percentile of some cumulative frequency, rounded and at most 100."""
+  return min(100, int(round(100 * cum_freq / total_freq)))
+
+def _get_percentile_range(cum_freqs, total_freq, lower_bound, upper_bound):
+  """Get the range of indices of cumulative frequencies between some bounds.
+
+  This is _PercentileIndex.get_range, with the percentiles computed only for
+  the cumulative frequencies visited by the binary searches.
+
+  Args:
+    cum_freqs: Non-decreasing cumulative frequencies.
+    total_freq: Total frequency. Must not be zero.
+    lower_bound: Percentile specifying the lower bound.
+    upper_bound: Percentile specifying the upper bound.
+
+  Returns:
+    Tuple (start, stop) of indices.
+  """
+  def bisect_percentiles(bound, right):
+    (lo, hi) = (0, len(cum_freqs))
+    while lo < hi:
+      mid = (lo + hi) // 2
+      percentile = _get_percentile(cum_freqs[mid], total_freq)
+      if percentile < bound or (right and percentile == bound):
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  start = bisect_percentiles(lower_bound, False)
+  if start == len(cum_freqs):
+    return (start, start)
+  stop = bisect_percentiles(upper_bound, True)
+  return (start, max(start + 1, stop))
+
+def _pack_seq_freq_dict(seqs_freqs):
+  """Concatenates sequences and stores their offsets and frequencies.
+
+  Args:
+    seqs_freqs: Tuples of (sequence, frequency) of distinct sequences.
+
+  Returns:
+    _PackedSequenceFreqs of the sequences.
+  """
+  offsets = array.array('L', [0])
+  freqs = array.array('d')
+
+  def get_seqs():
+    for (seq, freq) in seqs_freqs:
+      offsets.append(offsets[-1] + len(seq))
+      freqs.append(freq)
+      yield seq
+
+  return _PackedSequenceFreqs(_concat_seq_stream(get_seqs()), offsets, freqs)
+
 def merge_normalized_sequence_analyzers(sequence_analyzers):
   """Merges SequenceAnalyzers and returns the result
 
-  SequenceAnalyzers copied and normalized setting their individual total
-  frequency to one. The sum of all normalized SequenceAnalyzers is then
-  returned.
+  SequenceAnalyzers are normalized setting their individual total frequency
+  to one. The sum of all normalized SequenceAnalyzers is then returned. The
+  input SequenceAnalyzers are not mutated.
 
   Args:
     sequence_analyzers: List of SequenceAnalyzers to merge.
@@ -326,15 +1434,505 @@ def merge_normalized_sequence_analyzers(sequence_analyzers):
   Returns:
     The resulting normalized merge of the SequenceAnalyzers.
   """
+  if len(sequence_analyzers) == 0:
+    raise ValueError("Must provide some sequence analyzers.")
+
+  # weight stored frequencies such that each total frequency becomes one
+  weights = []
+  for sa in sequence_analyzers:
+    total_freq = sa.total_freq
+    weights.append(sa._scale / total_freq if total_freq != 0 else sa._scale)
+
+  return _merge(sequence_analyzers, weights)
 
-  # copy input to avoid mutation
-  sas_copy = [copy.deepcopy(sa) for sa in sequence_analyzers]
+def _merge(sequence_analyzers, weights):
+  """Sums SequenceAnalyzers with their stored frequencies weighted.
 
-  # normalize sequences analyzers
-  for sa in sas_copy:
-    sa.total_freq = 1
+  The result is built in a single pass over the frequency tables of the
+  inputs, without copying them first. Only n-gram lengths counted by all
+  inputs are counted by the result. All inputs must share the same
+  Vocabulary, and must not be frozen.
+
+  Args:
+    sequence_analyzers: SequenceAnalyzers to sum.
+    weights: Factor to multiply the stored frequencies of each
+      SequenceAnalyzer with.
+
+  Returns:
+    A new SequenceAnalyzer with the weighted sum of the frequencies.
+  """
+  vocabulary = sequence_analyzers[0]._vocabulary
+  ngram_lengths = None
+  for sa in sequence_analyzers:
+    if sa._vocabulary is not vocabulary:
+      raise ValueError("Can only merge instances with the same vocabulary.")
+    if sa._frozen:
+      raise ValueError("Can not merge frozen instances.")
+    if not sa._addable:
+      raise ValueError("Can not merge approximate instances.")
+    ngram_lengths = _intersect_ngram_lengths(ngram_lengths, sa._ngram_lengths)
+
+  result = SequenceAnalyzer.__new__(type(sequence_analyzers[0]))
+  result._init_tables(ngram_lengths, vocabulary)
+  result._use_suffix_array = sequence_analyzers[0]._use_suffix_array
+  result._derive_leading_trailing = \
+      any(sa._derive_leading_trailing for sa in sequence_analyzers)
+  for (sa, weight) in zip(sequence_analyzers, weights):
+    result._add_frequencies(sa, weight)
+  return result
+
+def save_sequence_analyzer(sequence_analyzer, filename):
+  """Save a SequenceAnalyzer to a binary snapshot file.
+
+  The snapshot holds the percentile indices of all counted n-gram lengths,
+  and the sequences with their frequencies, stored as little-endian arrays
+  after a versioned header. It is loaded with load_sequence_analyzer.
+
+  Only sequences that are strings, or bytes, can be saved. Sequences of
+  other elements, e.g. tuples of words, must be encoded with a Vocabulary,
+  the elements of which must be strings.
 
-  # add all sequences analyzers to the first
-  for sa in sas_copy[1:]:
-    sas_copy[0] += sa
-  return sas_copy[0]
+  Args:
+    sequence_analyzer: SequenceAnalyzer to save.
+    filename: Name of the file to write.
+
+  Raises:
+    ValueError: If the sequences are neither strings nor bytes, or if they
+      have more than 2 ** 32 - 1 elements in total.
+  """
+  sa = sequence_analyzer
+  seqs_freqs = list(sa._seq_freq_dict.items())
+  writer = _SnapshotWriter(_get_element_type([seq for (seq, _) in seqs_freqs]))
+
+  indices = []
+  for len_ng in sorted(sa._total_freq_dict.keys()):
+    for kind in KINDS:
+      index = sa._get_percentile_index(kind, len_ng)
+      if index is not None:
+        indices.append([kind, len_ng,
+            writer.add_elements(_concat_seqs(list(index.ngrams))),
+            writer.add_array('d', index.cum_freqs),
+            writer.add_array('b', index.percentiles)])
+
+  offsets = [0]
+  for (seq, _) in seqs_freqs:
+    offsets.append(offsets[-1] + len(seq))
+  if offsets[-1] > _SNAPSHOT_MAX_OFFSET:
+    raise ValueError("Can not save sequences with more than %d elements in total." %
+        _SNAPSHOT_MAX_OFFSET)
+  sequences = [
+      writer.add_elements(_concat_seqs([seq for (seq, _) in seqs_freqs])),
+      writer.add_array(_SNAPSHOT_OFFSET_TYPECODE, offsets),
+      writer.add_array('d', [freq for (_, freq) in seqs_freqs])]
+
+  header = {
+    "element_type": writer.element_type,
+    "scale": sa._scale,
+    "ngram_lengths": None if sa._ngram_lengths is None else sorted(sa._ngram_lengths),
+    "vocabulary": None if sa._vocabulary is None else sa._vocabulary.get_elements(),
+    "sequence_lengths": list(sa._seq_len_dict.items()),
+    "total_freqs": [[kind, list(sa._get_freq_dicts(kind)[1].items())] for kind in KINDS],
+    "indices": indices,
+    "sequences": sequences}
+
+  with open(filename, "wb") as file_obj:
+    writer.write(file_obj, header)
+
+def load_sequence_analyzer(filename):
+  """Load a SequenceAnalyzer from a binary snapshot file.
+
+  The file is memory mapped, and n-grams and sequences are decoded from the
+  mapped pages only when requested. Processes loading the same file
+  therefore share its pages rather than each holding a copy. Where the
+  arrays can not be mapped as is, e.g. on big-endian platforms, the file is
+  read into memory instead.
+
+  The loaded instance is frozen. n-grams of lengths that were not counted
+  when saved are counted the first time they are requested.
+
+  Args:
+    filename: Name of a file written by save_sequence_analyzer.
+
+  Returns:
+    The loaded SequenceAnalyzer.
+
+  Raises:
+    ValueError: If the file is not a snapshot of a supported version.
+  """
+  with open(filename, "rb") as file_obj:
+    buf = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+  if len(buf) < _SNAPSHOT_PREAMBLE.size:
+    raise ValueError("'%s' is not a sequence analyzer snapshot." % filename)
+  (magic, version, header_size) = _SNAPSHOT_PREAMBLE.unpack_from(buf, 0)
+  if magic != _SNAPSHOT_MAGIC:
+    raise ValueError("'%s' is not a sequence analyzer snapshot." % filename)
+  if version != _SNAPSHOT_VERSION:
+    raise ValueError("Unsupported snapshot version %d." % version)
+  data_start = _SNAPSHOT_PREAMBLE.size + header_size
+  header = json.loads(buf[_SNAPSHOT_PREAMBLE.size : data_start].decode("utf-8"))
+  reader = _SnapshotReader(buf, data_start, header["element_type"])
+
+  vocabulary = None
+  if header["vocabulary"] is not None:
+    vocabulary = vocabulary_module.Vocabulary(header["vocabulary"])
+
+  sa = SequenceAnalyzer.__new__(SequenceAnalyzer)
+  sa._init_tables(header["ngram_lengths"], vocabulary)
+  sa._scale = header["scale"]
+  sa._seq_len_dict.update(header["sequence_lengths"])
+  for (kind, total_freqs) in header["total_freqs"]:
+    sa._get_freq_dicts(kind)[1].update(total_freqs)
+  for (kind, len_ng, ngrams, cum_freqs, percentiles) in header["indices"]:
+    sa._percentile_indices[(kind, len_ng)] = _PercentileIndex(
+        _PackedNGrams(reader.get_elements(ngrams), len_ng),
+        reader.get_array('d', cum_freqs),
+        reader.get_array('b', percentiles))
+  (elements, offsets, freqs) = header["sequences"]
+  sa._seq_freq_dict = _PackedSequenceFreqs(
+      reader.get_elements(elements),
+      reader.get_array(_SNAPSHOT_OFFSET_TYPECODE, offsets),
+      reader.get_array('d', freqs))
+  sa._frozen = True
+  return sa
+
+def count_sequence_analyzer(sequences_frequencies, ngram_lengths=None, vocabulary=None,
+    buffer_size=2**20, num_shards=16, temp_dir=None):
+  """Count a frozen SequenceAnalyzer without holding all n-grams in memory.
+
+  n-grams, and sequences, are counted in buffers, sharded by their hashes.
+  Whenever buffer_size distinct n-grams are buffered, every buffer is sorted
+  and spilled to a temporary file as a run. The runs of each shard are then
+  merged, adding up the frequencies of each n-gram, and the n-grams of each
+  length and kind are sorted by frequency, again spilling runs, straight
+  into the packed percentile indices of a frozen SequenceAnalyzer.
+
+  Only the result, and at most buffer_size n-grams, are held in memory. The
+  result can be saved with save_sequence_analyzer.
+
+  The result is identical to
+  SequenceAnalyzer(sequences_frequencies, ngram_lengths, vocabulary).freeze()
+  including the order of n-grams of equal frequencies, except for floating
+  point rounding of frequencies of n-grams counted in several runs.
+
+  Args:
+    sequences_frequencies: Tuples of (sequence, frequency), e.g. a generator
+      reading a file.
+    ngram_lengths: Lengths of n-grams to count. If None, n-grams of all
+      lengths are counted.
+    vocabulary: Vocabulary to encode the sequences with. If None, sequences
+      are not encoded.
+    buffer_size: Maximum number of distinct n-grams buffered before
+      spilling.
+    num_shards: Number of shards n-grams are hashed into.
+    temp_dir: Directory for the temporary run files. If None, the default
+      temporary directory is used.
+
+  Returns:
+    The frozen SequenceAnalyzer.
+  """
+  sa = SequenceAnalyzer.__new__(SequenceAnalyzer)
+  sa._init_tables(ngram_lengths, vocabulary)
+  runs = external.SortedRuns(temp_dir)
+  try:
+    counter = _ShardedCounter(runs, buffer_size, num_shards)
+    # position of every n-gram occurrence, ordering n-grams by first occurrence
+    pos = 0
+    for (seq, freq) in sequences_frequencies:
+      if freq <= 0:
+        raise ValueError("Sequence frequency must be greater than zero.")
+      if vocabulary is not None:
+        seq = vocabulary.encode(seq)
+      counter.add(_SEQUENCES, seq, freq, pos)
+      pos += 1
+      sa._seq_len_dict[len(seq)] = sa._seq_len_dict.get(len(seq), 0) + freq
+      if sa._ngram_lengths is None:
+        lengths = range(1, len(seq) + 1)
+      else:
+        lengths = [len_ng for len_ng in sa._ngram_lengths if len_ng <= len(seq)]
+      for len_ng in lengths:
+        for (kind, start, stop) in [
+            (KIND_LEADING, 0, 1),
+            (KIND_TRAILING, len(seq) - len_ng, len(seq) - len_ng + 1),
+            (KIND_NGRAMS, 0, len(seq) - len_ng + 1)]:
+          total_freq_dict = sa._get_freq_dicts(kind)[1]
+          for i in range(start, stop):
+            counter.add((kind, len_ng), seq[i : i + len_ng], freq, pos)
+            pos += 1
+            total_freq_dict[len_ng] = total_freq_dict.get(len_ng, 0) + freq
+    if len(sa._seq_len_dict) == 0:
+      raise ValueError("Must provide some sequences.")
+
+    # sequences in order of first occurrence, n-grams by frequency
+    sa._seq_freq_dict = _pack_seq_freq_dict((seq, freq)
+        for (_, freq, seq) in counter.sort(_SEQUENCES, lambda first, freq: (first,)))
+    for len_ng in sorted(sa._total_freq_dict.keys()):
+      for kind in KINDS:
+        ngs_freqs = ((ng, freq) for (_, _, freq, ng) in
+            counter.sort((kind, len_ng), lambda first, freq: (freq, first)))
+        total_freq = sa._get_freq_dicts(kind)[1].get(len_ng, 0)
+        sa._percentile_indices[(kind, len_ng)] = \
+            _build_sorted_percentile_index(ngs_freqs, total_freq, len_ng=len_ng)
+  finally:
+    runs.close()
+  sa._frozen = True
+  return sa
+
+# table key of the sequences, as opposed to the (kind, len_ng) keys of n-grams
+_SEQUENCES = ("sequences", 0)
+
+class _ShardedCounter(object):
+  """Counts frequencies of keys of several tables, spilling to sorted runs.
+
+  Keys are buffered by table and shard, the shard given by the hash of the
+  key. Runs of the buffers are keyed by (table, shard), and runs of tables
+  sorted by frequency are keyed by (table,).
+  """
+
+  def __init__(self, runs, buffer_size, num_shards):
+    """Creates a counter spilling to some runs.
+
+    Args:
+      runs: external.SortedRuns to spill to.
+      buffer_size: Maximum number of distinct keys buffered.
+      num_shards: Number of shards keys are hashed into.
+    """
+    self._runs = runs
+    self._buffer_size = buffer_size
+    self._num_shards = num_shards
+    # {(table, shard):{key:[freq, first]}}
+    self._buffers = {}
+    self._num_buffered = 0
+
+  def add(self, table, key, freq, pos):
+    """Add some frequency of a key occurring at some position."""
+    buf_key = (table, hash(key) % self._num_shards)
+    buf = self._buffers.get(buf_key)
+    if buf is None:
+      buf = self._buffers[buf_key] = {}
+    entry = buf.get(key)
+    if entry is not None:
+      entry[0] += freq
+      return
+    buf[key] = [freq, pos]
+    self._num_buffered += 1
+    if self._num_buffered >= self._buffer_size:
+      self._spill()
+
+  def _spill(self):
+    """Write all buffers as runs of (key, first, freq), sorted by key."""
+    self._runs.add_runs(dict((buf_key, _get_records(buf))
+        for (buf_key, buf) in self._buffers.items()))
+    self._buffers = {}
+    self._num_buffered = 0
+
+  def _merge_shard(self, table, shard):
+    """Generates (key, first, freq) of every key of a table shard.
+
+    Frequencies of a key are added in order of occurrence.
+    """
+    buf = self._buffers.pop((table, shard), {})
+    self._num_buffered -= len(buf)
+    current = None
+    for (key, first, freq) in self._runs.merge((table, shard), _get_records(buf)):
+      if current is not None and current[0] == key:
+        current[2] += freq
+        continue
+      if current is not None:
+        yield tuple(current)
+      current = [key, first, freq]
+    if current is not None:
+      yield tuple(current)
+
+  def sort(self, table, get_sort_key):
+    """Generates the keys of a table with their summed frequencies, sorted.
+
+    Args:
+      table: Table of the keys.
+      get_sort_key: Function of (first, freq) giving the sort key of a key,
+        where first is the position of its first occurrence.
+
+    Returns:
+      Tuples of (sort key..., freq, key) in sort order.
+    """
+    records = []
+    for shard in range(self._num_shards):
+      for (key, first, freq) in self._merge_shard(table, shard):
+        records.append(get_sort_key(first, freq) + (freq, key))
+        if self._num_buffered + len(records) >= self._buffer_size:
+          records.sort()
+          self._runs.add_runs({(table,): records})
+          records = []
+    records.sort()
+    return self._runs.merge((table,), records)
+
+def _get_records(buf):
+  """Get records (key, first, freq) of a buffer {key:[freq, first]}, sorted."""
+  return sorted((key, first, freq) for (key, (freq, first)) in buf.items())
+
+def _intersect_ngram_lengths(ngram_lengths, other_ngram_lengths):
+  """Intersection of two sets of n-gram lengths where None means all lengths."""
+  if ngram_lengths is None:
+    return other_ngram_lengths
+  if other_ngram_lengths is None:
+    return ngram_lengths
+  return ngram_lengths.intersection(other_ngram_lengths)
+
+def _subtract(the_dict, key, value):
+  """Subtract a value from a dictionary value, deleting it if it is about zero."""
+  remaining = the_dict[key] - value
+  if remaining <= the_dict[key] * _REMOVAL_TOLERANCE:
+    del the_dict[key]
+  else:
+    the_dict[key] = remaining
+
+def _concat_seqs(seqs):
+  """Concatenate sequences of the same type, e.g. strings or tuples."""
+  if len(seqs) == 0:
+    return ()
+  if isinstance(seqs[0], tuple):
+    return tuple(itertools.chain.from_iterable(seqs))
+  return seqs[0][:0].join(seqs)
+
+def _concat_seq_stream(seqs):
+  """Concatenate a stream of sequences of the same type, a block at a time.
+
+  Unlike _concat_seqs, no list of all sequences is built, only of the
+  concatenated blocks of _CONCAT_BLOCK_SIZE sequences.
+  """
+  blocks = []
+  block = []
+  for seq in seqs:
+    block.append(seq)
+    if len(block) == _CONCAT_BLOCK_SIZE:
+      blocks.append(_concat_seqs(block))
+      block = []
+  if len(block) > 0:
+    blocks.append(_concat_seqs(block))
+  return _concat_seqs(blocks)
+
+def _copy_dict_dict(the_dict):
+  """Copy a dictionary of type {key1:{key2:value}} two levels deep."""
+  return dict((key, value.copy()) for (key, value) in the_dict.items())
+
+def _get_element_type(seqs):
+  """Get the snapshot element type, "text" or "bytes", of some sequences."""
+  for (element_type, seq_type) in [("bytes", bytes), ("text", type(u""))]:
+    if all(isinstance(seq, seq_type) for seq in seqs):
+      return element_type
+  raise ValueError("Only string sequences can be saved, "
+      "encode other sequences with a Vocabulary.")
+
+class _SnapshotWriter(object):
+  """Collects the data sections of a snapshot file.
+
+  Each section is referred to in the header by [offset, count], where offset
+  is relative to the end of the header, and count is the number of elements
+  or array items in the section.
+  """
+
+  def __init__(self, element_type):
+    self.element_type = element_type
+    self._sections = []
+    self._size = 0
+
+  def add_elements(self, elements):
+    """Add a section of concatenated sequences, returning [offset, count]."""
+    encoding = _SNAPSHOT_ELEMENT_TYPES[self.element_type][0]
+    data = bytes(elements) if encoding is None else elements.encode(encoding)
+    return self._add(data, len(elements))
+
+  def add_array(self, typecode, values):
+    """Add a section of little-endian array items, returning [offset, count]."""
+    arr = array.array(typecode, values)
+    if sys.byteorder != "little":
+      arr.byteswap()
+    data = arr.tobytes() if hasattr(arr, "tobytes") else arr.tostring()
+    return self._add(data, len(arr))
+
+  def _add(self, data, count):
+    offset = self._size
+    padding = b"\0" * (-len(data) % _SNAPSHOT_ALIGNMENT)
+    self._sections.extend([data, padding])
+    self._size += len(data) + len(padding)
+    return [offset, count]
+
+  def write(self, file_obj, header):
+    """Write the preamble, the header, and all sections."""
+    header_data = json.dumps(header).encode("utf-8")
+    header_data += b" " * \
+        (-(_SNAPSHOT_PREAMBLE.size + len(header_data)) % _SNAPSHOT_ALIGNMENT)
+    file_obj.write(_SNAPSHOT_PREAMBLE.pack(
+        _SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, len(header_data)))
+    file_obj.write(header_data)
+    for data in self._sections:
+      file_obj.write(data)
+
+class _SnapshotReader(object):
+  """Reads the data sections of a memory mapped snapshot file.
+
+  Sections are returned as views of the mapped pages if possible. Otherwise,
+  e.g. on big-endian platforms, they are copied.
+  """
+
+  def __init__(self, buf, data_start, element_type):
+    self._mapped = sys.byteorder == "little" and hasattr(memoryview, "cast")
+    self._data = memoryview(buf) if self._mapped else buf[:]
+    self._data_start = data_start
+    (self._encoding, self._element_size) = _SNAPSHOT_ELEMENT_TYPES[element_type]
+
+  def _get_section(self, section, item_size):
+    (offset, count) = section
+    start = self._data_start + offset
+    return self._data[start : start + count * item_size]
+
+  def get_elements(self, section):
+    """Get concatenated sequences, as a string or bytes."""
+    data = self._get_section(section, self._element_size)
+    if self._mapped:
+      return _MappedSequence(data, self._encoding, self._element_size)
+    return bytes(data) if self._encoding is None else data.decode(self._encoding)
+
+  def get_array(self, typecode, section):
+    """Get array items."""
+    arr = array.array(typecode)
+    data = self._get_section(section, arr.itemsize)
+    if self._mapped:
+      return data.cast(typecode)
+    if hasattr(arr, "frombytes"):
+      arr.frombytes(data)
+    else:
+      arr.fromstring(data)
+    if sys.byteorder != "little":
+      arr.byteswap()
+    return arr
+
+class _MappedSequence(object):
+  """Read only string, or bytes, decoded from a buffer when sliced.
+
+  E.g.
+  For a buffer holding u"asdf" encoded as UTF-32-LE, slicing [1:3] decodes
+  the 8 bytes of u"sd".
+  """
+
+  def __init__(self, data, encoding, element_size):
+    """Creates the sequence from a buffer.
+
+    Args:
+      data: Buffer of the encoded elements.
+      encoding: Encoding of the elements, None meaning bytes.
+      element_size: Number of bytes per element.
+    """
+    self._data = data
+    self._encoding = encoding
+    self._element_size = element_size
+
+  def __len__(self):
+    return len(self._data) // self._element_size
+
+  def __getitem__(self, key):
+    if not isinstance(key, slice) or key.step not in (None, 1):
+      raise TypeError("only contiguous slices are supported")
+    (start, stop, _) = key.indices(len(self))
+    data = self._data[start * self._element_size : stop * self._element_size]
+    return data.tobytes() if self._encoding is None else \
+        codecs.decode(data, self._encoding)
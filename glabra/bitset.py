@@ -0,0 +1,112 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Christofer Hedbrandh
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__author__ = 'Christofer Hedbrandh (chedbrandh@gmail.com)'
+__copyright__ = 'Copyright (c) 2015 Christofer Hedbrandh'
+
+import collections
+import itertools
+import sys
+
+# for python 2 and python 3 compatibility
+if sys.version_info < (3,):
+    map = itertools.imap
+
+# Bitsets are plain integers with bit i set if id i is in the set. Set union
+# and intersection are then | and &, done by Python on whole machine words.
+# Bitsets are converted to and from flag arrays, i.e. byte arrays with byte i
+# being one if id i is in the set and zero otherwise, for building bitsets
+# and testing for ids one id at a time. The conversions go through the binary
+# string of the bitset, and are done by builtins without a loop over the ids.
+
+# translation tables between flags and binary string characters
+_FLAGS_TO_BIN = bytes(bytearray(ord("1") if i else ord("0") for i in range(256)))
+_BIN_TO_FLAGS = bytes(bytearray(1 if i == ord("1") else 0 for i in range(256)))
+
+def get_mask(ids):
+  """Get the bitset of some ids.
+
+  E.g.
+  get_mask([0, 3, 4]) returns 0b11001, i.e. 25
+
+  Args:
+    ids: Iterable of non-negative integer ids.
+
+  Returns:
+    Integer with bit i set for each i in ids.
+  """
+  ids = list(ids)
+  if len(ids) == 0:
+    return 0
+  flags = bytearray(max(ids) + 1)
+  set_flags(flags, ids)
+  return from_flags(flags)
+
+def get_ids(mask):
+  """Get the ids of some bitset, in increasing order.
+
+  E.g.
+  get_ids(25) returns [0, 3, 4]
+
+  Args:
+    mask: Integer bitset.
+
+  Returns:
+    List of the ids of the bits set in mask.
+  """
+  return list(itertools.compress(itertools.count(), to_flags(mask)))
+
+def count(mask):
+  """Get the number of ids in some bitset."""
+  return bin(mask).count("1")
+
+def set_flags(flags, ids):
+  """Set the flags of some ids.
+
+  Args:
+    flags: Bytearray of flags, long enough to hold all ids.
+    ids: Iterable of non-negative integer ids.
+  """
+  collections.deque(map(flags.__setitem__, ids, itertools.repeat(1)), 0)
+
+def from_flags(flags):
+  """Get the bitset of some flags.
+
+  Args:
+    flags: Non empty bytearray with byte i being non-zero if id i is in the set.
+
+  Returns:
+    Integer with bit i set for each id i flagged in flags.
+  """
+  return int(bytes(flags[::-1].translate(_FLAGS_TO_BIN)), 2)
+
+def to_flags(mask):
+  """Get the flags of some bitset.
+
+  Args:
+    mask: Integer bitset.
+
+  Returns:
+    Bytearray with byte i being one if id i is in mask and zero otherwise,
+    of length one more than the largest id.
+  """
+  return bytearray(bin(mask)[:1:-1], "ascii").translate(_BIN_TO_FLAGS)
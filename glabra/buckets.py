@@ -23,7 +23,120 @@
 __author__ = 'Christofer Hedbrandh (chedbrandh@gmail.com)'
 __copyright__ = 'Copyright (c) 2015 Christofer Hedbrandh'
 
-def get_ngrams(sequence_analyzer, bounds):
+import bisect
+import collections
+import weakref
+
+from glabra import analyze
+
+# maximum number of buckets held by a BucketCache, unless specified
+DEFAULT_CACHE_SIZE = 256
+
+class BucketCache(object):
+  """Least recently used cache of filtered buckets of n-grams.
+
+  A bucket is cached by its SequenceAnalyzer, the kind of its n-grams, and
+  the bounds of its length together with the bounds of all shorter lengths,
+  which the bucket has been filtered by. Buckets of bounds sharing their
+  shorter lengths, e.g. {2: (50, 100), 3: (0, 100)} and
+  {2: (50, 100), 3: (0, 100), 4: (10, 100)}, are therefore shared.
+
+  SequenceAnalyzers are referenced weakly and together with their version.
+  The buckets of an analyzer are discarded when it is garbage collected, and
+  the buckets of older versions of an analyzer are discarded when buckets of
+  a new version are looked up.
+  """
+
+  def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+    """Creates an empty cache.
+
+    Args:
+      max_size: Maximum number of buckets to hold. Zero disables caching.
+    """
+    self._max_size = max_size
+    self._buckets = collections.OrderedDict()
+    # {id(analyzer):(weakref, version)} of the analyzers with cached buckets
+    self._analyzer_refs = {}
+
+  def __len__(self):
+    """Number of cached buckets."""
+    return len(self._buckets)
+
+  def clear(self):
+    """Discard all cached buckets."""
+    self._buckets.clear()
+    self._analyzer_refs.clear()
+
+  def get_analyzer_key(self, sequence_analyzer):
+    """Get the key prefix of the buckets of some SequenceAnalyzer.
+
+    If the version of the analyzer has changed since the last call, the
+    buckets of its older versions are discarded.
+
+    Args:
+      sequence_analyzer: The SequenceAnalyzer of the buckets.
+
+    Returns:
+      Tuple of a weak reference to the analyzer, and its version.
+    """
+    analyzer_id = id(sequence_analyzer)
+    version = sequence_analyzer.get_version()
+    entry = self._analyzer_refs.get(analyzer_id)
+    if entry is None:
+      ref = weakref.ref(sequence_analyzer,
+          lambda ref: self._discard_analyzer(analyzer_id, ref))
+    else:
+      ref = entry[0]
+      if entry[1] != version:
+        self._discard_buckets(ref)
+    self._analyzer_refs[analyzer_id] = (ref, version)
+    return (ref, version)
+
+  def get(self, key):
+    """Get a cached bucket, marking it as most recently used.
+
+    Args:
+      key: Key of the bucket.
+
+    Returns:
+      The bucket, or None if not cached.
+    """
+    bucket = self._buckets.pop(key, None)
+    if bucket is not None:
+      self._buckets[key] = bucket
+    return bucket
+
+  def put(self, key, bucket):
+    """Cache a bucket, evicting the least recently used if full.
+
+    Args:
+      key: Key of the bucket.
+      bucket: The bucket. Must not be mutated once cached.
+    """
+    if self._max_size <= 0:
+      return
+    self._buckets.pop(key, None)
+    self._buckets[key] = bucket
+    while len(self._buckets) > self._max_size:
+      self._buckets.popitem(last=False)
+
+  def _discard_analyzer(self, analyzer_id, ref):
+    """Discard the buckets of a garbage collected SequenceAnalyzer."""
+    entry = self._analyzer_refs.get(analyzer_id)
+    if entry is not None and entry[0] is ref:
+      del self._analyzer_refs[analyzer_id]
+    self._discard_buckets(ref)
+
+  def _discard_buckets(self, ref):
+    """Discard the buckets with keys starting with some analyzer reference."""
+    for key in [key for key in self._buckets
+        if isinstance(key, tuple) and len(key) > 0 and key[0] is ref]:
+      del self._buckets[key]
+
+# cache shared by all callers not providing their own
+default_cache = BucketCache()
+
+def get_ngrams(sequence_analyzer, bounds, cache=None):
   """Returns all n-grams within some bounds.
 
   Given a SequenceAnalyzer and some bounds, the n-grams that fulfill all
@@ -47,15 +160,15 @@ def get_ngrams(sequence_analyzer, bounds):
   Args:
     sequence_analyzer: SequenceAnalyzer to get n-grams from.
     bounds: Bounds that returned n-grams must be within.
+    cache: BucketCache to share buckets in. If None, default_cache is used.
 
   Returns:
     All n-grams that fulfill the bounds constraints.
   """
-  get_ngs_fn = sequence_analyzer.get_ngrams
-  get_filter_fn = _get_bucket_filter
-  return _build_bucket(bounds, get_ngs_fn, get_filter_fn)
+  return _build_bucket(sequence_analyzer, analyze.KIND_NGRAMS, bounds,
+      _get_bucket_filter, cache)
 
-def get_ngrams_leading(sequence_analyzer, bounds_leading):
+def get_ngrams_leading(sequence_analyzer, bounds_leading, cache=None):
   """Returns all leading n-grams within some bounds.
 
   Like get_ngrams but only leading n-gram sub-n-grams must be within
@@ -75,15 +188,15 @@ def get_ngrams_leading(sequence_analyzer, bounds_leading):
   Args:
     sequence_analyzer: SequenceAnalyzer to get n-grams from.
     bounds: Bounds that returned n-grams must be within.
+    cache: BucketCache to share buckets in. If None, default_cache is used.
 
   Returns:
     All leading n-grams that fulfill all bounds constraints.
   """
-  get_ngs_fn = sequence_analyzer.get_ngrams_leading
-  get_filter_fn = _get_bucket_filter_leading
-  return _build_bucket(bounds_leading, get_ngs_fn, get_filter_fn)
+  return _build_bucket(sequence_analyzer, analyze.KIND_LEADING, bounds_leading,
+      _get_bucket_filter_leading, cache)
 
-def get_ngrams_trailing(sequence_analyzer, bounds_trailing):
+def get_ngrams_trailing(sequence_analyzer, bounds_trailing, cache=None):
   """Returns all trailing n-grams within some bounds.
 
   Like get_ngrams but only trailing n-gram sub-n-grams must be within
@@ -103,52 +216,187 @@ def get_ngrams_trailing(sequence_analyzer, bounds_trailing):
   Args:
     sequence_analyzer: SequenceAnalyzer to get n-grams from.
     bounds: Bounds that returned n-grams must be within.
+    cache: BucketCache to share buckets in. If None, default_cache is used.
 
   Returns:
     All trailing n-grams that fulfill all bounds constraints.
   """
-  get_ngs_fn = sequence_analyzer.get_ngrams_trailing
-  get_filter_fn = _get_bucket_filter_trailing
-  return _build_bucket(bounds_trailing, get_ngs_fn, get_filter_fn)
+  return _build_bucket(sequence_analyzer, analyze.KIND_TRAILING, bounds_trailing,
+      _get_bucket_filter_trailing, cache)
+
+def sweep_bounds(sequence_analyzer, bounds, length, windows,
+    kind=analyze.KIND_NGRAMS, cache=None):
+  """Generates the buckets of many bounds of one length, all other bounds fixed.
+
+  Bounds are typically tuned by trying many windows of lower and upper bounds
+  for one length. Rather than building the bucket of every window from
+  scratch, the n-grams of the swept length are sorted by frequency once, each
+  window being a range of them. The buckets of the fixed bounds of shorter and
+  of longer lengths are built once, and the n-grams of the longest length are
+  kept with the first and last position of their sub-n-grams of the swept
+  length. The bucket of a window is then the n-grams with their positions in
+  the range of the window.
+
+  E.g.
+  SequenceAnalyzer([("asdf", 1), ("qwer", 2), ("uipo", 3)])
+  bounds = {3: (0, 100)}, length = 2, windows = [(0, 100), (60, 100)]
+  generates ((0, 100), ["asd", "sdf", "qwe", "wer", "uip", "ipo"])
+  and ((60, 100), ["uip", "ipo"])
+
+  Args:
+    sequence_analyzer: SequenceAnalyzer to get n-grams from.
+    bounds: Fixed bounds of other lengths. Bounds of length are ignored.
+    length: Length of the n-grams whose bounds to sweep.
+    windows: Tuples of (lower_bound, upper_bound) to sweep the bounds with.
+    kind: Kind of n-grams, e.g. analyze.KIND_LEADING.
+    cache: BucketCache to share the buckets of the fixed bounds in. If None,
+      default_cache is used.
+
+  Returns:
+    Generator of tuples (window, bucket) for each window, where bucket is the
+    bucket of n-grams of the bounds with the bounds of length set to window.
+  """
+  windows = list(windows)
+  get_filter_fn = _get_bucket_filter_fn(kind)
+  shorter_bounds = dict((len_ng, b) for (len_ng, b) in bounds.items() if len_ng < length)
+  longer_bounds = dict((len_ng, b) for (len_ng, b) in bounds.items() if len_ng > length)
+  (ngs, ranges) = sequence_analyzer.get_ngram_ranges(length, windows, kind)
+
+  # {ng:position} of the n-grams of length "containing" the shorter bucket
+  if len(shorter_bounds) > 0 and len(ngs) > 0:
+    shorter_bucket = _build_bucket(
+        sequence_analyzer, kind, shorter_bounds, get_filter_fn, cache)
+    allowed = set(get_filter_fn(shorter_bucket, length)(ngs)) \
+        if len(shorter_bucket) > 0 else set()
+    positions = dict((ng, i) for (i, ng) in enumerate(ngs) if ng in allowed)
+  else:
+    positions = dict((ng, i) for (i, ng) in enumerate(ngs))
+
+  # tuples (last position, first position, rank, n-gram) of the n-grams of
+  # the longest length, the rank being their order in the bucket
+  candidates = []
+  if len(longer_bounds) > 0:
+    longer_bucket = _build_bucket(
+        sequence_analyzer, kind, longer_bounds, get_filter_fn, cache)
+    if len(longer_bucket) > 0:
+      slices = _get_sub_ngram_slices(kind, len(longer_bucket[0]), length)
+    for (rank, ng) in enumerate(longer_bucket):
+      sub_positions = [positions.get(ng[sub_slice]) for sub_slice in slices]
+      if None not in sub_positions:
+        candidates.append((max(sub_positions), min(sub_positions), rank, ng))
+  else:
+    candidates = [(i, i, i, ng) for (ng, i) in positions.items()]
+  candidates.sort()
+  last_positions = [candidate[0] for candidate in candidates]
+
+  for (window, (start, stop)) in zip(windows, ranges):
+    # only candidates ending before the window stops can be within it
+    num_ending = bisect.bisect_left(last_positions, stop)
+    ranked = sorted((rank, ng)
+        for (_, first, rank, ng) in candidates[:num_ending] if first >= start)
+    yield (window, [ng for (_, ng) in ranked])
+
+def _get_bucket_filter_fn(kind):
+  """Get the function for getting filters of buckets of some kind of n-grams."""
+  if kind == analyze.KIND_NGRAMS:
+    return _get_bucket_filter
+  if kind == analyze.KIND_LEADING:
+    return _get_bucket_filter_leading
+  if kind == analyze.KIND_TRAILING:
+    return _get_bucket_filter_trailing
+  raise ValueError("Unknown kind of n-grams '%s'." % kind)
+
+def _get_sub_ngram_slices(kind, len_ng, len_sub_ng):
+  """Get the slices of the sub-n-grams of some length, of some kind, of n-grams.
+
+  E.g.
+  _get_sub_ngram_slices(analyze.KIND_NGRAMS, 4, 2) returns
+  [slice(0, 2), slice(1, 3), slice(2, 4)]
+  _get_sub_ngram_slices(analyze.KIND_TRAILING, 4, 2) returns [slice(2, 4)]
+  """
+  if kind == analyze.KIND_LEADING:
+    return [slice(0, len_sub_ng)]
+  if kind == analyze.KIND_TRAILING:
+    return [slice(len_ng - len_sub_ng, len_ng)]
+  return [slice(i, i + len_sub_ng) for i in range(len_ng - len_sub_ng + 1)]
+
+def _get_ngs_fn(sequence_analyzer, kind):
+  """Get a function returning n-grams of some kind for all bounds at once.
+
+  Args:
+    sequence_analyzer: SequenceAnalyzer to get n-grams from.
+    kind: Kind of n-grams, e.g. analyze.KIND_LEADING.
+
+  Returns:
+    Function returning {len_ng:[n-grams]} given some bounds.
+  """
+  return lambda bounds: sequence_analyzer.get_ngrams_multi(bounds, kind)
 
-def _build_bucket(bounds, get_ngs_fn, get_filter_fn):
+def _build_bucket(sequence_analyzer, kind, bounds, get_filter_fn, cache=None):
   """Build bucket of n-grams that fulfill all bounds constraints.
 
-  A list of n-gram buckets are first created using the provided bounds and a
-  function for getting n-grams. The filter function is then used on the bucket
-  with the longest n-grams to filter out the n-grams that don't "contain" the
-  shorter n-grams.
+  A list of n-gram buckets are first created using the provided bounds and
+  the n-grams of some kind of the SequenceAnalyzer. The filter function is
+  then used on the bucket with the longest n-grams to filter out the n-grams
+  that don't "contain" the shorter n-grams.
 
   For example when getting leading n-grams for some given bounds, the
-  SequenceAnalyzer.get_ngrams_leading function would be used for
-  getting n-grams, and the _get_bucket_filter_leading function
-  would be used for filtering.
+  leading n-grams would be fetched, and the _get_bucket_filter_leading
+  function would be used for filtering.
+
+  Every filtered bucket is cached. Only the buckets of lengths longer than
+  those of the longest cached bounds are then fetched and filtered later on.
   """
-  ng_buckets = _get_ng_buckets(bounds, get_ngs_fn)
+  cache = default_cache if cache is None else cache
+  sorted_bounds = tuple((len_ng, lower_bound, upper_bound)
+      for (len_ng, (lower_bound, upper_bound)) in sorted(bounds.items()))
+  if len(sorted_bounds) == 0:
+    return []
+  key = cache.get_analyzer_key(sequence_analyzer) + (kind,)
+
+  # find the bucket of the longest cached bounds, if any
+  num_cached = len(sorted_bounds)
+  while num_cached > 0:
+    bucket = cache.get(key + (sorted_bounds[:num_cached],))
+    if bucket is not None:
+      break
+    num_cached -= 1
+  if num_cached == len(sorted_bounds):
+    return list(bucket)
+
+  # fetch and filter the buckets of the remaining bounds, ng_buckets[i] being
+  # the bucket of the bounds sorted_bounds[first + i]
+  first = max(0, num_cached - 1)
+  ng_buckets = [bucket] if num_cached > 0 else []
+  ng_buckets.extend(_get_ng_buckets(
+      dict((len_ng, (lower_bound, upper_bound))
+          for (len_ng, lower_bound, upper_bound) in sorted_bounds[num_cached:]),
+      _get_ngs_fn(sequence_analyzer, kind)))
   _filter_ng_buckets(ng_buckets, get_filter_fn)
-  return [] if (len(ng_buckets) == 0) else ng_buckets[-1]
+  for i in range(num_cached, len(sorted_bounds)):
+    cache.put(key + (sorted_bounds[:i + 1],), ng_buckets[i - first])
+  return list(ng_buckets[-1])
 
 def _get_ng_buckets(bounds, get_ngs_fn):
   """Given some bounds returns a list of lists of n-grams.
 
-  n-grams are fetched using the get_ngs_fn function. n-grams of len x are
-  fetched using the bounds at bounds[x], allowing only n-grams within the
-  bounds. These lists of n-grams are added to the resulting list of lists of
-  allowed n-grams. The returned list is ordered by length of n-grams, starting
-  with the list with the shortest n-grams.
+  n-grams of all lengths are fetched with one call to the get_ngs_fn
+  function. n-grams of len x are fetched using the bounds at bounds[x],
+  allowing only n-grams within the bounds. These lists of n-grams are added
+  to the resulting list of lists of allowed n-grams. The returned list is
+  ordered by length of n-grams, starting with the list with the shortest
+  n-grams.
 
   Args:
     bounds: Tuples of lower and upper bound e.g. {3: (0, 100)}
-    get_ngs_fn: Function returning n-grams between specified bounds.
+    get_ngs_fn: Function returning {len_ng:[n-grams]} between specified
+      bounds, e.g. SequenceAnalyzer.get_ngrams_multi.
 
   Returns:
     List of list of n-grams within bounds e.g. [["a", "b"], ["ab", "xy"]]
   """
-  result = []
-  for (len_ng, (lower_bound, upper_bound)) in sorted(bounds.items()):
-    ng_bucket = get_ngs_fn(len_ng, lower_bound, upper_bound)
-    result.append(list(ng_bucket))
-  return result
+  ng_buckets = get_ngs_fn(bounds)
+  return [list(ng_buckets[len_ng]) for len_ng in sorted(bounds.keys())]
 
 def _filter_ng_buckets(ng_buckets, get_filter_fn):
   """Filters out n-grams that are not "contained" by shorter ones.
@@ -191,19 +439,22 @@ def _filter_ng_buckets(ng_buckets, get_filter_fn):
     len_prev_ng = len(prev_ng_bucket[0])
     len_ng = len(ng_bucket[0])
     assert len_prev_ng < len_ng
-    ng_buckets[i] = list(filter(get_filter_fn(prev_ng_bucket, len_ng), ng_bucket))
+    ng_buckets[i] = get_filter_fn(prev_ng_bucket, len_ng)(ng_bucket)
 
 def _get_bucket_filter(bucket, len_seq):
-  """Filtering function determining if a sequence "contains" a bucket.
+  """Filtering function keeping the sequences that "contain" a bucket.
 
-  All n-grams in the bucket must be of the same length. The sequence to be
-  subject to the filtering function must be of length len_seq, and it must be
-  longer than the n-grams in the bucket.
+  All n-grams in the bucket must be of the same length. The sequences to be
+  subject to the filtering function must be of length len_seq, and they must
+  be longer than the n-grams in the bucket.
 
   A sequence is here defined as "containing" a bucket if all the n-grams of
   the sequence, of the same length as the n-grams in the bucket, are present
   in the bucket.
 
+  The sequences are filtered by one n-gram position at a time, each pass
+  only checking the sequences kept by the previous passes.
+
   E.g.
   bucket = ["as", "sd", "df", "qw", "er", "ui"]
   seqs = ["asdf", "qwer", "uiop"]
@@ -214,28 +465,28 @@ def _get_bucket_filter(bucket, len_seq):
     len_seq: Length of sequences to be filtered.
 
   Returns:
-    Filter function for sequence to be filtered "containing" bucket.
+    Filter function returning the sequences, of a list of sequences,
+    "containing" the bucket.
   """
   len_ng = len(bucket[0])
   assert len_ng < len_seq
   bucket_set = set(bucket)
 
-  def filter_fn(seq):
-    assert len(seq) == len_seq
-    # check that all sequence n-grams are present in the bucket
+  def filter_fn(seqs):
+    # keep the sequences with their n-gram at each position in the bucket
     for i in range(len_seq - len_ng + 1):
-      if not seq[i: i + len_ng] in bucket_set:
-        return False
-    return True
+      ng_slice = slice(i, i + len_ng)
+      seqs = [seq for seq in seqs if seq[ng_slice] in bucket_set]
+    return seqs
 
   return filter_fn
 
 def _get_bucket_filter_leading(bucket, len_seq):
-  """Filtering function for sequence "contains" a "leading bucket".
+  """Filtering function keeping the sequences that "contain" a "leading bucket".
 
-  All n-grams in the leading bucket must be of the same length. The length of
-  the sequence to be subject to the filtering function must be of length
-  len_seq, and it must be longer than the n-grams in the leading bucket.
+  All n-grams in the leading bucket must be of the same length. The sequences
+  to be subject to the filtering function must be of length len_seq, and they
+  must be longer than the n-grams in the leading bucket.
 
   A sequence is here defined as "containing" a "leading bucket" if the leading
   n-gram of the sequence, of the same length as the n-grams in the bucket, is
@@ -250,24 +501,24 @@ def _get_bucket_filter_leading(bucket, len_seq):
     bucket: Bucket of n-grams used to filter sequences.
     len_seq: Length of sequences to be filtered.
 
-  Returns: Filter function for sequence to be filtered "containing" bucket.
+  Returns: Filter function returning the sequences, of a list of sequences,
+    "containing" the bucket.
   """
   len_ng = len(bucket[0])
   assert len_ng < len_seq
   bucket_set = set(bucket)
 
-  def filter_fn(seq):
-    assert len(seq) == len_seq
-    return seq[:len_ng] in bucket_set
+  def filter_fn(seqs):
+    return [seq for seq in seqs if seq[:len_ng] in bucket_set]
 
   return filter_fn
 
 def _get_bucket_filter_trailing(bucket, len_seq):
-  """Filtering function for sequence "contains" a "trailing bucket".
+  """Filtering function keeping the sequences that "contain" a "trailing bucket".
 
-  All n-grams in the leading bucket must be of the same length. The length of
-  the sequence to be subject to the filtering function must be of length
-  len_seq, and must be longer than the n-grams in the bucket.
+  All n-grams in the leading bucket must be of the same length. The sequences
+  to be subject to the filtering function must be of length len_seq, and
+  they must be longer than the n-grams in the bucket.
 
   A sequence is here defined as "containing" a "trailing bucket" if the
   trailing n-gram of the sequence, of the same length as the n-grams in the
@@ -282,14 +533,15 @@ def _get_bucket_filter_trailing(bucket, len_seq):
     bucket: Bucket of n-grams used to filter sequences.
     len_seq: Length of sequences to be filtered.
 
-  Returns: Filter function for sequence to be filtered "containing" bucket.
+  Returns: Filter function returning the sequences, of a list of sequences,
+    "containing" the bucket.
   """
   len_ng = len(bucket[0])
   assert len_ng < len_seq
   bucket_set = set(bucket)
+  start = len_seq - len_ng
 
-  def filter_fn(seq):
-    assert len(seq) == len_seq
-    return seq[-len_ng:] in bucket_set
+  def filter_fn(seqs):
+    return [seq for seq in seqs if seq[start:] in bucket_set]
 
   return filter_fn
@@ -52,7 +52,7 @@ class SequenceCreator(object):
   """
 
   def __init__(self, sequence_length,
-      ngrams_leading, ngrams_middle, ngrams_trailing):
+      ngrams_leading, ngrams_middle, ngrams_trailing, sequence_graph=None):
     """n-grams are added and processed to prepare for sequence creation.
 
     Args:
@@ -60,39 +60,35 @@ class SequenceCreator(object):
       ngrams_leading: The leading n-grams.
       ngrams_middle: The middle n-grams.
       ngrams_trailing: The trailing n-grams.
+      sequence_graph: SequenceGraph of the same n-grams, shared with the
+        sequence creators of other lengths. If None, one is created.
     """
+    if sequence_graph is None:
+      sequence_graph = SequenceGraph(ngrams_leading, ngrams_middle, ngrams_trailing)
+    self._sequence_graph = sequence_graph
 
-    # create edge getters from leading to middle and middle to trailing
-    self._leading_to_middle_dedge = dedge.DirectedEdgeGetter(
-        ngrams_leading, ngrams_middle)
-    self._middle_to_trailing_dedge = dedge.DirectedEdgeGetter(
-        ngrams_middle, ngrams_trailing)
+    # edge getters from leading to middle and middle to trailing
+    self._leading_to_middle_dedge = sequence_graph.get_leading_to_middle_dedge()
+    self._middle_to_trailing_dedge = sequence_graph.get_middle_to_trailing_dedge()
 
-    # get all middle vertices with edges to leading/trailing
-    self._start_vertices = graph.expand_update(set(ngrams_middle),
-        ngrams_leading, self._leading_to_middle_dedge.get_end_vertices)
-    self._end_vertices = graph.expand_update(set(ngrams_middle),
-        ngrams_trailing, self._middle_to_trailing_dedge.get_start_vertices)
+    # all middle vertices with edges to leading/trailing
+    self._start_vertices = sequence_graph.get_start_vertices()
+    self._end_vertices = sequence_graph.get_end_vertices()
 
     # return if there are no edges between middle and leading/trailing vertices
-    if len(self._start_vertices) == 0 or len(self._end_vertices) == 0:
+    if sequence_graph.is_disconnected():
       self._is_disconnected = True
       return
 
-    # get length of leading/middle/trailing n-grams
-    len_leading = len(ngrams_leading[0])
-    len_middle = len(ngrams_middle[0])
-    len_trailing = len(ngrams_trailing[0])
-
     # calculate how many middle vertices are needed for the requested length
     num_middle_vertices = _get_num_middle_vertices(
-        sequence_length, len_leading, len_middle, len_trailing)
+        sequence_length, *sequence_graph.get_ngram_lengths())
 
     # if only one middle vertex is needed then no advanced path finding needs to happen
     if num_middle_vertices == 1:
       self._single_middle_vertex_init()
     else:
-      self._multi_middle_vertex_init(ngrams_middle, num_middle_vertices)
+      self._multi_middle_vertex_init(num_middle_vertices)
 
   def _single_middle_vertex_init(self):
     """Setup sequence creation for the single middle vertex scenario.
@@ -110,28 +106,42 @@ class SequenceCreator(object):
     self._is_disconnected = False
     self._get_random_path_fn = lambda: [random.choice(list(middle))]
     self._get_all_paths_fn = lambda: [[x] for x in middle] # [list(middle)]
+    self._count_paths_fn = lambda start_weight_fn, end_weight_fn: \
+        sum(start_weight_fn(x) * end_weight_fn(x) for x in middle)
 
-  def _multi_middle_vertex_init(self, ngs_middle, num_middle_vertices):
+  def _multi_middle_vertex_init(self, num_middle_vertices):
     """Setup sequence creation for the multi middle vertex scenario.
 
     A graph pathfinder is created for the middle n-grams/vertices. Paths
     must start with a start vertex and end with an end vertex.
     """
     # create a graph path finder for the middle n-grams/vertices
-    middle_to_middle_dedge = dedge.DirectedEdgeGetter(
-        ngs_middle, ngs_middle)
+    middle_to_middle_dedge = self._sequence_graph.get_middle_to_middle_dedge()
     gpf = graph.GraphPathFinder(self._start_vertices, self._end_vertices,
         num_middle_vertices, middle_to_middle_dedge)
 
     # paths are gotten by calling methods in the graph path finder
     self._get_random_path_fn = gpf.get_random_path
     self._get_all_paths_fn = gpf.get_all_paths
+    self._count_paths_fn = gpf.count_paths
     self._is_disconnected = gpf.is_disconnected()
 
   def is_disconnected(self):
     """Returns True if no sequence can be created."""
     return self._is_disconnected
 
+  def count_sequences(self):
+    """Returns the number of possible sequences, without creating them.
+
+    Every path through the middle vertices is counted once for each pair of
+    leading and trailing n-grams it can be extended by.
+    """
+    if self.is_disconnected():
+      return 0
+    return self._count_paths_fn(
+        lambda x: len(self._leading_to_middle_dedge.get_start_vertices(x)),
+        lambda x: len(self._middle_to_trailing_dedge.get_end_vertices(x)))
+
   def get_random_sequence(self):
     """Returns a random sequence."""
 
@@ -167,6 +177,78 @@ class SequenceCreator(object):
           # return the concatenation of leading, middle, and trailing vertices/n-grams
           yield _concat_ngram_list([ngram_leading] + list(path) + [ngram_trailing])
 
+class SequenceGraph(object):
+  """Edges between leading, middle and trailing n-grams.
+
+  Everything a SequenceCreator needs that does not depend on the length of
+  the sequence to create is built here once, and shared by the sequence
+  creators of all lengths. That is the edge getters between leading, middle
+  and trailing n-grams, and the sets of middle n-grams with edges from some
+  leading n-gram (start vertices) and to some trailing n-gram (end vertices).
+  The edge getter between middle n-grams is built the first time it is
+  needed, i.e. for sequences requiring more than one middle n-gram.
+  """
+
+  def __init__(self, ngrams_leading, ngrams_middle, ngrams_trailing):
+    """Edge getters and start and end vertices are built from the n-grams.
+
+    Args:
+      ngrams_leading: The leading n-grams.
+      ngrams_middle: The middle n-grams.
+      ngrams_trailing: The trailing n-grams.
+    """
+    self._ngrams_middle = ngrams_middle
+
+    # create edge getters from leading to middle and middle to trailing
+    self._leading_to_middle_dedge = dedge.DirectedEdgeGetter(
+        ngrams_leading, ngrams_middle)
+    self._middle_to_trailing_dedge = dedge.DirectedEdgeGetter(
+        ngrams_middle, ngrams_trailing)
+
+    # get all middle vertices with edges to leading/trailing
+    self._start_vertices = graph.expand_update(set(ngrams_middle),
+        ngrams_leading, self._leading_to_middle_dedge.get_end_vertices)
+    self._end_vertices = graph.expand_update(set(ngrams_middle),
+        ngrams_trailing, self._middle_to_trailing_dedge.get_start_vertices)
+
+    # get length of leading/middle/trailing n-grams
+    self._ngram_lengths = (
+        len(ngrams_leading[0]), len(ngrams_middle[0]), len(ngrams_trailing[0]))
+
+    # edge getter between middle n-grams, built when first needed
+    self._middle_to_middle_dedge = None
+
+  def is_disconnected(self):
+    """Returns True if there are no edges between middle and leading/trailing n-grams."""
+    return len(self._start_vertices) == 0 or len(self._end_vertices) == 0
+
+  def get_ngram_lengths(self):
+    """Returns the tuple (leading, middle, trailing) of the n-gram lengths."""
+    return self._ngram_lengths
+
+  def get_leading_to_middle_dedge(self):
+    """Returns the DirectedEdgeGetter from leading to middle n-grams."""
+    return self._leading_to_middle_dedge
+
+  def get_middle_to_trailing_dedge(self):
+    """Returns the DirectedEdgeGetter from middle to trailing n-grams."""
+    return self._middle_to_trailing_dedge
+
+  def get_middle_to_middle_dedge(self):
+    """Returns the, possibly new, DirectedEdgeGetter between middle n-grams."""
+    if self._middle_to_middle_dedge is None:
+      self._middle_to_middle_dedge = dedge.DirectedEdgeGetter(
+          self._ngrams_middle, self._ngrams_middle)
+    return self._middle_to_middle_dedge
+
+  def get_start_vertices(self):
+    """Returns the set of middle n-grams with an edge from some leading n-gram."""
+    return self._start_vertices
+
+  def get_end_vertices(self):
+    """Returns the set of middle n-grams with an edge to some trailing n-gram."""
+    return self._end_vertices
+
 def _get_num_middle_vertices(len_seq, len_leading, len_middle, len_trailing):
   """Get the number of middle vertices required by the input.
 
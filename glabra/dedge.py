@@ -23,7 +23,18 @@
 __author__ = 'Christofer Hedbrandh (chedbrandh@gmail.com)'
 __copyright__ = 'Copyright (c) 2015 Christofer Hedbrandh'
 
+import array
+import itertools
+import sys
+
+from glabra import bitset
+
+# for python 2 and python 3 compatibility
+if sys.version_info < (3,):
+    map = itertools.imap
+
 ILLEGAL_LEN_MSG = "n-gram '{0}' is not of length {1}"
+UNKNOWN_VERTEX_MSG = "n-gram '{0}' is not a vertex of the edge getter"
 
 class DirectedEdgeGetter(object):
   """Finds edges between two sets of n-grams.
@@ -42,10 +53,18 @@ class DirectedEdgeGetter(object):
     overlapping part "cd" leaves "ab" and "efg" (> one element) on each side.
   - "abcd" and "de" do overlap, with the overlap "d" leaving "abc" on the one
     side and "e" being the only element left on the other side.
+
+  Every distinct n-gram is assigned a dense integer vertex id, start n-grams
+  first, and edges are stored in compressed sparse row (CSR) form over the
+  ids. All start n-grams with the same overlap have the same end n-grams, so
+  there is one row per overlap rather than one per n-gram, and each vertex
+  id maps to its row. The id based methods look up neighbors in these
+  arrays, while the sets of n-grams returned by get_end_vertices and
+  get_start_vertices are only built for the rows that are asked for.
   """
 
   def __init__(self, start_ngs, end_ngs):
-    """Multimap dictionaries are created from the start/end n-grams.
+    """Vertex ids and edge arrays are created from the start/end n-grams.
 
     Args:
       start_ngs: The n-grams interpreted as vertices with directed edges
@@ -61,12 +80,33 @@ class DirectedEdgeGetter(object):
     if self._len_start < 2 or self._len_end < 2:
       raise ValueError("n-grams must have a length greater than one.")
     self._len_overlap = min(self._len_start, self._len_end) - 1
+    _validate_lengths(start_ngs, self._len_start)
+    _validate_lengths(end_ngs, self._len_end)
 
-    # create the multimap dictionaries
-    self._start_overlap_dict = _get_start_overlap_dict(
-      start_ngs, self._len_overlap, self._len_start)
-    self._end_overlap_dict = _get_end_overlap_dict(
-      end_ngs, self._len_overlap, self._len_end)
+    # n-gram of each vertex id, and the vertex id of each n-gram
+    self._vertices = []
+    self._vertex_ids = {}
+    start_ids = self._add_vertices(start_ngs)
+    end_ids = self._add_vertices(end_ngs)
+
+    # rows of end vertex ids, keyed by the overlap at the start of the end
+    # n-grams, and the row of each start vertex id
+    get_start_key = lambda ng: ng[-self._len_overlap:]
+    get_end_key = lambda ng: ng[:self._len_overlap]
+    (self._end_row_dict, self._end_offsets, self._end_ids) = _get_csr(
+        self._vertices, end_ids, get_end_key)
+    self._end_rows = _get_vertex_rows(
+        self._vertices, start_ids, get_start_key, self._end_row_dict)
+
+    # and the same from the other direction
+    (self._start_row_dict, self._start_offsets, self._start_ids) = _get_csr(
+        self._vertices, start_ids, get_start_key)
+    self._start_rows = _get_vertex_rows(
+        self._vertices, end_ids, get_end_key, self._start_row_dict)
+
+    # sets of n-grams of the rows, built when first asked for
+    self._end_sets = [None] * (len(self._end_offsets) - 1)
+    self._start_sets = [None] * (len(self._start_offsets) - 1)
 
   def get_end_vertices(self, start_ng):
     """Get all end vertices/n-grams with an edge from some start n-gram.
@@ -78,9 +118,19 @@ class DirectedEdgeGetter(object):
       The set of end n-grams with an edge from start_ng. I.e. All
       n-grams that have an overlap with start_ng.
     """
-    if len(start_ng) != self._len_start:
-      raise ValueError(ILLEGAL_LEN_MSG.format(start_ng, self._len_start))
-    return self._end_overlap_dict.get(start_ng[-self._len_overlap:], set())
+    vertex_id = self._vertex_ids.get(start_ng)
+    row = -1 if vertex_id is None else self._end_rows[vertex_id]
+    if row == -1:
+      if len(start_ng) != self._len_start:
+        raise ValueError(ILLEGAL_LEN_MSG.format(start_ng, self._len_start))
+      row = self._end_row_dict.get(start_ng[-self._len_overlap:], -1)
+      if row == -1:
+        return set()
+    row_set = self._end_sets[row]
+    if row_set is None:
+      row_set = self._end_sets[row] = _get_row_set(
+          row, self._end_offsets, self._end_ids, self._vertices)
+    return row_set
 
   def get_start_vertices(self, end_ng):
     """Get all start vertices/n-grams with an edge to some end n-gram.
@@ -92,74 +142,237 @@ class DirectedEdgeGetter(object):
       The set of start n-grams with an edge to end_ng. I.e. All
       n-grams that have an overlap with end_ng.
     """
-    if len(end_ng) != self._len_end:
-      raise ValueError(ILLEGAL_LEN_MSG.format(end_ng, self._len_end))
-    return self._start_overlap_dict.get(end_ng[:self._len_overlap], set())
+    vertex_id = self._vertex_ids.get(end_ng)
+    row = -1 if vertex_id is None else self._start_rows[vertex_id]
+    if row == -1:
+      if len(end_ng) != self._len_end:
+        raise ValueError(ILLEGAL_LEN_MSG.format(end_ng, self._len_end))
+      row = self._start_row_dict.get(end_ng[:self._len_overlap], -1)
+      if row == -1:
+        return set()
+    row_set = self._start_sets[row]
+    if row_set is None:
+      row_set = self._start_sets[row] = _get_row_set(
+          row, self._start_offsets, self._start_ids, self._vertices)
+    return row_set
+
+  def get_num_vertices(self):
+    """Get the number of vertices, i.e. distinct start and end n-grams."""
+    return len(self._vertices)
+
+  def get_vertex_id(self, ng):
+    """Get the vertex id of some start or end n-gram.
+
+    Args:
+      ng: An n-gram given at initialization.
+
+    Returns:
+      The vertex id of ng, between zero and get_num_vertices().
+    """
+    vertex_id = self._vertex_ids.get(ng)
+    if vertex_id is None:
+      raise ValueError(UNKNOWN_VERTEX_MSG.format(ng))
+    return vertex_id
+
+  def get_vertex(self, vertex_id):
+    """Get the n-gram of some vertex id."""
+    return self._vertices[vertex_id]
+
+  def get_end_vertex_ids(self, start_id):
+    """Get the ids of all end vertices with an edge from some start vertex.
+
+    Args:
+      start_id: Vertex id of the start n-gram to find connected end n-grams for.
+
+    Returns:
+      Array of the distinct end vertex ids with an edge from start_id.
+    """
+    row = self._end_rows[start_id]
+    if row == -1:
+      return self._end_ids[:0]
+    return self._end_ids[self._end_offsets[row]:self._end_offsets[row + 1]]
 
-def _get_end_overlap_dict(end_ngs, len_overlap, len_end):
-  """Given end_ngs and len_overlap returns an overlap dictionary.
+  def get_start_vertex_ids(self, end_id):
+    """Get the ids of all start vertices with an edge to some end vertex.
 
-  The resulting overlap dictionary is intended to be used to find an overlap
-  from one n-gram to other n-gram where there is an overlap of length
-  len_overlap.
+    Args:
+      end_id: Vertex id of the end n-gram to find connected start n-grams for.
 
-  The overlap dictionary will have keys of length len_overlap consisting of
-  the len_overlap first elements in the end_ngs n-grams, and the value
-  will be the n-gram itself.
+    Returns:
+      Array of the distinct start vertex ids with an edge to end_id.
+    """
+    row = self._start_rows[end_id]
+    if row == -1:
+      return self._start_ids[:0]
+    return self._start_ids[self._start_offsets[row]:self._start_offsets[row + 1]]
+
+  def get_end_mask(self, start_mask):
+    """Get all end vertices with an edge from any start vertex in a bitset.
+
+    Args:
+      start_mask: Bitset of the vertex ids of the start n-grams to find
+        connected end n-grams for.
+
+    Returns:
+      Bitset of the vertex ids of the end n-grams with an edge from start_mask.
+    """
+    return _get_neighbors_mask(start_mask, self._end_rows, self._end_offsets,
+        self._end_ids, len(self._vertices))
+
+  def get_start_mask(self, end_mask):
+    """Get all start vertices with an edge to any end vertex in a bitset.
+
+    Args:
+      end_mask: Bitset of the vertex ids of the end n-grams to find
+        connected start n-grams for.
+
+    Returns:
+      Bitset of the vertex ids of the start n-grams with an edge to end_mask.
+    """
+    return _get_neighbors_mask(end_mask, self._start_rows, self._start_offsets,
+        self._start_ids, len(self._vertices))
+
+  def get_end_sums(self, start_ids, end_values):
+    """Get the sum of the values of the end vertices of some start vertices.
+
+    Args:
+      start_ids: Vertex ids of the start n-grams to sum the values for.
+      end_values: Dictionary {end_id:value} of the values of end vertex ids.
+        End vertex ids not in end_values have the value zero.
+
+    Returns:
+      List of the sums, one for each start vertex id in start_ids.
+    """
+    return _get_sums(start_ids, end_values, self._end_rows, self._end_offsets, self._end_ids)
+
+  def _add_vertices(self, ngs):
+    """Assign vertex ids to unseen n-grams and return the ids of all of ngs."""
+    vertices = self._vertices
+    vertex_ids = self._vertex_ids
+    result = []
+    for ng in ngs:
+      vertex_id = vertex_ids.get(ng)
+      if vertex_id is None:
+        vertex_id = len(vertices)
+        vertex_ids[ng] = vertex_id
+        vertices.append(ng)
+      result.append(vertex_id)
+    return result
+
+def _validate_lengths(ngs, len_ng):
+  """Raise a ValueError if not all n-grams in ngs are of length len_ng."""
+  for ng in ngs:
+    if len(ng) != len_ng:
+      raise ValueError(ILLEGAL_LEN_MSG.format(ng, len_ng))
+
+def _get_csr(vertices, vertex_ids, get_key):
+  """Given vertex ids returns them grouped by overlap in CSR form.
+
+  The distinct vertex ids are grouped by the overlap key of their n-grams,
+  and the groups are stored one after the other in a single array. Row r
+  holds the ids from offsets[r] up to offsets[r + 1].
 
   E.g.
-  end_ngs = ["sdfg", "sdru", "werz", "1234"]
-  len_overlap = 2
-  returns {"sd": set(["sdfg", "sdru"]), "we": set(["werz"]), "12": set(["1234"])}
+  vertices = ["sdfg", "sdru", "werz"], vertex_ids = [0, 1, 2, 1]
+  and get_key = lambda ng: ng[:2]
+  returns ({"sd": 0, "we": 1}, array([0, 2, 3]), array([0, 1, 2]))
+
+  Args:
+    vertices: The n-gram of each vertex id.
+    vertex_ids: The vertex ids to group, possibly with repetitions.
+    get_key: Function returning the overlap key of an n-gram.
+
+  Returns:
+    Tuple of the dictionary {key:row}, and the arrays of row offsets and of
+    vertex ids.
+  """
+  row_dict = {}
+  rows = []
+  seen = set()
+  for vertex_id in vertex_ids:
+    if vertex_id in seen:
+      continue
+    seen.add(vertex_id)
+    key = get_key(vertices[vertex_id])
+    row = row_dict.get(key)
+    if row is None:
+      row = row_dict[key] = len(rows)
+      rows.append([])
+    rows[row].append(vertex_id)
+  offsets = array.array('i', [0])
+  ids = array.array('i')
+  for row_ids in rows:
+    ids.extend(row_ids)
+    offsets.append(len(ids))
+  return (row_dict, offsets, ids)
+
+def _get_vertex_rows(vertices, vertex_ids, get_key, row_dict):
+  """Given vertex ids returns the array of their rows, by vertex id.
 
-  end_ngs = ["sdf", "wdr", "wer", "123"]
-  len_overlap = 1
-  returns {"s": set(["sdf"]), "w": set(["wdr", "wer"], "1": set(["123"])}
+  Vertices not among vertex_ids, or with a key not in row_dict, have no
+  edges and are mapped to -1.
 
   Args:
-    end_ngs: The n-grams to be put in the overlap dictionary.
-    len_overlap: The length of the n-gram overlap.
-    len_end: The expected length of the n-grams in end_ngs. This is only
-      used to validate the length of the contents of end_ngs.
+    vertices: The n-gram of each vertex id.
+    vertex_ids: The vertex ids with edges out of them.
+    get_key: Function returning the overlap key of an n-gram.
+    row_dict: Dictionary {key:row} of the vertices at the other end of the edges.
 
   Returns:
-    The overlap dictionary for the given n-grams.
+    Array of the row of each vertex id.
   """
-  result = {}
-  for ng in end_ngs:
-    assert len(ng) == len_end
-    if len(ng) != len_end:
-      raise ValueError(ILLEGAL_LEN_MSG.format(ng, len_end))
-    result.setdefault(ng[:len_overlap], set()).add(ng)
-  return result
+  rows = array.array('i', [-1]) * len(vertices)
+  for vertex_id in vertex_ids:
+    rows[vertex_id] = row_dict.get(get_key(vertices[vertex_id]), -1)
+  return rows
 
-def _get_start_overlap_dict(start_ngs, len_overlap, len_start):
-  """Given start_ngs and len_overlap returns an overlap dictionary.
+def _get_neighbors_mask(mask, rows, offsets, ids, num_vertices):
+  """Get the bitset of the neighbors of all vertices in a bitset.
 
-  This works the same way as _get_end_overlap_dict with the only difference
-  being that the overlap is at the end of the n-grams in start_ngs.
+  Vertices sharing a row share their neighbors, so the neighbors of each
+  distinct row of the vertices are only added once.
 
-  E.g.
-  start_ngs = ["sdfg", "wefg", "werz", "1234"]
-  len_overlap = 2
-  returns {"fg": set(["sdfg", "werg"]), "rz": set(["werz"]), "34": set(["1234"])}
+  Args:
+    mask: Bitset of vertex ids.
+    rows: The row of each vertex id.
+    offsets: The offsets of the rows in ids.
+    ids: The vertex ids of the neighbors, row after row.
+    num_vertices: The number of vertex ids.
 
-  start_ngs = ["sdf", "edr", "wer", "123"]
-  len_overlap = 1
-  returns {"f": set(["sdf"]), "r": set(["edr", "wer"], "3": set(["123"])}
+  Returns:
+    Bitset of the vertex ids of the neighbors.
+  """
+  vertex_rows = set(map(rows.__getitem__, bitset.get_ids(mask)))
+  vertex_rows.discard(-1)
+  flags = bytearray(num_vertices + 1)
+  bitset.set_flags(flags, itertools.chain.from_iterable(
+      ids[offsets[row]:offsets[row + 1]] for row in vertex_rows))
+  return bitset.from_flags(flags)
+
+def _get_sums(vertex_ids, values, rows, offsets, ids):
+  """Get the sum of the values of the neighbors of some vertices.
+
+  Vertices sharing a row share their neighbors, so the sum of each distinct
+  row is only calculated once.
 
   Args:
-    start_ngs: The n-grams to be put in the overlap dictionary.
-    len_overlap: The length of the n-gram overlap.
-    len_start: The expected length of the n-grams in start_ngs. This is only
-      used to validate the length of the contents of start_ngs.
+    vertex_ids: The vertex ids to sum the values for.
+    values: Dictionary {vertex_id:value} of the values of the neighbors.
+    rows: The row of each vertex id.
+    offsets: The offsets of the rows in ids.
+    ids: The vertex ids of the neighbors, row after row.
 
   Returns:
-    The overlap dictionary for the given n-grams.
+    List of the sums, one for each vertex id in vertex_ids.
   """
-  result = {}
-  for ng in start_ngs:
-    if len(ng) != len_start:
-      raise ValueError(ILLEGAL_LEN_MSG.format(ng, len_start))
-    result.setdefault(ng[-len_overlap:], set()).add(ng)
-  return result
+  vertex_rows = list(map(rows.__getitem__, vertex_ids))
+  row_sums = {-1: 0}
+  for row in set(vertex_rows):
+    if row != -1:
+      row_sums[row] = sum(map(
+          values.get, ids[offsets[row]:offsets[row + 1]], itertools.repeat(0)))
+  return list(map(row_sums.__getitem__, vertex_rows))
+
+def _get_row_set(row, offsets, ids, vertices):
+  """Get the set of the n-grams of some CSR row."""
+  return set(vertices[vertex_id] for vertex_id in ids[offsets[row]:offsets[row + 1]])
@@ -0,0 +1,134 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Christofer Hedbrandh
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__author__ = 'Christofer Hedbrandh (chedbrandh@gmail.com)'
+__copyright__ = 'Copyright (c) 2015 Christofer Hedbrandh'
+
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+
+# number of records pickled together in run files
+_BLOCK_SIZE = 4096
+
+# maximum number of runs merged at once, unless specified
+DEFAULT_MAX_MERGE_RUNS = 64
+
+class SortedRuns(object):
+  """Sorted runs of records spilled to temporary files, and merged on request.
+
+  Records are tuples, or anything else that is comparable and can be
+  pickled. Runs are grouped by a run key, e.g. the table the records belong
+  to, and all runs of a key are merged into one sorted stream.
+
+  All runs added at once are written to the same file, each as pickled
+  blocks of records followed by an empty block.
+
+  Every run being merged has its file open. To bound the number of open
+  files, runs of a key are merged at most max_merge_runs at a time, each
+  merge writing a new run, until few enough runs are left.
+  """
+
+  def __init__(self, temp_dir=None, max_merge_runs=DEFAULT_MAX_MERGE_RUNS):
+    """Creates an empty set of runs.
+
+    Args:
+      temp_dir: Directory to create the temporary directory of the run files
+        in. If None, the default temporary directory is used.
+      max_merge_runs: Maximum number of runs to merge at once. Must be at
+        least two.
+    """
+    if max_merge_runs < 2:
+      raise ValueError("Must merge at least two runs at once.")
+    self._dir = tempfile.mkdtemp(prefix="glabra-", dir=temp_dir)
+    self._max_merge_runs = max_merge_runs
+    self._num_files = 0
+    # {run_key:[(filename, offset)]} of all runs
+    self._runs = {}
+
+  def add_runs(self, runs):
+    """Write runs to a new file.
+
+    Args:
+      runs: Dictionary {run_key:records} where records are sorted.
+    """
+    filename = self._get_new_filename()
+    with open(filename, "wb") as f:
+      for (run_key, records) in runs.items():
+        self._runs.setdefault(run_key, []).append((filename, f.tell()))
+        _write_run(f, records)
+
+  def merge(self, run_key, records=()):
+    """Generates all records of the runs of some key, sorted.
+
+    Args:
+      run_key: Key of the runs to merge.
+      records: Sorted records, kept in memory, to merge with the runs.
+    """
+    # merge the first runs into a new run while there are too many to merge
+    # at once, the records in memory not being read from a file
+    key_runs = self._runs.get(run_key, [])
+    while len(key_runs) > self._max_merge_runs:
+      filename = self._get_new_filename()
+      with open(filename, "wb") as f:
+        _write_run(f, heapq.merge(*[_read_run(run_filename, offset)
+            for (run_filename, offset) in key_runs[:self._max_merge_runs]]))
+      key_runs = key_runs[self._max_merge_runs:] + [(filename, 0)]
+      self._runs[run_key] = key_runs
+    streams = [_read_run(filename, offset) for (filename, offset) in key_runs]
+    return heapq.merge(records, *streams)
+
+  def close(self):
+    """Remove all run files."""
+    shutil.rmtree(self._dir, ignore_errors=True)
+    self._runs = {}
+
+  def _get_new_filename(self):
+    """Get the name of a new run file."""
+    filename = os.path.join(self._dir, "%d.run" % self._num_files)
+    self._num_files += 1
+    return filename
+
+def _write_run(f, records):
+  """Write sorted records as a run, at the current position of a file."""
+  block = []
+  for record in records:
+    block.append(record)
+    if len(block) == _BLOCK_SIZE:
+      pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+      block = []
+  if len(block) > 0:
+    pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+  pickle.dump([], f, pickle.HIGHEST_PROTOCOL)
+
+def _read_run(filename, offset):
+  """Generates the records of a run starting at some offset of a file."""
+  with open(filename, "rb") as f:
+    f.seek(offset)
+    while True:
+      block = pickle.load(f)
+      if len(block) == 0:
+        return
+      for record in block:
+        yield record
@@ -23,13 +23,23 @@
 __author__ = 'Christofer Hedbrandh (chedbrandh@gmail.com)'
 __copyright__ = 'Copyright (c) 2015 Christofer Hedbrandh'
 
+import bisect
 import itertools
 import random
 import sys
 
+from glabra import bitset
+
 # for python 2 and python 3 compatibility
 if sys.version_info < (3,):
     range = xrange
+    def _accumulate(values):
+        total = None
+        for value in values:
+            total = value if total is None else total + value
+            yield total
+else:
+    _accumulate = itertools.accumulate
 
 class GraphPathFinder(object):
   """Class for finding a path between two sets of vertices using an edge getter function.
@@ -55,6 +65,13 @@ class GraphPathFinder(object):
   possible graphs must be kept in memory. This feature could however be created
   given the other methods provided here (presumably when the max number of
   possible graphs is known and not too great).
+
+  Internally vertices are handled by integer vertex id, and the set of
+  vertices at each step is a bitset, see the bitset module. Taking a step
+  means getting the bitset of the neighbors of all vertices in a set, and
+  filtering is an AND with the set of a neighboring step. Edge getters with
+  vertex ids, such as DirectedEdgeGetter, are used as is, and vertex ids are
+  assigned as the vertices are seen for any other edge getter.
   """
 
   def __init__(self, start_vertices, end_vertices, num_vertices, directed_edge_getter):
@@ -74,6 +91,8 @@ class GraphPathFinder(object):
         Note the importance of the required DirectedEdgeGetter property of an
         edge getting listed in both direction. E.g. for all vertices Y listed
         in get_end_vertices(X), X is listed in get_start_vertices(Y).
+        Edge getters without the vertex id methods of DirectedEdgeGetter are
+        only required to have get_end_vertices and get_start_vertices.
     """
     if len(start_vertices) < 1:
       raise ValueError("Set of start vertices must be non empty.")
@@ -82,16 +101,35 @@ class GraphPathFinder(object):
     if num_vertices < 2:
       raise ValueError("Number of connected vertices must be greater than one.")
 
+    # edge getter with vertex ids
+    if not hasattr(directed_edge_getter, "get_end_mask"):
+      directed_edge_getter = _VertexIdEdgeGetter(directed_edge_getter)
+    self._dedge = directed_edge_getter
+
     self._start_vertices = start_vertices
     self._end_vertices = end_vertices
     self._num_vertices = num_vertices
-    self._dedge = directed_edge_getter
 
-    # list of reachable vertex sets
+    # list of reachable vertex id bitsets
     # i.e. step 0 contains all start vertices and step -1 contains all end vertices
     # step 1 contains all vertices with an edge from both step 0 and 2
     self._step_sets = []
 
+    # lists of the vertex ids, and flags, of the step sets, created when
+    # first needed
+    self._step_ids = []
+    self._step_flags = []
+
+    # list of {vertex_id:count} with the number of paths from each vertex
+    # of a step set to an end vertex, created when first needed
+    self._suffix_counts = None
+
+    # list of {vertex_id:(ids, cum_counts)} with the vertex ids of the
+    # neighbors of a vertex in the next step set, and their cumulative
+    # suffix counts, for uniform random paths. The start vertices and their
+    # cumulative suffix counts are stored under the key None of step 0.
+    self._cum_counts = None
+
     # true if there is no path from start to end vertices
     self._is_disconnected = False
 
@@ -106,7 +144,7 @@ class GraphPathFinder(object):
     """
     return self._is_disconnected
 
-  def get_random_path(self):
+  def get_random_path(self, uniform=False):
     """Get a random path from a start vertex to an end vertex.
 
     The random path is created by randomly selecting a vertex in the set of all
@@ -114,6 +152,17 @@ class GraphPathFinder(object):
     Then a neigbors neigbor is randomly selected, and so on until the set of
     start and the set of end vertices has been reached.
 
+    Paths created this way are not all equally likely. E.g. a vertex with only
+    one neighbor in the next step leads to fewer paths than its siblings, but
+    is as likely to be selected. If uniform is True, each vertex is instead
+    selected with a probability proportional to the number of paths from it
+    to an end vertex, starting at step 0. Every path is then equally likely.
+    The number of paths is counted the first time a uniform path is requested,
+    see count_paths.
+
+    Args:
+      uniform: If True, every path is equally likely.
+
     Returns:
       A tuple of vertices of length num_vertices, where first vertex is in the
       set of start vertices and the last vertex is in the set of end
@@ -122,24 +171,60 @@ class GraphPathFinder(object):
     """
     if self.is_disconnected():
       raise ValueError("Start and end vertices are disconnected.")
+    if uniform:
+      return self._get_uniform_random_path()
 
     # pick a random step set and a random vertex in that set to start with
     path = [None] * self._num_vertices
     start_step_index = random.randint(0, self._num_vertices - 1)
-    start_step_set = self._step_sets[start_step_index]
-    path[start_step_index] = random.choice(list(start_step_set))
+    path[start_step_index] = random.choice(self._get_step_ids(start_step_index))
 
     # fill earlier steps
     for i in reversed(range(1, start_step_index + 1)):
-      vertices = self._dedge.get_start_vertices(path[i]).intersection(self._step_sets[i - 1])
-      path[i - 1] = random.choice(list(vertices))
+      path[i - 1] = random.choice(self._filter_step_ids(
+          i - 1, self._dedge.get_start_vertex_ids(path[i])))
 
     # fill later steps
     for i in range(start_step_index, self._num_vertices - 1):
-      vertices = self._dedge.get_end_vertices(path[i]).intersection(self._step_sets[i + 1])
-      path[i + 1] = random.choice(list(vertices))
+      path[i + 1] = random.choice(self._filter_step_ids(
+          i + 1, self._dedge.get_end_vertex_ids(path[i])))
 
-    return tuple(path)
+    return tuple(self._dedge.get_vertex(vertex_id) for vertex_id in path)
+
+  def count_paths(self, start_weight_fn=None, end_weight_fn=None):
+    """Count the paths from a start vertex to an end vertex.
+
+    The number of paths from each vertex to an end vertex is calculated one
+    step at a time, from the last step to the first. The number for a vertex
+    is the sum of the numbers for its neighbors in the next step. The paths
+    are counted without being created, and the counts are exact however
+    large they get.
+
+    Paths can be weighted by their first and last vertices. A path is then
+    counted as many times as the product of the weights. E.g. weighting the
+    start vertices by how many leading n-grams each of them has an edge from
+    counts the paths extended by a leading n-gram.
+
+    Args:
+      start_weight_fn: Function returning the weight of a start vertex, or
+        None for a weight of one.
+      end_weight_fn: Function returning the weight of an end vertex, or None
+        for a weight of one.
+
+    Returns:
+      The number of paths, zero if the graph is disconnected.
+    """
+    if self.is_disconnected():
+      return 0
+    if end_weight_fn is None:
+      start_counts = self._get_suffix_counts()[0]
+    else:
+      start_counts = self._count_suffix_paths(end_weight_fn)[0]
+    if start_weight_fn is None:
+      return sum(start_counts.values())
+    get_vertex = self._dedge.get_vertex
+    return sum(count * start_weight_fn(get_vertex(vertex_id))
+        for (vertex_id, count) in start_counts.items())
 
   def get_all_paths(self):
     """Get an iterator of all possible paths from a start vertex to an end vertex.
@@ -163,7 +248,7 @@ class GraphPathFinder(object):
     # all unvisited sibling vertices are stored at each step from root
     steps_vertices = [None] * self._num_vertices
     # start by populating step 0 with all reachable start vertices
-    steps_vertices[step_index] = list(self._step_sets[0])
+    steps_vertices[step_index] = list(self._get_step_ids(0))
     # while there are still unvisited paths
     while step_index > -1:
       # get all remaining unvisited vertices at current step
@@ -175,16 +260,105 @@ class GraphPathFinder(object):
         # mark the visit of a vertex at the current step by removing it
         vertex = vertices.pop()
         # update the current path with the vertex
-        path[step_index] = vertex
+        path[step_index] = self._dedge.get_vertex(vertex)
         # yield path if visiting a leaf vertex
         if step_index == self._num_vertices - 1:
           yield tuple(path)
         # else populate next steps_vertices with all reachable vertices connected to vertex
         else:
-          steps_vertices[step_index + 1] = set(self._dedge.get_end_vertices(vertex)).\
-              intersection(self._step_sets[step_index + 1])
+          steps_vertices[step_index + 1] = self._filter_step_ids(
+              step_index + 1, self._dedge.get_end_vertex_ids(vertex))
           step_index += 1
 
+  def _get_step_ids(self, step_index):
+    """Get the, possibly cached, list of vertex ids of some step set."""
+    step_ids = self._step_ids[step_index]
+    if step_ids is None:
+      step_ids = self._step_ids[step_index] = bitset.get_ids(self._step_sets[step_index])
+    return step_ids
+
+  def _filter_step_ids(self, step_index, vertex_ids):
+    """Get the list of the vertex ids in some step set, out of vertex_ids."""
+    step_flags = self._step_flags[step_index]
+    if step_flags is None:
+      step_flags = self._step_flags[step_index] = bitset.to_flags(self._step_sets[step_index])
+    len_step_flags = len(step_flags)
+    return [vertex_id for vertex_id in vertex_ids
+        if vertex_id < len_step_flags and step_flags[vertex_id]]
+
+  def _get_uniform_random_path(self):
+    """Get a random path, every path being equally likely.
+
+    Each vertex is selected out of the candidates, i.e. the start vertices
+    or the neighbors of the previous vertex in the next step set, by drawing
+    a random number less than the total number of paths from the candidates
+    and bisecting the cumulative numbers of paths. A vertex is then selected
+    with a probability proportional to the number of paths from it.
+    """
+    if self._cum_counts is None:
+      self._cum_counts = [{} for _ in range(self._num_vertices)]
+    path = [None] * self._num_vertices
+    vertex_id = None
+    for i in range(self._num_vertices):
+      (ids, cum_counts) = self._get_cum_counts(i, vertex_id)
+      vertex_id = ids[bisect.bisect_right(cum_counts, random.randrange(cum_counts[-1]))]
+      path[i] = vertex_id
+    return tuple(self._dedge.get_vertex(vertex_id) for vertex_id in path)
+
+  def _get_cum_counts(self, step_index, prev_id):
+    """Get the, possibly cached, candidates for a vertex of a uniform random path.
+
+    Args:
+      step_index: The step of the vertex.
+      prev_id: The vertex id of the previous vertex, or None for step 0.
+
+    Returns:
+      Tuple of the list of the candidate vertex ids, and the list of their
+      cumulative numbers of paths to an end vertex.
+    """
+    step_cum_counts = self._cum_counts[step_index]
+    result = step_cum_counts.get(prev_id)
+    if result is None:
+      if prev_id is None:
+        ids = self._get_step_ids(0)
+      else:
+        ids = self._filter_step_ids(step_index, self._dedge.get_end_vertex_ids(prev_id))
+      counts = self._get_suffix_counts()[step_index]
+      cum_counts = list(_accumulate(counts[vertex_id] for vertex_id in ids))
+      result = step_cum_counts[prev_id] = (ids, cum_counts)
+    return result
+
+  def _get_suffix_counts(self):
+    """Get the, possibly cached, number of paths from each vertex to an end vertex."""
+    if self._suffix_counts is None:
+      self._suffix_counts = self._count_suffix_paths()
+    return self._suffix_counts
+
+  def _count_suffix_paths(self, end_weight_fn=None):
+    """Count the paths from each vertex to an end vertex.
+
+    Args:
+      end_weight_fn: Function returning the weight of an end vertex, or None
+        for a weight of one.
+
+    Returns:
+      List of {vertex_id:count} for each step, with the weighted number of
+      paths from the vertices of the step set to an end vertex.
+    """
+    last_ids = self._get_step_ids(self._num_vertices - 1)
+    if end_weight_fn is None:
+      last_counts = dict.fromkeys(last_ids, 1)
+    else:
+      get_vertex = self._dedge.get_vertex
+      last_counts = dict((vertex_id, end_weight_fn(get_vertex(vertex_id)))
+          for vertex_id in last_ids)
+    suffix_counts = [None] * (self._num_vertices - 1) + [last_counts]
+    for i in reversed(range(self._num_vertices - 1)):
+      step_ids = self._get_step_ids(i)
+      suffix_counts[i] = dict(zip(step_ids,
+          self._dedge.get_end_sums(step_ids, suffix_counts[i + 1])))
+    return suffix_counts
+
   def _build_step_sets(self):
     """Build the list of reachable vertex sets.
 
@@ -201,9 +375,12 @@ class GraphPathFinder(object):
     discovered during this process also.
     """
     # build step sets
-    self._step_sets = [set() for i in range(self._num_vertices)]
-    self._step_sets[0] = set(self._start_vertices).copy()
-    self._step_sets[-1] = set(self._end_vertices).copy()
+    get_vertex_id = self._dedge.get_vertex_id
+    self._step_sets = [0] * self._num_vertices
+    self._step_ids = [None] * self._num_vertices
+    self._step_flags = [None] * self._num_vertices
+    self._step_sets[0] = bitset.get_mask(get_vertex_id(v) for v in self._start_vertices)
+    self._step_sets[-1] = bitset.get_mask(get_vertex_id(v) for v in self._end_vertices)
 
     # build intermediate steps
     earlier_index = 0
@@ -214,34 +391,91 @@ class GraphPathFinder(object):
       later_set = self._step_sets[later_index]
 
       # the smallest set takes the next step
-      if len(earlier_set) < len(later_set):
-        new_set = _expand(earlier_set, self._dedge.get_end_vertices)
+      if bitset.count(earlier_set) < bitset.count(later_set):
+        new_set = self._dedge.get_end_mask(earlier_set)
         self._step_sets[earlier_index + 1] = new_set
         earlier_index += 1
       else:
-        new_set = _expand(later_set, self._dedge.get_start_vertices)
+        new_set = self._dedge.get_start_mask(later_set)
         self._step_sets[later_index - 1] = new_set
         later_index -= 1
 
       # if no new vertices then the graph is disconnected
-      if len(new_set) == 0:
+      if new_set == 0:
         self._is_disconnected = True
         return
 
     # filter later intermediate steps
     for i in range(earlier_index, self._num_vertices - 1):
-      expand_update(self._step_sets[i + 1], self._step_sets[i], self._dedge.get_end_vertices)
-      if len(self._step_sets[i + 1]) == 0:
+      self._step_sets[i + 1] &= self._dedge.get_end_mask(self._step_sets[i])
+      if self._step_sets[i + 1] == 0:
         self._is_disconnected = True
         return
 
     # filter early intermediate steps
     for i in reversed(range(1, later_index + 1)):
-      expand_update(self._step_sets[i - 1], self._step_sets[i], self._dedge.get_start_vertices)
-      if len(self._step_sets[i - 1]) == 0:
+      self._step_sets[i - 1] &= self._dedge.get_start_mask(self._step_sets[i])
+      if self._step_sets[i - 1] == 0:
         self._is_disconnected = True
         return
 
+class _VertexIdEdgeGetter(object):
+  """Vertex ids for an edge getter without them.
+
+  Vertices are assigned ids in the order they are first seen, and the
+  neighbor ids of each vertex are listed the first time they are needed.
+  """
+
+  def __init__(self, directed_edge_getter):
+    self._dedge = directed_edge_getter
+    self._vertices = []
+    self._vertex_ids = {}
+    self._end_ids_dict = {}
+    self._start_ids_dict = {}
+
+  def get_vertex_id(self, vertex):
+    """Get the, possibly new, vertex id of some vertex."""
+    vertex_id = self._vertex_ids.get(vertex)
+    if vertex_id is None:
+      vertex_id = self._vertex_ids[vertex] = len(self._vertices)
+      self._vertices.append(vertex)
+    return vertex_id
+
+  def get_vertex(self, vertex_id):
+    """Get the vertex of some vertex id."""
+    return self._vertices[vertex_id]
+
+  def get_end_vertex_ids(self, start_id):
+    """Get the ids of all end vertices with an edge from some start vertex."""
+    end_ids = self._end_ids_dict.get(start_id)
+    if end_ids is None:
+      end_ids = self._end_ids_dict[start_id] = [self.get_vertex_id(v)
+          for v in self._dedge.get_end_vertices(self._vertices[start_id])]
+    return end_ids
+
+  def get_start_vertex_ids(self, end_id):
+    """Get the ids of all start vertices with an edge to some end vertex."""
+    start_ids = self._start_ids_dict.get(end_id)
+    if start_ids is None:
+      start_ids = self._start_ids_dict[end_id] = [self.get_vertex_id(v)
+          for v in self._dedge.get_start_vertices(self._vertices[end_id])]
+    return start_ids
+
+  def get_end_sums(self, start_ids, end_values):
+    """Get the sum of the values of the end vertices of some start vertices."""
+    return [sum(end_values.get(end_id, 0) for end_id in self.get_end_vertex_ids(start_id))
+        for start_id in start_ids]
+
+  def get_end_mask(self, start_mask):
+    """Get all end vertices with an edge from any start vertex in a bitset."""
+    return bitset.get_mask(itertools.chain.from_iterable(
+        self.get_end_vertex_ids(start_id) for start_id in bitset.get_ids(start_mask)))
+
+  def get_start_mask(self, end_mask):
+    """Get all start vertices with an edge to any end vertex in a bitset."""
+    return bitset.get_mask(itertools.chain.from_iterable(
+        self.get_start_vertex_ids(end_id) for end_id in bitset.get_ids(end_mask)))
+
 def expand_update(the_set, other_set, expand_fn):
   """Updates a set with the intersection of the expanded other set.
 
@@ -0,0 +1,200 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Christofer Hedbrandh
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__author__ = 'Christofer Hedbrandh (chedbrandh@gmail.com)'
+__copyright__ = 'Copyright (c) 2015 Christofer Hedbrandh'
+
+import array
+import heapq
+import math
+
+class CountMinSketch(object):
+  """Approximate frequencies of items in a fixed amount of memory.
+
+  Each item is hashed to one counter in each of depth rows of width counters.
+  The estimate of an item is the least of its counters, which is never
+  below its frequency, and with probability 1 - delta at most epsilon times
+  the total frequency above it, for width = e / epsilon and
+  depth = ln(1 / delta).
+
+  Hashes are those of the Python process, so sketches can not be compared
+  across processes.
+  """
+
+  def __init__(self, epsilon, delta):
+    """Creates an empty sketch with some error bounds.
+
+    Args:
+      epsilon: Relative error of estimates, in (0, 1).
+      delta: Probability of an estimate exceeding the relative error, in (0, 1).
+    """
+    if not 0 < epsilon < 1 or not 0 < delta < 1:
+      raise ValueError("Epsilon and delta must be between zero and one.")
+    self._width = int(math.ceil(math.e / epsilon))
+    self._depth = int(math.ceil(math.log(1.0 / delta)))
+    self._counters = array.array('d', [0.0]) * (self._width * self._depth)
+
+  def _get_counter_indices(self, item):
+    """Get the index of the counter of an item in every row."""
+    # double hashing, row i uses hash1 + i * hash2
+    hash1 = hash(item)
+    hash2 = hash((item, self._width)) | 1
+    width = self._width
+    return [row * width + (hash1 + row * hash2) % width for row in range(self._depth)]
+
+  def add(self, item, freq):
+    """Add some frequency of an item and return its new estimate."""
+    counters = self._counters
+    estimate = None
+    for i in self._get_counter_indices(item):
+      counters[i] += freq
+      if estimate is None or counters[i] < estimate:
+        estimate = counters[i]
+    return estimate
+
+  def estimate(self, item):
+    """Get the estimated frequency of an item."""
+    counters = self._counters
+    return min(counters[i] for i in self._get_counter_indices(item))
+
+  def copy(self):
+    """Get a copy of the sketch."""
+    result = CountMinSketch.__new__(CountMinSketch)
+    result._width = self._width
+    result._depth = self._depth
+    result._counters = array.array('d', self._counters)
+    return result
+
+class HeavyHitters(object):
+  """The most frequent items, with approximate frequencies, in bounded memory.
+
+  At most capacity items are tracked. Until capacity distinct items have
+  been added, frequencies are exact and no sketch is allocated. After that
+  all frequencies are also added to a CountMinSketch, and an untracked item
+  replaces the least frequent tracked item once its estimate exceeds the
+  frequency of that item. Tracked frequencies are then estimates, never
+  below the true frequencies.
+
+  Provides the parts of the dictionary interface used for reading
+  frequencies, i.e. an item to frequency dictionary of the tracked items.
+
+  E.g.
+  With capacity 2, adding "a", "b", "a", "c" tracks {"a":2, "b":1}. Adding
+  "c" once more tracks {"a":2, "c":2}, barring hash collisions.
+  """
+
+  def __init__(self, capacity, epsilon, delta):
+    """Creates an empty table.
+
+    Args:
+      capacity: Maximum number of tracked items.
+      epsilon: Relative error of the sketch. See CountMinSketch.
+      delta: Probability of exceeding the relative error. See CountMinSketch.
+    """
+    if capacity < 1:
+      raise ValueError("Capacity must be at least one.")
+    self._capacity = capacity
+    self._epsilon = epsilon
+    self._delta = delta
+    # {item:freq} of tracked items
+    self._freqs = {}
+    # heap of (freq, item), possibly stale, of tracked items
+    self._heap = []
+    # CountMinSketch of all items, allocated once capacity is reached
+    self._sketch = None
+
+  def add(self, item, freq):
+    """Add some frequency of an item.
+
+    Args:
+      item: Hashable item.
+      freq: Frequency of the item. Must be greater than zero.
+    """
+    if self._sketch is None:
+      if item in self._freqs or len(self._freqs) < self._capacity:
+        self._freqs[item] = self._freqs.get(item, 0) + freq
+        return
+      self._init_sketch()
+    estimate = self._sketch.add(item, freq)
+    if item in self._freqs:
+      self._freqs[item] += freq
+      self._push(item)
+      return
+    (min_freq, min_item) = self._get_min()
+    if estimate > min_freq:
+      del self._freqs[min_item]
+      heapq.heappop(self._heap)
+      self._freqs[item] = estimate
+      self._push(item)
+
+  def _init_sketch(self):
+    """Allocate the sketch and add the exact frequencies of all tracked items."""
+    self._sketch = CountMinSketch(self._epsilon, self._delta)
+    for (item, freq) in self._freqs.items():
+      self._sketch.add(item, freq)
+    self._heap = [(freq, item) for (item, freq) in self._freqs.items()]
+    heapq.heapify(self._heap)
+
+  def _push(self, item):
+    """Push the current frequency of a tracked item onto the heap."""
+    heapq.heappush(self._heap, (self._freqs[item], item))
+    # discard stale entries once they outnumber the tracked items
+    if len(self._heap) > 2 * self._capacity:
+      self._heap = [(freq, item) for (item, freq) in self._freqs.items()]
+      heapq.heapify(self._heap)
+
+  def _get_min(self):
+    """Get (freq, item) of the least frequent tracked item."""
+    heap = self._heap
+    while self._freqs.get(heap[0][1]) != heap[0][0]:
+      heapq.heappop(heap)
+    return heap[0]
+
+  def __len__(self):
+    return len(self._freqs)
+
+  def __contains__(self, item):
+    return item in self._freqs
+
+  def get(self, item, default=None):
+    """Get the frequency of a tracked item, or default."""
+    return self._freqs.get(item, default)
+
+  def items(self):
+    """Get tuples of (item, freq) of all tracked items."""
+    return self._freqs.items()
+
+  def values(self):
+    """Get the frequencies of all tracked items."""
+    return self._freqs.values()
+
+  def is_exact(self):
+    """Returns True if no item has been discarded, i.e. frequencies are exact."""
+    return self._sketch is None
+
+  def copy(self):
+    """Get a copy of the table."""
+    result = HeavyHitters(self._capacity, self._epsilon, self._delta)
+    result._freqs = self._freqs.copy()
+    result._heap = list(self._heap)
+    result._sketch = None if self._sketch is None else self._sketch.copy()
+    return result
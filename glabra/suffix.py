@@ -0,0 +1,233 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Christofer Hedbrandh
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__author__ = 'Christofer Hedbrandh (chedbrandh@gmail.com)'
+__copyright__ = 'Copyright (c) 2015 Christofer Hedbrandh'
+
+import bisect
+import operator
+
+# position of the n-grams of a node not occurring as leading or trailing n-grams
+_NO_POSITION = float("inf")
+
+def count_ngrams(seqs_freqs, ngram_lengths=None):
+  """Count n-grams, leading and trailing n-grams using a suffix array.
+
+  The sequences are concatenated, each followed by a unique separator, and a
+  suffix array and an LCP array are built over the concatenation. Every
+  distinct n-gram then corresponds to an LCP interval, i.e. a range of
+  suffixes sharing a common prefix, and the frequency of the n-gram is the
+  sum of the frequencies of the suffixes in the interval. An interval
+  provides the n-grams of all lengths between the longest common prefix of
+  its parent interval and its own, so the intervals are traversed once for
+  all n-gram lengths, and an n-gram is sliced only once however many times
+  it occurs.
+
+  n-grams are ordered by first occurrence, just as if they had been added
+  one sequence and position at a time. Frequencies are identical to adding
+  them one at a time, except for floating point rounding since they are
+  summed in a different order.
+
+  E.g.
+  For [("abab", 1)] the suffixes "ab" and "abab" form an interval with a
+  longest common prefix of 2, and its parent interval, also holding the
+  suffixes "b" and "bab", has a longest common prefix of 0. The interval
+  therefore provides "a" and "ab", both with frequency 2.
+
+  Args:
+    seqs_freqs: Tuples of (sequence, frequency) of distinct sequences.
+    ngram_lengths: Lengths of n-grams to count. If None, n-grams of all
+      lengths are counted.
+
+  Returns:
+    Tuple of dictionaries ({len_ng:{ng:freq}}, {len_ng:{ng:freq}},
+    {len_ng:{ng:freq}}) of n-grams, leading n-grams and trailing n-grams.
+  """
+  seqs_freqs = list(seqs_freqs)
+  lengths = None if ngram_lengths is None else sorted(set(ngram_lengths))
+
+  # concatenate element ids, and separators as unique negative ids
+  text = []
+  # for every position: the sequence index, offset, and length left of the sequence
+  pos_seqs = []
+  pos_offsets = []
+  pos_avails = []
+  elem_ids = {}
+  for (seq_index, (seq, _)) in enumerate(seqs_freqs):
+    for elem in seq:
+      text.append(elem_ids.setdefault(elem, len(elem_ids)))
+    text.append(-seq_index - 1)
+    pos_seqs.extend([seq_index] * (len(seq) + 1))
+    pos_offsets.extend(range(len(seq) + 1))
+    pos_avails.extend(range(len(seq), -1, -1))
+
+  suffix_array = get_suffix_array(text)
+  lcps = get_lcp_array(text, suffix_array)
+
+  # {len_ng:[(first position, ng, freq)]}
+  ngrams = {}
+  leading = {}
+  trailing = {}
+
+  def emit(lower_len, upper_len, node):
+    """Add the n-grams of lengths in (lower_len, upper_len] of an interval."""
+    (freq, pos, seq_index, offset, lead_freq, lead_pos, trail_freq, trail_pos) = node
+    seq = seqs_freqs[seq_index][0]
+    if lengths is None:
+      node_lengths = range(lower_len + 1, upper_len + 1)
+    else:
+      node_lengths = lengths[bisect.bisect_right(lengths, lower_len) :
+          bisect.bisect_right(lengths, upper_len)]
+    for len_ng in node_lengths:
+      ng = seq[offset : offset + len_ng]
+      ngrams.setdefault(len_ng, []).append((pos, ng, freq))
+      if lead_freq:
+        leading.setdefault(len_ng, []).append((lead_pos, ng, lead_freq))
+      if trail_freq and len_ng == upper_len:
+        trailing.setdefault(len_ng, []).append((trail_pos, ng, trail_freq))
+
+  def add(node, child):
+    """Add the frequencies of a child node to an interval node."""
+    node[0] += child[0]
+    if child[1] < node[1]:
+      node[1:4] = child[1:4]
+    node[4] += child[4]
+    node[5] = min(node[5], child[5])
+    node[6] += child[6]
+    node[7] = min(node[7], child[7])
+
+  # traverse LCP intervals bottom up, stack entries being [lcp, node]
+  stack = [[0, _get_empty_node()]]
+  for k in range(1, len(text) + 1):
+    lcp = lcps[k] if k < len(text) else 0
+    pos = suffix_array[k - 1]
+    avail = pos_avails[pos]
+
+    # separators have no frequency
+    last = _get_empty_node()
+    if avail > 0:
+      freq = seqs_freqs[pos_seqs[pos]][1]
+      last[0:4] = [freq, pos, pos_seqs[pos], pos_offsets[pos]]
+      last[6:8] = [freq, pos]
+      if pos_offsets[pos] == 0:
+        last[4:6] = [freq, pos]
+
+    # the suffix alone provides the n-grams it does not share with its
+    # neighbors, the longest of which is trailing, else it is trailing in the
+    # first interval it joins
+    lower_len = max(lcps[k - 1], lcp)
+    if avail > lower_len:
+      emit(lower_len, avail, last)
+      last[6:8] = [0, _NO_POSITION]
+
+    while lcp < stack[-1][0]:
+      (node_lcp, node) = stack.pop()
+      add(node, last)
+      emit(max(lcp, stack[-1][0]), node_lcp, node)
+      node[6:8] = [0, _NO_POSITION]
+      last = node
+    if lcp > stack[-1][0]:
+      stack.append([lcp, last])
+    else:
+      add(stack[-1][1], last)
+
+  return tuple(_get_freq_dicts(kind_ngrams) for kind_ngrams in [ngrams, leading, trailing])
+
+def get_suffix_array(text):
+  """Get the suffix array of a list of integers by prefix doubling.
+
+  Suffixes are sorted by their first element, and then repeatedly by their
+  first 2, 4, 8, ... elements, using the ranks of the previous round, until
+  all suffixes have distinct ranks.
+
+  Args:
+    text: List of integers.
+
+  Returns:
+    List of the positions of all suffixes, sorted.
+  """
+  len_text = len(text)
+  symbols = dict((symbol, rank) for (rank, symbol) in enumerate(sorted(set(text))))
+  ranks = [symbols[symbol] for symbol in text]
+  suffix_array = sorted(range(len_text), key=ranks.__getitem__)
+  prefix_len = 1
+  while len_text > 0 and ranks[suffix_array[-1]] < len_text - 1:
+    keys = [rank * (len_text + 1) for rank in ranks]
+    for i in range(len_text - prefix_len):
+      keys[i] += ranks[i + prefix_len] + 1
+    suffix_array.sort(key=keys.__getitem__)
+    rank = 0
+    for k in range(1, len_text):
+      if keys[suffix_array[k]] != keys[suffix_array[k - 1]]:
+        rank += 1
+      ranks[suffix_array[k]] = rank
+    ranks[suffix_array[0]] = 0
+    prefix_len *= 2
+  return suffix_array
+
+def get_lcp_array(text, suffix_array):
+  """Get the longest common prefixes of adjacent suffixes with Kasai's algorithm.
+
+  Args:
+    text: List of integers.
+    suffix_array: Suffix array of text.
+
+  Returns:
+    List where element k is the length of the longest common prefix of the
+    suffixes suffix_array[k - 1] and suffix_array[k], and element 0 is 0.
+  """
+  len_text = len(text)
+  ranks = [0] * len_text
+  for (k, pos) in enumerate(suffix_array):
+    ranks[pos] = k
+  lcps = [0] * len_text
+  lcp = 0
+  for pos in range(len_text):
+    if ranks[pos] == 0:
+      lcp = 0
+      continue
+    other_pos = suffix_array[ranks[pos] - 1]
+    while pos + lcp < len_text and other_pos + lcp < len_text and \
+        text[pos + lcp] == text[other_pos + lcp]:
+      lcp += 1
+    lcps[ranks[pos]] = lcp
+    if lcp > 0:
+      lcp -= 1
+  return lcps
+
+def _get_empty_node():
+  """Get a node without frequency.
+
+  A node is a list [freq, pos, seq_index, offset, lead_freq, lead_pos,
+  trail_freq, trail_pos] where pos is the first position of the node's
+  n-grams, with seq_index and offset locating it in its sequence.
+  """
+  return [0, _NO_POSITION, 0, 0, 0, _NO_POSITION, 0, _NO_POSITION]
+
+def _get_freq_dicts(kind_ngrams):
+  """Order n-grams by first occurrence into dicts {len_ng:{ng:freq}}."""
+  result = {}
+  for (len_ng, entries) in sorted(kind_ngrams.items()):
+    # first positions of distinct n-grams of the same length are distinct
+    entries.sort(key=operator.itemgetter(0))
+    result[len_ng] = dict((ng, freq) for (_, ng, freq) in entries)
+  return result
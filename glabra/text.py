@@ -24,16 +24,29 @@ __author__ = 'Christofer Hedbrandh (chedbrandh@gmail.com)'
 __copyright__ = 'Copyright (c) 2015 Christofer Hedbrandh'
 
 import re
+import io
+import os
 import random
 import codecs
+import itertools
+import pickle
+import shutil
+import tempfile
+import multiprocessing
 
 from glabra import buckets
 from glabra import create
 from glabra import analyze
+from glabra import vocabulary as vocabulary_module
 
 # number of bytes to read from file at a time
 _BUFFER_SIZE = 2**20
 
+# minimum number of bytes of a file chunk analyzed by one process
+_MIN_CHUNK_SIZE = 2**20
+# number of chunks per process a file is split into, for balancing the load
+_CHUNKS_PER_PROCESS = 4
+
 # regex for parsing bounds strings
 BOUNDS_REGEX = re.compile(r"^(\d+):(100|\d\d?),(100|\d\d?)$")
 
@@ -48,6 +61,9 @@ class TextGenerator(object):
 
   A post processing function is typically useful for sentences and allows for
   turning a list of words into an actual sentence string.
+
+  If the SequenceAnalyzer has a Vocabulary, texts are generated encoded, and
+  decoded just before post processing.
   """
 
   def __init__(self, bounds, sequence_analyzer, post_processing_fun=None):
@@ -90,6 +106,18 @@ class TextGenerator(object):
     """If no text can be created from the given bounds and analyzers."""
     return len(self._seq_creator_dict) == 0
 
+  def count_texts(self):
+    """Count the texts that can be generated, without generating them.
+
+    Texts in the sequence analyzers are included in the counts, i.e. the
+    counts are of the texts returned by get_all_texts with unique=False.
+
+    Returns:
+      Dictionary with text lengths (keys) and numbers of texts (values).
+    """
+    return dict((len_seq, seq_creator.count_sequences())
+        for (len_seq, seq_creator) in self._seq_creator_dict.items())
+
   def get_all_texts(self, unique=False):
     """Generate all texts of all lengths appearing in the training data.
 
@@ -167,13 +195,19 @@ class TextGenerator(object):
     creators (values), and self._seq_freq_dict with sequence lenghts (keys) and
     sequence frequenceis (values).
     """
+    # edges and start/end vertices are the same for all sequence lengths
+    seq_graph = create.SequenceGraph(
+      self._ngrams_leading, self._ngrams, self._ngrams_trailing)
+    if seq_graph.is_disconnected():
+      return
     for (len_seq, seq_freq) in self._sa.get_sequence_length_freq_dict().items():
       # ignore sequence lengths that are too short
       if len_seq < self._min_len:
         continue
       # create sequence creator for length len_seq
       seq_creator = create.SequenceCreator(
-        len_seq, self._ngrams_leading, self._ngrams, self._ngrams_trailing)
+        len_seq, self._ngrams_leading, self._ngrams, self._ngrams_trailing,
+        sequence_graph=seq_graph)
       # ignore sequence lengths that that can't create sequences
       if seq_creator.is_disconnected():
         continue
@@ -195,13 +229,17 @@ class TextGenerator(object):
         current_cum_freq += freq
 
   def _post_process_text(self, text):
-    """Apply the post processing function to the created text."""
+    """Decode the created text and apply the post processing function to it."""
+    vocabulary = self._sa.get_vocabulary()
+    if vocabulary is not None:
+      text = vocabulary.decode(text)
     if self._post_processing_fun == None:
       return text
     return self._post_processing_fun(text)
 
 def get_sequence_analyzer(filename, sequence_delimiter_pattern,
-    element_delimiter_pattern=None, frequency_grouping_pattern=None):
+    element_delimiter_pattern=None, frequency_grouping_pattern=None,
+    ngram_lengths=None, vocabulary=None, processes=1):
   """Parses and analyzes a text file.
 
   If the intention is to generate words from a text file, "sequences" in this
@@ -244,10 +282,141 @@ def get_sequence_analyzer(filename, sequence_delimiter_pattern,
     sequence_delimiter_pattern: Pattern for separating sequences.
     element_delimiter_pattern: Pattern for separating sequence elements.
     frequency_grouping_pattern: Pattern for finding sequence frequency.
+    ngram_lengths: Lengths of n-grams to count up front, e.g. the lengths of
+      some bounds. If None, n-grams of all lengths are counted.
+    vocabulary: Vocabulary to encode sequences with, typically shared by the
+      analyzers of all files. If None, sequences are not encoded.
+    processes: Number of processes to parse and analyze the file with. See
+      get_sequence_analyzers.
 
   Returns:
     SequenceAnalyzer of text file.
   """
+  if processes > 1:
+    return get_sequence_analyzers([filename], sequence_delimiter_pattern,
+        element_delimiter_pattern, frequency_grouping_pattern, ngram_lengths,
+        vocabulary, processes)[0]
+
+  # read, parse, and analyze the specified file
+  with codecs.open(filename, 'r', encoding='utf8') as f:
+    seq_freqs = _parse_file(f, sequence_delimiter_pattern,
+        element_delimiter_pattern, frequency_grouping_pattern)
+
+  # raise error if no sequences were retrieved from the file
+  if len(seq_freqs) == 0:
+    raise ValueError("File %s provided no data." % filename)
+
+  # return an analyzer of all sequences with their frequencies
+  return analyze.SequenceAnalyzer(
+      seq_freqs, ngram_lengths=ngram_lengths, vocabulary=vocabulary)
+
+def get_sequence_analyzers(filenames, sequence_delimiter_pattern,
+    element_delimiter_pattern=None, frequency_grouping_pattern=None,
+    ngram_lengths=None, vocabulary=None, processes=None, temp_dir=None):
+  """Parses and analyzes text files with a pool of processes.
+
+  Each file is split into chunks at sequence delimiters, and the chunks of
+  all files are parsed and analyzed by the processes of a pool, one partial
+  SequenceAnalyzer per chunk. The partial analyzers of each file are then
+  added pairwise, also by the pool, until one analyzer per file remains.
+
+  Partial analyzers are passed between processes as pickle files in a
+  temporary directory, so the parent process only handles file names and
+  translation tables, not the analyzers themselves, until the final
+  analyzer of each file is loaded.
+
+  Sequence delimiters are assumed not to overlap chunk boundaries, just as
+  they are assumed not to overlap the buffers files are read with. The
+  analyzers are then the same as those of get_sequence_analyzer, except for
+  floating point rounding of frequencies.
+
+  If a Vocabulary is provided, each process encodes sequences with its own
+  vocabulary, and the partial analyzers are re-encoded with the provided
+  Vocabulary before they are added. Elements are added to the Vocabulary in
+  the order they first occur in the files.
+
+  Args:
+    filenames: Names of files to parse.
+    sequence_delimiter_pattern: Pattern for separating sequences.
+    element_delimiter_pattern: Pattern for separating sequence elements.
+    frequency_grouping_pattern: Pattern for finding sequence frequency.
+    ngram_lengths: Lengths of n-grams to count up front. If None, n-grams of
+      all lengths are counted.
+    vocabulary: Vocabulary to encode sequences with. If None, sequences are
+      not encoded.
+    processes: Number of processes. If None, the number of CPUs is used.
+    temp_dir: Directory to create the temporary directory of partial
+      analyzers in. If None, the system default is used.
+
+  Returns:
+    List of SequenceAnalyzers, one for each file.
+  """
+  processes = processes or multiprocessing.cpu_count()
+  seq_delim = re.compile(sequence_delimiter_pattern)
+  ngram_lengths = None if ngram_lengths is None else list(ngram_lengths)
+
+  # split files into chunks, [(file index, (start, end))]
+  chunks = []
+  for (file_index, filename) in enumerate(filenames):
+    for chunk in _get_chunks(filename, seq_delim, processes * _CHUNKS_PER_PROCESS):
+      chunks.append((file_index, chunk))
+
+  temp_dir = tempfile.mkdtemp(prefix="glabra-", dir=temp_dir)
+  partial_filenames = (os.path.join(temp_dir, "%d.pickle" % i) for i in itertools.count())
+  pool = multiprocessing.Pool(processes)
+  try:
+    results = pool.map(_analyze_chunk,
+        [(filenames[file_index], start, end, sequence_delimiter_pattern,
+            element_delimiter_pattern, frequency_grouping_pattern, ngram_lengths,
+            vocabulary is not None, next(partial_filenames))
+        for (file_index, (start, end)) in chunks])
+
+    # [[(partial analyzer file name, translation table)]] for each file, in file order
+    partials = [[] for _ in filenames]
+    for ((file_index, _), (partial_filename, elements)) in zip(chunks, results):
+      if partial_filename is None:
+        continue
+      table = None if vocabulary is None else vocabulary.get_translation(elements)
+      partials[file_index].append((partial_filename, table))
+    for (filename, file_partials) in zip(filenames, partials):
+      if len(file_partials) == 0:
+        raise ValueError("File %s provided no data." % filename)
+
+    # tree reduction of the partial analyzers of all files
+    while any(len(file_partials) > 1 for file_partials in partials):
+      pairs = []
+      for file_partials in partials:
+        pairs.extend((first, second, next(partial_filenames))
+            for (first, second) in zip(file_partials[0::2], file_partials[1::2]))
+      sums = iter(pool.map(_add_partials, pairs))
+      partials = [[(next(sums), None) for _ in range(len(file_partials) // 2)] +
+          file_partials[len(file_partials) - len(file_partials) % 2:]
+          for file_partials in partials]
+
+    result = []
+    for [(partial_filename, table)] in partials:
+      sa = _load_partial(partial_filename)
+      sa.reencode(vocabulary, table)
+      result.append(sa)
+    return result
+  finally:
+    pool.close()
+    pool.join()
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+def _parse_file(f, sequence_delimiter_pattern, element_delimiter_pattern,
+    frequency_grouping_pattern):
+  """Parses a file into sequences and their frequencies.
+
+  Args:
+    f: File to parse.
+    sequence_delimiter_pattern: Pattern for separating sequences.
+    element_delimiter_pattern: Pattern for separating sequence elements.
+    frequency_grouping_pattern: Pattern for finding sequence frequency.
+
+  Returns:
+    List of tuples (sequence, frequency).
+  """
   # compile delimiter patterns
   seq_delim = re.compile(sequence_delimiter_pattern)
   elem_delim = None if element_delimiter_pattern is None \
@@ -258,38 +427,157 @@ def get_sequence_analyzer(filename, sequence_delimiter_pattern,
   # tuples of sequences and their frequencies
   seq_freqs = []
 
-  # read, parse, and analyze the specified file
-  with codecs.open(filename, 'r', encoding='utf8') as f:
+  # parse file in to sequences
+  seqs = _split_file(f, seq_delim)
 
-    # parse file in to sequences
-    seqs = _split_file(f, seq_delim)
+  # iterate through all sequence and potentially parse them further
+  for seq in seqs:
+    freq = 1.0
 
-    # iterate through all sequence and potentially parse them further
-    for seq in seqs:
-      freq = 1.0
+    # if file contains a frequency pattern
+    if not freq_grouping == None:
+      matching = freq_grouping.match(seq)
+      # ignore sequence if pattern matching fails
+      if matching == None:
+        continue
+      seq = matching.group(1)
+      freq = float(matching.group(2))
 
-      # if file contains a frequency pattern
-      if not freq_grouping == None:
-        matching = freq_grouping.match(seq)
-        # ignore sequence if pattern matching fails
-        if matching == None:
-          continue
-        seq = matching.group(1)
-        freq = float(matching.group(2))
+    # parse sequence if element delimiter is specified
+    if not elem_delim == None:
+      seq = _parse_seq(seq, elem_delim)
 
-      # parse sequence if element delimiter is specified
-      if not elem_delim == None:
-        seq = _parse_seq(seq, elem_delim)
+    # add sequence with its frequency to the list
+    seq_freqs.append((seq, freq))
 
-      # add sequence with its frequency to the list
-      seq_freqs.append((seq, freq))
+  return seq_freqs
 
-  # raise error if no sequences were retrieved from the file
+def _get_chunks(filename, seq_delim, max_chunks):
+  """Splits a file into chunks ending right after sequence delimiters.
+
+  Args:
+    filename: Name of file to split.
+    seq_delim: Compiled pattern for separating sequences.
+    max_chunks: Maximum number of chunks.
+
+  Returns:
+    List of tuples (start, end) of byte offsets of the chunks.
+  """
+  size = os.path.getsize(filename)
+  num_chunks = max(1, min(max_chunks, size // _MIN_CHUNK_SIZE))
+  offsets = [0]
+  with open(filename, 'rb') as f:
+    for k in range(1, num_chunks):
+      offset = _find_delimiter_end(f, max(offsets[-1], size * k // num_chunks), seq_delim)
+      if offset < size:
+        offsets.append(offset)
+  offsets.append(size)
+  return list(zip(offsets[:-1], offsets[1:]))
+
+def _find_delimiter_end(f, offset, seq_delim):
+  """Get the byte offset right after the first sequence delimiter at or after offset.
+
+  Args:
+    f: UTF-8 encoded file, opened in binary mode.
+    offset: Byte offset to search from.
+    seq_delim: Compiled pattern for separating sequences.
+
+  Returns:
+    Byte offset of the end of the delimiter, or of the file if none is found.
+
+  Raises:
+    UnicodeDecodeError: If the file is not valid UTF-8 after offset, just as
+      the chunk would fail to decode in _analyze_chunk.
+  """
+  f.seek(offset)
+  data = f.read(_BUFFER_SIZE)
+  # skip UTF-8 continuation bytes of a character started before offset
+  skip = 0
+  while skip < len(data) and ord(data[skip:skip + 1]) & 0xC0 == 0x80:
+    skip += 1
+  offset += skip
+  # decode strictly, so that text maps back to the same number of bytes
+  decoder = codecs.getincrementaldecoder('utf8')()
+  text = decoder.decode(data[skip:])
+  while True:
+    match = seq_delim.search(text)
+    if match is not None and (match.end() < len(text) or data == b""):
+      return offset + len(text[:match.end()].encode('utf8'))
+    data = f.read(_BUFFER_SIZE)
+    if data == b"":
+      if match is None:
+        return f.tell()
+      continue
+    text += decoder.decode(data)
+
+def _analyze_chunk(args):
+  """Parses and analyzes a chunk of a file, in a worker process.
+
+  Args:
+    args: Tuple (filename, start, end, sequence_delimiter_pattern,
+      element_delimiter_pattern, frequency_grouping_pattern, ngram_lengths,
+      encode, partial_filename) where encode is True if sequences are to be
+      encoded, and partial_filename is the name of the file to save the
+      partial analyzer to.
+
+  Returns:
+    Tuple (partial_filename, elements) where elements are the elements of
+    the Vocabulary the sequences are encoded with, or None. The file name is
+    None if the chunk provided no data.
+  """
+  (filename, start, end, sequence_delimiter_pattern, element_delimiter_pattern,
+      frequency_grouping_pattern, ngram_lengths, encode, partial_filename) = args
+  with open(filename, 'rb') as f:
+    f.seek(start)
+    chunk_text = f.read(end - start).decode('utf8')
+  seq_freqs = _parse_file(io.StringIO(chunk_text), sequence_delimiter_pattern,
+      element_delimiter_pattern, frequency_grouping_pattern)
   if len(seq_freqs) == 0:
-    raise ValueError("File %s provided no data." % filename)
+    return (None, None)
+  vocabulary = vocabulary_module.Vocabulary() if encode else None
+  sa = analyze.SequenceAnalyzer(
+      seq_freqs, ngram_lengths=ngram_lengths, vocabulary=vocabulary)
+  if vocabulary is not None:
+    # the Vocabulary is replaced when the analyzer is re-encoded
+    sa.reencode(None)
+  _dump_partial(sa, partial_filename)
+  return (partial_filename, None if vocabulary is None else vocabulary.get_elements())
+
+def _add_partials(args):
+  """Adds two partial analyzers, re-encoding them first, in a worker process.
+
+  The partial analyzers are loaded from, and their sum saved to, pickle
+  files, and the files of the added analyzers are removed.
 
-  # return an analyzer of all sequences with their frequencies
-  return analyze.SequenceAnalyzer(seq_freqs)
+  Args:
+    args: Tuple ((filename, table), (other_filename, other_table),
+      sum_filename) of file names of partial analyzers, translation tables to
+      the shared Vocabulary, or None, and the file name to save the sum to.
+
+  Returns:
+    sum_filename, the sum being encoded with the shared Vocabulary if any.
+  """
+  ((filename, table), (other_filename, other_table), sum_filename) = args
+  sa = _load_partial(filename)
+  sa.reencode(None, table)
+  other_sa = _load_partial(other_filename)
+  other_sa.reencode(None, other_table)
+  sa += other_sa
+  del other_sa
+  _dump_partial(sa, sum_filename)
+  os.remove(filename)
+  os.remove(other_filename)
+  return sum_filename
+
+def _dump_partial(sa, filename):
+  """Saves a partial analyzer to a pickle file."""
+  with open(filename, 'wb') as f:
+    pickle.dump(sa, f, pickle.HIGHEST_PROTOCOL)
+
+def _load_partial(filename):
+  """Loads a partial analyzer from a pickle file."""
+  with open(filename, 'rb') as f:
+    return pickle.load(f)
 
 def parse_bounds(str_bounds):
   """Parse bound strings.
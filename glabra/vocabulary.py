@@ -0,0 +1,139 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Christofer Hedbrandh
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+__author__ = 'Christofer Hedbrandh (chedbrandh@gmail.com)'
+__copyright__ = 'Copyright (c) 2015 Christofer Hedbrandh'
+
+import sys
+
+# for python 2 and python 3 compatibility
+if sys.version_info < (3,):
+    chr = unichr
+
+# code points reserved for surrogates can not be used for element ids
+_SURROGATES_START = 0xD800
+_SURROGATES_END = 0xE000
+# narrow python 2 builds only have single characters up to 0xFFFF, and
+# larger code points would be surrogate pairs of length two
+_MAX_CODE_POINT = min(sys.maxunicode, 0x10FFFF)
+
+class Vocabulary(object):
+  """Interns sequence elements as small integer ids.
+
+  Sequences of elements, e.g. sentences as tuples of words, are stored and
+  hashed over and over as n-grams in analyzers, edge getters, and path
+  finders. A Vocabulary assigns each distinct element an id, and encodes a
+  sequence as a string with one character per element, the code point of
+  the character being the element id.
+
+  An encoded sequence is a single compact object that hashes fast, and its
+  n-grams are plain string slices. Encoded sequences can therefore be used
+  anywhere the original sequences can, and are only decoded when presented.
+
+  A vocabulary holds at most 1,112,064 elements, or 63,488 on narrow Python 2
+  builds, where characters are limited to code points up to 0xFFFF.
+
+  E.g.
+  vocabulary.encode(("to", "be", "or", "not", "to", "be")) returns
+  u"\\x00\\x01\\x02\\x03\\x00\\x01", and decoding it gives the original tuple.
+  """
+
+  def __init__(self, elements=None):
+    """Creates a vocabulary, empty or holding some elements.
+
+    Args:
+      elements: Distinct elements, assigned ids in order. If None, the
+        vocabulary is empty.
+    """
+    # element for each id
+    self._elements = []
+    # {elem:char} where char is the encoded element
+    self._chars = {}
+    self.encode(elements or [])
+
+  def __len__(self):
+    """Number of distinct elements in the vocabulary."""
+    return len(self._elements)
+
+  def get_elements(self):
+    """Get all elements, ordered by id."""
+    return list(self._elements)
+
+  def encode(self, seq):
+    """Encode a sequence of elements, adding unseen elements to the vocabulary.
+
+    Args:
+      seq: Sequence of hashable elements.
+
+    Returns:
+      The encoded sequence.
+    """
+    chars = self._chars
+    result = []
+    for elem in seq:
+      char = chars.get(elem)
+      if char is None:
+        char = _get_char(len(self._elements))
+        chars[elem] = char
+        self._elements.append(elem)
+      result.append(char)
+    return u"".join(result)
+
+  def decode(self, encoded_seq):
+    """Decode an encoded sequence.
+
+    Args:
+      encoded_seq: Sequence encoded with this vocabulary.
+
+    Returns:
+      Tuple of the elements of the sequence.
+    """
+    return tuple(self._elements[_get_id(char)] for char in encoded_seq)
+
+  def get_translation(self, elements):
+    """Get a table re-encoding sequences from another vocabulary into this one.
+
+    Elements not in this vocabulary are added.
+
+    Args:
+      elements: Elements of the other vocabulary, ordered by id.
+
+    Returns:
+      Dictionary {code point:char} for use with unicode.translate.
+    """
+    return dict((ord(_get_char(elem_id)), char)
+        for (elem_id, char) in enumerate(self.encode(elements)))
+
+def _get_char(elem_id):
+  """Get the character encoding some element id, skipping surrogates."""
+  code_point = elem_id if elem_id < _SURROGATES_START else \
+      elem_id + _SURROGATES_END - _SURROGATES_START
+  if code_point > _MAX_CODE_POINT:
+    raise ValueError("Vocabulary can not hold more than %d elements on this "
+        "Python build." % (_MAX_CODE_POINT + 1 - _SURROGATES_END + _SURROGATES_START))
+  return chr(code_point)
+
+def _get_id(char):
+  """Get the element id encoded by some character."""
+  code_point = ord(char)
+  return code_point if code_point < _SURROGATES_START else \
+      code_point - _SURROGATES_END + _SURROGATES_START
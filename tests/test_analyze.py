@@ -1,4 +1,8 @@
+import pytest
+import mock
+
 from glabra import analyze
+from glabra import vocabulary
 from glabra.analyze import merge_normalized_sequence_analyzers as merge
 
 class TestSequenceAnalyzer(object):
@@ -44,6 +48,63 @@ class TestSequenceAnalyzer(object):
     assert next(self.sa.get_ngrams_trailing(2, 0, 0)) == "df"
     assert next(self.sa.get_ngrams_trailing(2, 100, 100)) == "gg"
 
+  def test_select_ngrams(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1 + [("fegg", 0.5), ("sdfe", 2.5)])
+    frozen = analyze.SequenceAnalyzer(self.seqfreq1 + [("fegg", 0.5), ("sdfe", 2.5)]).freeze()
+    for (lower, upper) in [(0, 0), (0, 10), (10, 30), (80, 100), (95, 100), (100, 100)]:
+      for length in range(1, 5):
+        assert list(sa.get_ngrams(length, lower, upper)) == \
+            list(frozen.get_ngrams(length, lower, upper))
+        assert list(sa.get_ngrams_leading(length, lower, upper)) == \
+            list(frozen.get_ngrams_leading(length, lower, upper))
+        assert list(sa.get_ngrams_trailing(length, lower, upper)) == \
+            list(frozen.get_ngrams_trailing(length, lower, upper))
+    # narrow bounds of few n-grams are selected without building an index
+    sa = analyze.SequenceAnalyzer([("abcdefghijklmnopqrst"[i], i + 1) for i in range(20)])
+    assert list(sa.get_ngrams(1, 95, 100)) == ["t"]
+    assert list(sa.get_ngrams(1, 0, 1)) == ["a", "b"]
+    assert (analyze.KIND_NGRAMS, 1) not in sa._percentile_indices
+    assert list(sa.get_ngrams(1, 0, 100)) == list("abcdefghijklmnopqrst")
+    assert (analyze.KIND_NGRAMS, 1) in sa._percentile_indices
+
+  def test_get_ngrams_multi(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1, ngram_lengths=[2])
+    bounds = {1: (0, 100), 2: (50, 100), 3: (0, 40)}
+    for kind in analyze.KINDS:
+      result = sa.get_ngrams_multi(bounds, kind)
+      assert sorted(result.keys()) == [1, 2, 3]
+      for (length, (lower, upper)) in bounds.items():
+        assert result[length] == list(self.sa._get_ngs(kind, length, lower, upper))
+    assert sa._ngram_lengths == set([1, 2, 3])
+    with pytest.raises(ValueError):
+      sa.get_ngrams_multi(bounds, "middle")
+
+  def test_build_percentile_index_numpy(self):
+    pytest.importorskip("numpy")
+    freq_dict = {"as": 1, "sd": 0.1, "df": 1.0 / 3, "qw": 1, "we": 2.5, "er": 0.1}
+    total_freq = sum(freq_dict.values()) + 0.5
+    for untracked_freq in [0, 0.5]:
+      index = analyze._build_percentile_index_numpy(freq_dict, total_freq, untracked_freq)
+      with mock.patch("glabra.analyze.numpy", None):
+        expected = analyze._build_percentile_index(freq_dict, total_freq, untracked_freq)
+      assert index.ngrams == expected.ngrams == ["sd", "er", "df", "as", "qw", "we"]
+      assert index.cum_freqs == expected.cum_freqs
+      assert index.percentiles == expected.percentiles
+
+  def test_build_percentile_index_numpy_half(self):
+    pytest.importorskip("numpy")
+    # cumulative frequencies at exactly 0.5 and 2.5 percent
+    freq_dict = {"as": 1, "sd": 4}
+    index = analyze._build_percentile_index_numpy(freq_dict, 200)
+    with mock.patch("glabra.analyze.numpy", None):
+      expected = analyze._build_percentile_index(freq_dict, 200)
+    assert index.percentiles == expected.percentiles
+    assert list(index.percentiles) == [int(round(0.5)), int(round(2.5))]
+    # python 2 rounds half away from zero
+    with mock.patch("glabra.analyze.sys", mock.Mock(version_info=(2, 7))):
+      index = analyze._build_percentile_index_numpy(freq_dict, 200)
+    assert list(index.percentiles) == [1, 3]
+
   def test_get_sequence_length_freq_dict(self):
     assert self.sa.get_sequence_length_freq_dict()[1] == 3
     assert self.sa.get_sequence_length_freq_dict()[3] == 9
@@ -63,25 +124,42 @@ class TestSequenceAnalyzer(object):
     # n-gram percentiles should stay the same
     assert list(sa.get_ngrams(2, lb, ub)) == ngrams_expected
     # sequence frequencies should be 10x
-    assert sa._seq_freq_dict["asdf"] == 10
-    assert sa._seq_freq_dict["g"] == 30
-    assert sa._seq_freq_dict["egg"] == 50
+    assert sa._scale * sa._seq_freq_dict["asdf"] == 10
+    assert sa._scale * sa._seq_freq_dict["g"] == 30
+    assert sa._scale * sa._seq_freq_dict["egg"] == 50
     # n-gram frequencies should be 10x
-    assert sa._freq_dict[2]["df"] == 10
-    assert sa._freq_dict[2]["qw"] == 20
-    assert sa._freq_dict[1]["g"] == 250
+    assert sa._scale * sa._freq_dict[2]["df"] == 10
+    assert sa._scale * sa._freq_dict[2]["qw"] == 20
+    assert sa._scale * sa._freq_dict[1]["g"] == 250
+    # stored frequencies should be untouched
+    assert sa._freq_dict[1]["g"] == 25
+    assert sa.get_sequence_length_freq_dict()[3] == 90
 
   def test_mul(self):
     sa = analyze.SequenceAnalyzer(self.seqfreq1)
     sa2 = sa * 10
-    assert sa._seq_freq_dict["asdf"] == 1
-    assert sa2._seq_freq_dict["asdf"] == 10
+    assert sa._scale * sa._seq_freq_dict["asdf"] == 1
+    assert sa2._scale * sa2._seq_freq_dict["asdf"] == 10
+
+  def test_mul_copy_on_write(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1)
+    sa2 = sa * 10
+    # tables are shared until mutated
+    assert sa2._freq_dict is sa._freq_dict
+    sa2 += analyze.SequenceAnalyzer(self.seqfreq2)
+    assert sa2._freq_dict is not sa._freq_dict
+    assert sa._freq_dict[3]["asd"] == 1
+    assert "zx" not in sa._freq_dict[2]
+    assert sa2._scale * sa2._freq_dict[3]["asd"] == 13
+    sa += analyze.SequenceAnalyzer(self.seqfreq3)
+    assert sa._freq_dict[4]["asdf"] == 5
+    assert sa2._scale * sa2._freq_dict[4]["asdf"] == 10
 
   def test_rmul(self):
     sa = analyze.SequenceAnalyzer(self.seqfreq1)
     sa2 = 10 * sa
-    assert sa._seq_freq_dict["asdf"] == 1
-    assert sa2._seq_freq_dict["asdf"] == 10
+    assert sa._scale * sa._seq_freq_dict["asdf"] == 1
+    assert sa2._scale * sa2._seq_freq_dict["asdf"] == 10
 
   def test_iadd(self):
     sa = analyze.SequenceAnalyzer(self.seqfreq1)
@@ -106,6 +184,341 @@ class TestSequenceAnalyzer(object):
     sa3 = sa + sa2
     assert sa._freq_dict[3]["asd"] == 1
     assert sa3._freq_dict[3]["asd"] == 4
+    sa4 = sa * 2 + sa2 * 10
+    assert sa4._scale * sa4._freq_dict[3]["asd"] == 32
+    assert sa4._scale * sa4._seq_freq_dict["zx"] == 10
+    assert sa4.total_freq == 90
+
+  def test_ngram_lengths(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1, ngram_lengths=[2])
+    assert set(sa._freq_dict.keys()) == set([2])
+    assert list(sa.get_ngrams(2, 0, 100)) == list(self.sa.get_ngrams(2, 0, 100))
+    # other lengths are counted on request
+    assert list(sa.get_ngrams(3, 0, 100)) == list(self.sa.get_ngrams(3, 0, 100))
+    assert list(sa.get_ngrams_leading(1, 0, 100)) == \
+        list(self.sa.get_ngrams_leading(1, 0, 100))
+    assert list(sa.get_ngrams_trailing(4, 0, 100)) == \
+        list(self.sa.get_ngrams_trailing(4, 0, 100))
+    assert sa._total_freq_dict == self.sa._total_freq_dict
+    assert sa._freq_dict == self.sa._freq_dict
+
+  def test_iadd_ngram_lengths(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1, ngram_lengths=[2, 3])
+    sa += analyze.SequenceAnalyzer(self.seqfreq2, ngram_lengths=[2])
+    assert set(sa._freq_dict.keys()) == set([2])
+    sa_expected = analyze.SequenceAnalyzer(self.seqfreq1 + self.seqfreq2)
+    for len_ng in range(1, 5):
+      assert list(sa.get_ngrams(len_ng, 0, 100)) == \
+          list(sa_expected.get_ngrams(len_ng, 0, 100))
+    assert sa._freq_dict == sa_expected._freq_dict
+
+  def test_suffix_array(self):
+    seqfreq = self.seqfreq1 + self.seqfreq2 + [("gegg", 2), ("asdf", 1)]
+    sa = analyze.SequenceAnalyzer(seqfreq, use_suffix_array=True)
+    sa_expected = analyze.SequenceAnalyzer(seqfreq)
+    for kind in analyze.KINDS:
+      (freq_dict, total_freq_dict) = sa._get_freq_dicts(kind)
+      (freq_dict_expected, total_freq_dict_expected) = sa_expected._get_freq_dicts(kind)
+      assert freq_dict == freq_dict_expected
+      assert total_freq_dict == total_freq_dict_expected
+      for len_ng in freq_dict:
+        assert list(freq_dict[len_ng]) == list(freq_dict_expected[len_ng])
+
+  def test_suffix_array_ngram_lengths(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1, ngram_lengths=[2], use_suffix_array=True)
+    assert set(sa._freq_dict.keys()) == set([2])
+    for len_ng in range(1, 5):
+      assert list(sa.get_ngrams(len_ng, 0, 100)) == list(self.sa.get_ngrams(len_ng, 0, 100))
+      assert list(sa.get_ngrams_leading(len_ng, 0, 100)) == \
+          list(self.sa.get_ngrams_leading(len_ng, 0, 100))
+      assert list(sa.get_ngrams_trailing(len_ng, 0, 100)) == \
+          list(self.sa.get_ngrams_trailing(len_ng, 0, 100))
+    assert sa._freq_dict == self.sa._freq_dict
+
+  def test_approximate(self):
+    sa = analyze.ApproximateSequenceAnalyzer(self.seqfreq1, capacity=100)
+    for len_ng in range(1, 5):
+      for (lower, upper) in [(0, 100), (50, 100), (20, 20)]:
+        assert list(sa.get_ngrams(len_ng, lower, upper)) == \
+            list(self.sa.get_ngrams(len_ng, lower, upper))
+        assert list(sa.get_ngrams_leading(len_ng, lower, upper)) == \
+            list(self.sa.get_ngrams_leading(len_ng, lower, upper))
+        assert list(sa.get_ngrams_trailing(len_ng, lower, upper)) == \
+            list(self.sa.get_ngrams_trailing(len_ng, lower, upper))
+    assert sa.total_freq == self.sa.total_freq
+
+  def test_approximate_capacity(self):
+    seqfreq = [("a" * 20, 10)] + [(c, 1) for c in "bcdefghijklmnopq"]
+    sa = analyze.ApproximateSequenceAnalyzer(seqfreq, ngram_lengths=[1], capacity=4)
+    assert len(sa._freq_dict[1]) == 4
+    assert list(sa.get_ngrams(1, 50, 100)) == ["a"]
+    assert sa._total_freq_dict[1] == 216
+    with pytest.raises(ValueError):
+      sa += analyze.ApproximateSequenceAnalyzer(self.seqfreq1)
+    with pytest.raises(ValueError):
+      merge([analyze.SequenceAnalyzer(self.seqfreq1), sa])
+
+  def test_derive_leading_trailing(self):
+    seqfreq = self.seqfreq1 + self.seqfreq2 + [("gegg", 2)]
+    sa_expected = analyze.SequenceAnalyzer(seqfreq)
+    for sa in [analyze.SequenceAnalyzer(seqfreq, derive_leading_trailing=True),
+        analyze.SequenceAnalyzer(seqfreq, derive_leading_trailing=True).freeze()]:
+      assert sa._freq_dict_leading == {}
+      assert sa._freq_dict_trailing == {}
+      for len_ng in range(1, 5):
+        for (lower, upper) in [(0, 100), (50, 100), (20, 20)]:
+          assert list(sa.get_ngrams_leading(len_ng, lower, upper)) == \
+              list(sa_expected.get_ngrams_leading(len_ng, lower, upper))
+          assert list(sa.get_ngrams_trailing(len_ng, lower, upper)) == \
+              list(sa_expected.get_ngrams_trailing(len_ng, lower, upper))
+      assert sa._total_freq_dict_leading == sa_expected._total_freq_dict_leading
+
+  def test_derive_leading_trailing_iadd(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1)
+    sa += analyze.SequenceAnalyzer(self.seqfreq2, derive_leading_trailing=True)
+    sa_expected = analyze.SequenceAnalyzer(self.seqfreq1 + self.seqfreq2)
+    assert sa._freq_dict_leading == {}
+    assert sa._freq_dict == sa_expected._freq_dict
+    for len_ng in range(1, 5):
+      assert list(sa.get_ngrams_trailing(len_ng, 0, 100)) == \
+          list(sa_expected.get_ngrams_trailing(len_ng, 0, 100))
+    sa.remove_sequences(self.seqfreq2)
+    assert list(sa.get_ngrams_leading(2, 0, 100)) == \
+        list(self.sa.get_ngrams_leading(2, 0, 100))
+
+  def test_get_ngrams_percentile_windows(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1 + self.seqfreq2)
+    for len_ng in range(1, 5):
+      freq_dict = sa._freq_dict[len_ng]
+      total_freq = sa._total_freq_dict[len_ng]
+      for lower_bound in range(0, 101, 5):
+        for upper_bound in range(lower_bound, 101, 5):
+          assert list(sa.get_ngrams(len_ng, lower_bound, upper_bound)) == \
+              get_ngs_sort_and_walk(lower_bound, upper_bound, freq_dict, total_freq)
+
+  def test_percentile_index_invalidation(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1)
+    assert list(sa.get_ngrams(4, 100, 100)) == ["qwer"]
+    list(sa.get_ngrams_leading(1, 0, 100))
+    assert (analyze.KIND_NGRAMS, 4) in sa._percentile_indices
+    assert (analyze.KIND_LEADING, 1) in sa._percentile_indices
+    sa += analyze.SequenceAnalyzer([("asdf", 3)])
+    # only lengths of the added analyzer are invalidated
+    assert (analyze.KIND_NGRAMS, 4) not in sa._percentile_indices
+    assert (analyze.KIND_LEADING, 1) not in sa._percentile_indices
+    assert list(sa.get_ngrams(4, 100, 100)) == ["asdf"]
+    sa += analyze.SequenceAnalyzer([("zx", 3)])
+    assert (analyze.KIND_NGRAMS, 4) in sa._percentile_indices
+
+  def test_vocabulary(self):
+    vocab = vocabulary.Vocabulary()
+    seqfreq = [(("to", "be", "or", "not", "to", "be"), 1), (("to", "be"), 2)]
+    sa = analyze.SequenceAnalyzer(seqfreq, vocabulary=vocab)
+    assert sa.get_vocabulary() is vocab
+    assert set(vocab.decode(seq) for seq in sa.get_sequences()) == \
+        set(seq for (seq, _) in seqfreq)
+    assert [vocab.decode(ng) for ng in sa.get_ngrams(2, 100, 100)] == [("to", "be")]
+    assert [vocab.decode(ng) for ng in sa.get_ngrams_trailing(3, 0, 100)] == \
+        [("not", "to", "be")]
+    sa += analyze.SequenceAnalyzer([(("not", "be"), 1)], vocabulary=vocab)
+    assert sa._freq_dict[2][vocab.encode(("not", "be"))] == 1
+
+  def test_vocabulary_mismatch(self):
+    sa = analyze.SequenceAnalyzer([(("a", "b"), 1)], vocabulary=vocabulary.Vocabulary())
+    sa2 = analyze.SequenceAnalyzer([(("a", "b"), 1)], vocabulary=vocabulary.Vocabulary())
+    with pytest.raises(ValueError):
+      sa += sa2
+    with pytest.raises(ValueError):
+      merge([sa, sa2])
+    with pytest.raises(ValueError):
+      sa + analyze.SequenceAnalyzer([(("a", "b"), 1)])
+
+  def test_reencode(self):
+    vocab = vocabulary.Vocabulary()
+    other_vocab = vocabulary.Vocabulary(["z"])
+    seqs = [(("a", "b"), 1), (("b", "a", "b"), 2)]
+    sa = analyze.SequenceAnalyzer(seqs, vocabulary=other_vocab)
+    sa.reencode(vocab, vocab.get_translation(other_vocab.get_elements()))
+    sa_expected = analyze.SequenceAnalyzer(seqs, vocabulary=vocab)
+    assert sa.get_vocabulary() is vocab
+    assert sa._freq_dict == sa_expected._freq_dict
+    assert sa._freq_dict_leading == sa_expected._freq_dict_leading
+    assert sa._seq_freq_dict == sa_expected._seq_freq_dict
+    sa += sa_expected
+    assert sa._freq_dict[2][vocab.encode(("a", "b"))] == 6
+
+  def test_add_sequences(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1)
+    sa.add_sequences(self.seqfreq2)
+    sa_expected = analyze.SequenceAnalyzer(self.seqfreq1 + self.seqfreq2)
+    assert sa._freq_dict == sa_expected._freq_dict
+    assert sa._freq_dict_trailing == sa_expected._freq_dict_trailing
+    assert sa._total_freq_dict_leading == sa_expected._total_freq_dict_leading
+    assert sa._seq_len_dict == sa_expected._seq_len_dict
+    for len_ng in range(1, 5):
+      assert list(sa.get_ngrams(len_ng, 0, 100)) == \
+          list(sa_expected.get_ngrams(len_ng, 0, 100))
+
+  def test_add_sequences_scaled(self):
+    sa = analyze.SequenceAnalyzer([("ab", 1)]) * 2
+    sa.add_sequences([("ab", 2), ("bc", 2)])
+    assert sa.get_sequence_length_freq_dict() == {2: 6}
+    assert sa._scale * sa._freq_dict[1]["b"] == 6
+    with pytest.raises(ValueError):
+      sa.add_sequences([("ab", 0)])
+    with pytest.raises(ValueError):
+      analyze.SequenceAnalyzer(self.seqfreq1).freeze().add_sequences(self.seqfreq2)
+
+  def test_remove_sequences(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1 + self.seqfreq2)
+    sa.remove_sequences(self.seqfreq2)
+    assert sa._freq_dict == self.sa._freq_dict
+    assert sa._freq_dict_leading == self.sa._freq_dict_leading
+    assert sa._freq_dict_trailing == self.sa._freq_dict_trailing
+    assert sa._total_freq_dict == self.sa._total_freq_dict
+    assert sa._seq_len_dict == self.sa._seq_len_dict
+    assert set(sa.get_sequences()) == set(self.sa.get_sequences())
+    sa.remove_sequences([("asdf", 1), ("qwer", 2)])
+    assert 4 not in sa._freq_dict
+    assert 4 not in sa._seq_len_dict
+    assert list(sa.get_ngrams(4, 0, 100)) == []
+
+  def test_remove_sequences_invalid(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1)
+    with pytest.raises(ValueError):
+      sa.remove_sequences([("g", 1), ("zx", 1)])
+    with pytest.raises(ValueError):
+      sa.remove_sequences([("g", 2), ("g", 2)])
+    assert sa._freq_dict == self.sa._freq_dict
+    with pytest.raises(ValueError):
+      analyze.ApproximateSequenceAnalyzer(self.seqfreq1).remove_sequences([("g", 1)])
+
+  def test_add_remove_sequences_invalidation(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1)
+    index2 = sa._get_percentile_index(analyze.KIND_NGRAMS, 2)
+    index4 = sa._get_percentile_index(analyze.KIND_NGRAMS, 4)
+    sa.add_sequences([("zx", 1)])
+    sa.remove_sequences([("g", 1)])
+    assert sa._get_percentile_index(analyze.KIND_NGRAMS, 4) is index4
+    assert sa._get_percentile_index(analyze.KIND_NGRAMS, 2) is not index2
+    assert "zx" in sa.get_ngrams(2, 0, 100)
+
+  def test_freeze(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1 + self.seqfreq2)
+    sa_frozen = analyze.SequenceAnalyzer(self.seqfreq1 + self.seqfreq2).freeze()
+    assert sa_frozen.is_frozen()
+    assert sa_frozen._freq_dict == {}
+    for len_ng in range(1, 6):
+      for (lower_bound, upper_bound) in [(0, 100), (0, 30), (30, 60), (50, 50), (90, 100)]:
+        assert list(sa_frozen.get_ngrams(len_ng, lower_bound, upper_bound)) == \
+            list(sa.get_ngrams(len_ng, lower_bound, upper_bound))
+        assert list(sa_frozen.get_ngrams_leading(len_ng, lower_bound, upper_bound)) == \
+            list(sa.get_ngrams_leading(len_ng, lower_bound, upper_bound))
+        assert list(sa_frozen.get_ngrams_trailing(len_ng, lower_bound, upper_bound)) == \
+            list(sa.get_ngrams_trailing(len_ng, lower_bound, upper_bound))
+    assert list(sa_frozen.get_sequences()) == list(sa.get_sequences())
+    assert sa_frozen.get_sequence_length_freq_dict() == sa.get_sequence_length_freq_dict()
+    assert (sa_frozen * 10).total_freq == 10 * sa.total_freq
+
+  def test_freeze_tuples_ngram_lengths(self):
+    seqfreq = [(tuple(seq), freq) for (seq, freq) in self.seqfreq1]
+    sa = analyze.SequenceAnalyzer(seqfreq)
+    sa_frozen = analyze.SequenceAnalyzer(seqfreq, ngram_lengths=[2]).freeze()
+    # uncounted n-gram lengths are counted from the frozen sequences
+    for len_ng in [2, 3]:
+      assert list(sa_frozen.get_ngrams(len_ng, 0, 100)) == list(sa.get_ngrams(len_ng, 0, 100))
+      assert list(sa_frozen.get_ngrams_leading(len_ng, 0, 100)) == \
+          list(sa.get_ngrams_leading(len_ng, 0, 100))
+    assert sa_frozen._freq_dict == {}
+    assert set(sa_frozen.get_sequences()) == set(sa.get_sequences())
+
+  def test_freeze_add(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1)
+    sa_frozen = analyze.SequenceAnalyzer(self.seqfreq2).freeze()
+    with pytest.raises(ValueError):
+      sa += sa_frozen
+    with pytest.raises(ValueError):
+      sa_frozen += sa
+    with pytest.raises(ValueError):
+      merge([sa, sa_frozen])
+
+  def test_save_load(self, tmpdir):
+    filename = str(tmpdir.join("sa.bin"))
+    sa = analyze.SequenceAnalyzer(self.seqfreq1 + self.seqfreq2, ngram_lengths=[2, 3]) * 3
+    analyze.save_sequence_analyzer(sa, filename)
+    sa_loaded = analyze.load_sequence_analyzer(filename)
+    assert sa_loaded.is_frozen()
+    # length 1 was not saved and is counted from the loaded sequences
+    for len_ng in range(1, 5):
+      for (lower_bound, upper_bound) in [(0, 100), (0, 30), (30, 60), (50, 50), (90, 100)]:
+        assert list(sa_loaded.get_ngrams(len_ng, lower_bound, upper_bound)) == \
+            list(sa.get_ngrams(len_ng, lower_bound, upper_bound))
+        assert list(sa_loaded.get_ngrams_leading(len_ng, lower_bound, upper_bound)) == \
+            list(sa.get_ngrams_leading(len_ng, lower_bound, upper_bound))
+        assert list(sa_loaded.get_ngrams_trailing(len_ng, lower_bound, upper_bound)) == \
+            list(sa.get_ngrams_trailing(len_ng, lower_bound, upper_bound))
+    assert list(sa_loaded.get_sequences()) == list(sa.get_sequences())
+    assert sa_loaded.get_sequence_length_freq_dict() == sa.get_sequence_length_freq_dict()
+    assert sa_loaded.total_freq == sa.total_freq
+
+  def test_save_load_vocabulary(self, tmpdir):
+    filename = str(tmpdir.join("sa.bin"))
+    seqfreq = [(tuple(seq), freq) for (seq, freq) in self.seqfreq1]
+    sa = analyze.SequenceAnalyzer(seqfreq, vocabulary=vocabulary.Vocabulary()).freeze()
+    analyze.save_sequence_analyzer(sa, filename)
+    sa_loaded = analyze.load_sequence_analyzer(filename)
+    assert list(sa_loaded.get_ngrams(2, 0, 100)) == list(sa.get_ngrams(2, 0, 100))
+    assert [sa_loaded.get_vocabulary().decode(seq) for seq in sa_loaded.get_sequences()] == \
+        [seq for (seq, _) in seqfreq]
+
+  def test_save_load_invalid(self, tmpdir):
+    filename = str(tmpdir.join("sa.bin"))
+    seqfreq = [(tuple(seq), freq) for (seq, freq) in self.seqfreq1]
+    with pytest.raises(ValueError):
+      analyze.save_sequence_analyzer(analyze.SequenceAnalyzer(seqfreq), filename)
+    # offsets must fit in the 32-bit offsets of the snapshot
+    with mock.patch("glabra.analyze._SNAPSHOT_MAX_OFFSET", 5):
+      with pytest.raises(ValueError):
+        analyze.save_sequence_analyzer(analyze.SequenceAnalyzer(self.seqfreq1), filename)
+    tmpdir.join("sa.bin").write("not a snapshot")
+    with pytest.raises(ValueError):
+      analyze.load_sequence_analyzer(filename)
+
+  def test_count_sequence_analyzer(self, tmpdir):
+    seqfreq = self.seqfreq1 + self.seqfreq2 + self.seqfreq3
+    for ngram_lengths in [None, [2, 3]]:
+      sa_expected = analyze.SequenceAnalyzer(seqfreq, ngram_lengths).freeze()
+      sa = analyze.count_sequence_analyzer(iter(seqfreq), ngram_lengths,
+          buffer_size=4, num_shards=3, temp_dir=str(tmpdir))
+      assert sa.is_frozen()
+      assert list(sa.get_sequences()) == list(sa_expected.get_sequences())
+      assert sa.get_sequence_length_freq_dict() == sa_expected.get_sequence_length_freq_dict()
+      for len_ng in range(1, 5):
+        for (lower, upper) in [(0, 100), (50, 100), (20, 20)]:
+          assert list(sa.get_ngrams(len_ng, lower, upper)) == \
+              list(sa_expected.get_ngrams(len_ng, lower, upper))
+          assert list(sa.get_ngrams_leading(len_ng, lower, upper)) == \
+              list(sa_expected.get_ngrams_leading(len_ng, lower, upper))
+          assert list(sa.get_ngrams_trailing(len_ng, lower, upper)) == \
+              list(sa_expected.get_ngrams_trailing(len_ng, lower, upper))
+    assert tmpdir.listdir() == []
+    with pytest.raises(ValueError):
+      analyze.count_sequence_analyzer([])
+
+  def test_count_sequence_analyzer_streamed(self, tmpdir):
+    seqfreq = self.seqfreq1 + self.seqfreq2 + self.seqfreq3
+    sa_expected = analyze.SequenceAnalyzer(seqfreq).freeze()
+    num_ngrams = len(sa_expected._percentile_indices[(analyze.KIND_NGRAMS, 1)].ngrams)
+    with mock.patch("glabra.analyze._CONCAT_BLOCK_SIZE", 2), \
+        mock.patch("glabra.analyze._PercentileIndex.pack") as pack, \
+        mock.patch("glabra.analyze._concat_seqs", wraps=analyze._concat_seqs) as concat_seqs:
+      sa = analyze.count_sequence_analyzer(iter(seqfreq), buffer_size=4, temp_dir=str(tmpdir))
+    # n-grams are concatenated in blocks as they are merged, never all in one list
+    assert not pack.called
+    assert num_ngrams > 2
+    assert max(len(args[0]) for (args, _) in concat_seqs.call_args_list) <= \
+        (num_ngrams + 1) // 2
+    assert list(sa.get_ngrams(1, 0, 100)) == list(sa_expected.get_ngrams(1, 0, 100))
 
   def test_get_total_freq(self):
     assert self.sa.total_freq == 15
@@ -113,12 +526,31 @@ class TestSequenceAnalyzer(object):
   def test_set_total_freq(self):
     sa = analyze.SequenceAnalyzer(self.seqfreq1)
     sa.total_freq = 150
-    assert sa._seq_freq_dict["asdf"] == 10
-    assert sa._seq_freq_dict["g"] == 30
-    assert sa._seq_freq_dict["egg"] == 50
-    assert sa._freq_dict[2]["df"] == 10
-    assert sa._freq_dict[2]["qw"] == 20
-    assert sa._freq_dict[1]["g"] == 250
+    assert sa.total_freq == 150
+    assert sa._scale * sa._seq_freq_dict["asdf"] == 10
+    assert sa._scale * sa._seq_freq_dict["g"] == 30
+    assert sa._scale * sa._seq_freq_dict["egg"] == 50
+    assert sa._scale * sa._freq_dict[2]["df"] == 10
+    assert sa._scale * sa._freq_dict[2]["qw"] == 20
+    assert sa._scale * sa._freq_dict[1]["g"] == 250
+
+  def test_iadd_scaled(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1) * 2
+    sa += analyze.SequenceAnalyzer(self.seqfreq2) * 10
+    assert sa._scale * sa._seq_freq_dict["asdf"] == 2
+    assert sa._scale * sa._seq_freq_dict["asd"] == 30
+    assert sa._scale * sa._freq_dict[3]["asd"] == 32
+    assert sa.total_freq == 90
+
+  def test_iadd_scaled_by_zero(self):
+    sa = analyze.SequenceAnalyzer(self.seqfreq1) * 0
+    assert list(sa.get_ngrams(2, 0, 100)) == []
+    assert sa.total_freq == 0
+    sa += analyze.SequenceAnalyzer(self.seqfreq2)
+    assert sa._scale * sa._seq_freq_dict["asdf"] == 0
+    assert sa._scale * sa._seq_freq_dict["asd"] == 3
+    assert sa.total_freq == 6
+    assert next(sa.get_ngrams(2, 100, 100)) in set(["as", "sd", "qw", "we"])
 
   def test_freq_dict(self):
     assert self.sa._freq_dict[1]["a"] == 1
@@ -134,6 +566,14 @@ class TestSequenceAnalyzer(object):
     assert "x" not in self.sa._freq_dict_trailing[1]
     assert "sd" not in self.sa._freq_dict_trailing[2]
 
+  def test_freq_dict_repeated_sequences(self):
+    sa = analyze.SequenceAnalyzer([("asd", 1), ("qwe", 1), ("asd", 2), ("sdf", 1)])
+    assert sa._freq_dict[2] == {"as": 3, "sd": 4, "qw": 1, "we": 1, "df": 1}
+    assert list(sa._freq_dict[2]) == ["as", "sd", "qw", "we", "df"]
+    assert sa._freq_dict_leading[3] == {"asd": 3, "qwe": 1, "sdf": 1}
+    assert sa._total_freq_dict[2] == 10
+    assert sa._seq_freq_dict == {"asd": 3, "qwe": 1, "sdf": 1}
+
   def test_total_freq_dict(self):
     assert self.sa._total_freq_dict[1] == 42
     assert self.sa._total_freq_dict[2] == 27
@@ -178,6 +618,20 @@ class TestSequenceAnalyzer(object):
     assert self.sa2._seq_len_dict[3] == 5
     assert 4 not in self.sa2._seq_len_dict
 
+def get_ngs_sort_and_walk(lower_bound, upper_bound, freq_dict, total_freq):
+  """Reference implementation of percentile windows, sorting on every call."""
+  result = []
+  cum_freq = 0.0
+  passed_lower = False
+  for (ng, freq) in sorted(freq_dict.items(), key=lambda x: x[1]):
+    cum_freq += freq
+    percentile = int(round(100 * cum_freq / total_freq))
+    if lower_bound <= percentile and \
+        (percentile <= upper_bound or not passed_lower):
+      passed_lower = True
+      result.append(ng)
+  return result
+
 class TestSequenceAnalyzerMerge(object):
 
   @classmethod
@@ -189,11 +643,21 @@ class TestSequenceAnalyzerMerge(object):
 
   def test_merge_normalized_sequence_analyzers(self):
     sa_merge = merge([self.sa1, self.sa2])
-    assert sa_merge._seq_freq_dict["foo"] == 1
-    assert sa_merge._seq_freq_dict["bar"] == 0.5
-    assert sa_merge._seq_freq_dict["baz"] == 0.5
+    assert sa_merge._scale * sa_merge._seq_freq_dict["foo"] == 1
+    assert sa_merge._scale * sa_merge._seq_freq_dict["bar"] == 0.5
+    assert sa_merge._scale * sa_merge._seq_freq_dict["baz"] == 0.5
+
+  def test_merge_normalized_sequence_analyzers_ngram_lengths(self):
+    sa1 = analyze.SequenceAnalyzer(self.seqfreq1, ngram_lengths=[1, 2])
+    sa2 = analyze.SequenceAnalyzer(self.seqfreq2, ngram_lengths=[2, 3])
+    sa_merge = merge([sa1, sa2])
+    assert set(sa_merge._freq_dict.keys()) == set([2])
+    assert sa_merge._scale * sa_merge._freq_dict[2]["fo"] == 1
+    assert sa_merge._scale * sa_merge._freq_dict[2]["ba"] == 1
+    assert list(sa_merge.get_ngrams(3, 0, 100)) == ["bar", "baz", "foo"]
+    assert sa_merge._scale * sa_merge._freq_dict[3]["bar"] == 0.5
 
   def test_merge_normalized_sequence_analyzers_no_mutation(self):
     merge([self.sa1, self.sa2])
-    assert self.sa1._seq_freq_dict["foo"] == 1
-    assert self.sa2._seq_freq_dict["foo"] == 999
+    assert self.sa1._scale * self.sa1._seq_freq_dict["foo"] == 1
+    assert self.sa2._scale * self.sa2._seq_freq_dict["foo"] == 999
@@ -0,0 +1,38 @@
+import pytest
+
+from glabra import bitset
+
+class TestBitset(object):
+
+  def test_get_mask(self):
+    assert bitset.get_mask([]) == 0
+    assert bitset.get_mask([0]) == 1
+    assert bitset.get_mask([0, 3, 4]) == 0b11001
+    assert bitset.get_mask([4, 3, 0, 3]) == 0b11001
+    assert bitset.get_mask(iter([100])) == 1 << 100
+
+  def test_get_ids(self):
+    assert bitset.get_ids(0) == []
+    assert bitset.get_ids(0b11001) == [0, 3, 4]
+    assert bitset.get_ids((1 << 100) | 2) == [1, 100]
+
+  def test_count(self):
+    assert bitset.count(0) == 0
+    assert bitset.count(0b11001) == 3
+    assert bitset.count((1 << 100) | 2) == 2
+
+  def test_flags(self):
+    assert bitset.to_flags(0) == bytearray([0])
+    assert bitset.to_flags(0b11001) == bytearray([1, 0, 0, 1, 1])
+    assert bitset.from_flags(bytearray([1, 0, 0, 1, 1, 0, 0])) == 0b11001
+    assert bitset.from_flags(bytearray([0])) == 0
+    flags = bytearray(5)
+    bitset.set_flags(flags, [4, 1])
+    assert flags == bytearray([0, 1, 0, 0, 1])
+
+  def test_round_trip(self):
+    ids = [0, 7, 8, 9, 63, 64, 65, 1000]
+    mask = bitset.get_mask(ids)
+    assert mask == sum(1 << i for i in ids)
+    assert bitset.get_ids(mask) == ids
+    assert bitset.from_flags(bitset.to_flags(mask)) == mask
@@ -1,3 +1,7 @@
+import pytest
+import mock
+import gc
+
 from glabra import buckets
 from glabra import analyze
 
@@ -84,7 +88,7 @@ class TestGetNGramBuckets(object):
 
   def test_get_ng_buckets_full_range(self):
     bounds = {2: (0, 100)}
-    result = buckets._get_ng_buckets(bounds, self.sa.get_ngrams)
+    result = buckets._get_ng_buckets(bounds, self.sa.get_ngrams_multi)
     assert len(result) == 1
     assert len(result[0]) == 4
     assert "as" in result[0]
@@ -94,7 +98,7 @@ class TestGetNGramBuckets(object):
 
   def test_get_ng_buckets_low_range(self):
     bounds = {2: (0, 50)}
-    result = buckets._get_ng_buckets(bounds, self.sa.get_ngrams)
+    result = buckets._get_ng_buckets(bounds, self.sa.get_ngrams_multi)
     assert len(result) == 1
     assert len(result[0]) == 2
     assert "sd" in result[0]
@@ -102,12 +106,122 @@ class TestGetNGramBuckets(object):
 
   def test_get_ng_buckets_high_range(self):
     bounds = {2: (50, 100)}
-    result = buckets._get_ng_buckets(bounds, self.sa.get_ngrams)
+    result = buckets._get_ng_buckets(bounds, self.sa.get_ngrams_multi)
     assert len(result) == 1
     assert len(result[0]) == 2
     assert "as" in result[0]
     assert "qw" in result[0]
 
+class TestBucketCache(object):
+
+  def test_shared_bounds(self):
+    sa = analyze.SequenceAnalyzer([("asdf", 1), ("qwer", 2), ("uipo", 3)])
+    cache = buckets.BucketCache()
+    bounds = {2: (60, 100), 3: (0, 100)}
+    assert buckets.get_ngrams(sa, bounds, cache) == \
+        buckets.get_ngrams(sa, bounds, buckets.BucketCache(0))
+    assert len(cache) == 2
+    # only the bucket of the longer bounds is fetched
+    with mock.patch.object(sa, "get_ngrams_multi",
+        wraps=sa.get_ngrams_multi) as get_ngrams_multi:
+      assert set(buckets.get_ngrams(sa, bounds, cache)) == set(["uip", "ipo"])
+      assert get_ngrams_multi.call_count == 0
+      bounds[4] = (0, 100)
+      assert buckets.get_ngrams(sa, bounds, cache) == ["uipo"]
+      get_ngrams_multi.assert_called_once_with({4: (0, 100)}, analyze.KIND_NGRAMS)
+    assert len(cache) == 3
+    # kinds are cached separately
+    assert set(buckets.get_ngrams_leading(sa, bounds, cache)) == set(["uipo"])
+    assert len(cache) == 6
+
+  def test_mutated_analyzer(self):
+    sa = analyze.SequenceAnalyzer([("asdf", 1), ("qwer", 2), ("uipo", 3)])
+    cache = buckets.BucketCache()
+    bounds = {3: (90, 100)}
+    assert buckets.get_ngrams(sa, bounds, cache) == ["ipo"]
+    version = sa.get_version()
+    sa.add_sequences([("asdf", 10)])
+    assert sa.get_version() != version
+    assert buckets.get_ngrams(sa, bounds, cache) == ["sdf"]
+    sa *= 0
+    assert buckets.get_ngrams(sa, bounds, cache) == []
+
+  def test_discard_old_versions(self):
+    sa = analyze.SequenceAnalyzer([("asdf", 1), ("qwer", 2), ("uipo", 3)])
+    sa2 = analyze.SequenceAnalyzer([("asdf", 1)])
+    cache = buckets.BucketCache()
+    buckets.get_ngrams(sa, {2: (0, 100), 3: (0, 100)}, cache)
+    buckets.get_ngrams(sa2, {3: (0, 100)}, cache)
+    assert len(cache) == 3
+    sa.add_sequences([("asdf", 10)])
+    buckets.get_ngrams(sa, {3: (0, 100)}, cache)
+    assert len(cache) == 2
+
+  def test_discard_garbage_collected(self):
+    sa = analyze.SequenceAnalyzer([("asdf", 1), ("qwer", 2), ("uipo", 3)])
+    sa2 = analyze.SequenceAnalyzer([("asdf", 1)])
+    cache = buckets.BucketCache()
+    buckets.get_ngrams(sa, {2: (0, 100), 3: (0, 100)}, cache)
+    buckets.get_ngrams(sa2, {3: (0, 100)}, cache)
+    assert len(cache) == 3
+    del sa
+    gc.collect()
+    assert len(cache) == 1
+    assert buckets.get_ngrams(sa2, {3: (0, 100)}, cache) == ["asd", "sdf"]
+
+  def test_returned_bucket_is_copy(self):
+    sa = analyze.SequenceAnalyzer([("asdf", 1), ("qwer", 2), ("uipo", 3)])
+    cache = buckets.BucketCache()
+    bucket = buckets.get_ngrams_trailing(sa, {2: (0, 100)}, cache)
+    bucket.append("xx")
+    assert "xx" not in buckets.get_ngrams_trailing(sa, {2: (0, 100)}, cache)
+
+  def test_eviction(self):
+    cache = buckets.BucketCache(2)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    assert cache.get("a") == [1]
+    cache.put("c", [3])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1]
+    assert cache.get("c") == [3]
+    cache.clear()
+    assert len(cache) == 0
+    cache = buckets.BucketCache(0)
+    cache.put("a", [1])
+    assert cache.get("a") is None
+
+class TestSweepBounds(object):
+
+  @classmethod
+  def setup_class(cls):
+    cls.sa = analyze.SequenceAnalyzer(
+        [("asdf", 1), ("qwer", 2), ("uipo", 3), ("asdfg", 2), ("werui", 1)])
+
+  def test_sweep_simple(self):
+    sa = analyze.SequenceAnalyzer([("asdf", 1), ("qwer", 2), ("uipo", 3)])
+    result = list(buckets.sweep_bounds(sa, {3: (0, 100)}, 2, [(0, 100), (60, 100)]))
+    assert result == [((0, 100), ["asd", "sdf", "qwe", "wer", "uip", "ipo"]),
+        ((60, 100), ["uip", "ipo"])]
+
+  def test_sweep_same_as_get_ngrams(self):
+    windows = [(0, 100), (0, 30), (30, 70), (50, 100), (90, 100), (100, 100)]
+    get_ngrams_fns = [
+        (analyze.KIND_NGRAMS, buckets.get_ngrams),
+        (analyze.KIND_LEADING, buckets.get_ngrams_leading),
+        (analyze.KIND_TRAILING, buckets.get_ngrams_trailing)]
+    for bounds in [{}, {1: (20, 100)}, {4: (0, 100)}, {1: (10, 100), 3: (0, 90), 5: (0, 100)}]:
+      for length in [2, 4]:
+        for (kind, get_ngrams_fn) in get_ngrams_fns:
+          for (window, bucket) in buckets.sweep_bounds(self.sa, bounds, length, windows, kind):
+            window_bounds = dict(bounds)
+            window_bounds[length] = window
+            assert bucket == get_ngrams_fn(self.sa, window_bounds, buckets.BucketCache(0))
+
+  def test_sweep_invalid_window(self):
+    with pytest.raises(ValueError):
+      list(buckets.sweep_bounds(self.sa, {}, 2, [(50, 40)]))
+
 class TestFilterSSBuckets(object):
 
   def test_filter_ng_buckets_simple(self):
@@ -134,7 +248,7 @@ class TestBucketFilter(object):
     bucket = ["as", "sd", "df", "qw", "er", "ui"]
     seqs = ["asdf", "qwer", "uiop"]
     filter_fn = buckets._get_bucket_filter(bucket, len(seqs[0]))
-    assert list(filter(filter_fn, seqs)) == ["asdf"]
+    assert filter_fn(seqs) == ["asdf"]
 
 class TestBucketFilterLeading(object):
 
@@ -142,7 +256,7 @@ class TestBucketFilterLeading(object):
     bucket = ["as", "we", "op"]
     seqs = ["asdf", "qwer", "uiop"]
     filter_fn = (buckets._get_bucket_filter_leading(bucket, len(seqs[0])))
-    assert list(filter(filter_fn, seqs)) == ["asdf"]
+    assert filter_fn(seqs) == ["asdf"]
 
 class TestBucketFilterTrailing(object):
 
@@ -150,4 +264,4 @@ class TestBucketFilterTrailing(object):
     bucket = ["as", "we", "op"]
     seqs = ["asdf", "qwer", "uiop"]
     filter_fn = (buckets._get_bucket_filter_trailing(bucket, len(seqs[0])))
-    assert list(filter(filter_fn, seqs)) == ["uiop"]
+    assert filter_fn(seqs) == ["uiop"]
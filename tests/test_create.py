@@ -59,6 +59,41 @@ class TestSequenceCreator(object):
     sc = create.SequenceCreator(6, ["axx"], ["xxx"], ["x1"])
     assert set(sc.get_all_sequences()) == expected
 
+  def test_count_sequences(self):
+    assert self.sc1.count_sequences() == len(self.sc1_expected)
+    assert self.sc2.count_sequences() == len(self.sc2_expected)
+    assert create.SequenceCreator(5, ["aa"], ["xx"], ["11"]).count_sequences() == 0
+    leading = ["ax", "bx", "ay", "by"]
+    middle = ["xx", "xy", "yx", "yy"]
+    trailing = ["x1", "x2", "y1"]
+    for length in range(4, 12):
+      sc = create.SequenceCreator(length, leading, middle, trailing)
+      assert sc.count_sequences() == len(set(sc.get_all_sequences()))
+    # a or b, then nine x or y, then 1 or 2 after x and 1 after y
+    assert sc.count_sequences() == 2 * 2 ** 8 * (2 + 1)
+
+  def test_shared_sequence_graph(self):
+    leading = ["ax", "bx", "aa"]
+    middle = ["xx", "xy", "yx", "yy", "zz", "xz"]
+    trailing = ["x1", "x2", "11"]
+    seq_graph = create.SequenceGraph(leading, middle, trailing)
+    for length in range(4, 9):
+      expected = set(create.SequenceCreator(
+          length, leading, middle, trailing).get_all_sequences())
+      sc = create.SequenceCreator(
+          length, leading, middle, trailing, sequence_graph=seq_graph)
+      assert set(sc.get_all_sequences()) == expected
+      assert sc._leading_to_middle_dedge is seq_graph.get_leading_to_middle_dedge()
+      assert sc._start_vertices is seq_graph.get_start_vertices()
+    # the middle to middle edge getter is only built once
+    assert seq_graph.get_middle_to_middle_dedge() is seq_graph.get_middle_to_middle_dedge()
+
+  def test_sequence_graph_is_disconnected(self):
+    assert not create.SequenceGraph(["ax"], ["xx"], ["x1"]).is_disconnected()
+    assert create.SequenceGraph(["aa"], ["xx"], ["11"]).is_disconnected()
+    assert create.SequenceGraph(["ax"], ["xx"], ["11"]).is_disconnected()
+    assert create.SequenceGraph(["ax"], ["xyz"], ["z1"]).get_ngram_lengths() == (2, 3, 2)
+
   def test_get_num_middle_vertices(self):
     assert create._get_num_middle_vertices(6, 2, 2, 2) == 3
     assert create._get_num_middle_vertices(4, 2, 2, 2) == 1
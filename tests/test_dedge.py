@@ -1,5 +1,6 @@
 import pytest
 
+from glabra import bitset
 from glabra import dedge
 
 class TestDirectedEdgeGetter(object):
@@ -21,6 +22,58 @@ class TestDirectedEdgeGetter(object):
     assert edge.get_start_vertices("rup") == set(["sdru"])
     assert edge.get_start_vertices("rzp") == set(["werz", "Werz"])
 
+  def test_tuples(self):
+    start_ngs = [("a", "b", "c"), ("x", "b", "c"), ("c", "d", "e")]
+    end_ngs = [("b", "c", "d"), ("d", "e", "f")]
+    edge = dedge.DirectedEdgeGetter(start_ngs, end_ngs)
+
+    assert edge.get_end_vertices(("a", "b", "c")) == set([("b", "c", "d")])
+    assert edge.get_end_vertices(("c", "d", "e")) == set([("d", "e", "f")])
+    assert edge.get_end_vertices(("y", "b", "c")) == set([("b", "c", "d")])
+    assert edge.get_end_vertices(("y", "y", "y")) == set()
+    assert edge.get_start_vertices(("b", "c", "d")) == \
+        set([("a", "b", "c"), ("x", "b", "c")])
+
+  def test_vertex_ids(self):
+    start_ngs = ["sdfg", "sdru", "werz", "Werz", "1234", "sdfg"]
+    end_ngs = ["fgx", "fgX", "sdr", "dru", "rup", "rzp"]
+    edge = dedge.DirectedEdgeGetter(start_ngs, end_ngs)
+    get_id = edge.get_vertex_id
+    get_ngs = lambda ids: set(edge.get_vertex(vertex_id) for vertex_id in ids)
+
+    assert edge.get_num_vertices() == 11
+    assert [get_id(ng) for ng in start_ngs] == [0, 1, 2, 3, 4, 0]
+    assert all(edge.get_vertex(get_id(ng)) == ng for ng in start_ngs + end_ngs)
+    for ng in start_ngs:
+      assert get_ngs(edge.get_end_vertex_ids(get_id(ng))) == edge.get_end_vertices(ng)
+    for ng in end_ngs:
+      assert get_ngs(edge.get_start_vertex_ids(get_id(ng))) == edge.get_start_vertices(ng)
+    assert len(edge.get_end_vertex_ids(get_id("fgx"))) == 0
+    assert len(edge.get_start_vertex_ids(get_id("sdfg"))) == 0
+    with pytest.raises(ValueError):
+      edge.get_vertex_id("sdfx")
+
+  def test_vertex_ids_shared(self):
+    ngs = ["ab", "bc", "ca", "bb"]
+    edge = dedge.DirectedEdgeGetter(ngs, ngs)
+    get_id = edge.get_vertex_id
+
+    assert edge.get_num_vertices() == 4
+    assert sorted(edge.get_end_vertex_ids(get_id("ab"))) == [get_id("bc"), get_id("bb")]
+    assert sorted(edge.get_start_vertex_ids(get_id("bb"))) == [get_id("ab"), get_id("bb")]
+    assert list(edge.get_end_vertex_ids(get_id("bc"))) == [get_id("ca")]
+
+  def test_masks(self):
+    ngs = ["ab", "bc", "ca", "bb", "cc"]
+    edge = dedge.DirectedEdgeGetter(ngs, ngs)
+    get_mask = lambda ngs: bitset.get_mask(edge.get_vertex_id(ng) for ng in ngs)
+
+    assert edge.get_end_mask(0) == 0
+    assert edge.get_end_mask(get_mask(["ab"])) == get_mask(["bc", "bb"])
+    assert edge.get_end_mask(get_mask(["ab", "bb", "ca"])) == get_mask(["bc", "bb", "ab"])
+    assert edge.get_start_mask(get_mask(["ca"])) == get_mask(["bc", "cc"])
+    assert edge.get_start_mask(get_mask(["ab", "bb"])) == get_mask(["ca", "ab", "bb"])
+
   def test_fail_empty_start_ngs(self):
     with pytest.raises(ValueError):
       dedge.DirectedEdgeGetter([], ["apa"])
@@ -0,0 +1,52 @@
+import pytest
+import mock
+import os
+
+from glabra import external
+
+class TestSortedRuns(object):
+
+  def test_merge(self, tmpdir):
+    runs = external.SortedRuns(str(tmpdir))
+    runs.add_runs({"a": [1, 4, 7], "b": [(2, "x")]})
+    runs.add_runs({"a": [2, 3]})
+    assert list(runs.merge("a")) == [1, 2, 3, 4, 7]
+    assert list(runs.merge("a", [0, 5])) == [0, 1, 2, 3, 4, 5, 7]
+    assert list(runs.merge("b")) == [(2, "x")]
+    assert list(runs.merge("c", [6])) == [6]
+    runs.close()
+    assert os.listdir(str(tmpdir)) == []
+
+  def test_merge_blocks(self, tmpdir):
+    runs = external.SortedRuns(str(tmpdir))
+    records = list(range(0, 3 * external._BLOCK_SIZE, 2))
+    runs.add_runs({"a": records})
+    runs.add_runs({"a": [1, 3]})
+    assert list(runs.merge("a")) == sorted(records + [1, 3])
+    runs.close()
+
+  def test_merge_bounded_fan_in(self, tmpdir):
+    runs = external.SortedRuns(str(tmpdir), max_merge_runs=3)
+    for i in range(10):
+      runs.add_runs({"a": list(range(i, 5 * external._BLOCK_SIZE // 4, 10))})
+    expected = sorted(i for j in range(10) for i in range(j, 5 * external._BLOCK_SIZE // 4, 10))
+
+    # count the runs being read at the same time
+    read_run = external._read_run
+    num_open = [0, 0]
+    def counting_read_run(filename, offset):
+      num_open[0] += 1
+      num_open[1] = max(num_open)
+      for record in read_run(filename, offset):
+        yield record
+      num_open[0] -= 1
+
+    with mock.patch("glabra.external._read_run", counting_read_run):
+      assert list(runs.merge("a", [-1])) == [-1] + expected
+    assert num_open[1] == 3
+    assert list(runs.merge("a")) == expected
+    runs.close()
+
+  def test_max_merge_runs_illegal(self, tmpdir):
+    with pytest.raises(ValueError):
+      external.SortedRuns(str(tmpdir), max_merge_runs=1)
@@ -1,6 +1,8 @@
 import pytest
 import collections
 
+from glabra import bitset
+from glabra import dedge
 from glabra import graph
 
 class TestGraphPathFinder(object):
@@ -45,10 +47,10 @@ class TestGraphPathFinder(object):
 
   def test_constructor_general(self):
     assert self.gpf1.is_disconnected() is False
-    assert self.gpf1._step_sets[0] == set([11, 12])
-    assert self.gpf1._step_sets[1] == set([22, 23])
-    assert self.gpf1._step_sets[2] == set([32])
-    assert self.gpf1._step_sets[3] == set([43])
+    assert get_step_vertices(self.gpf1, 0) == set([11, 12])
+    assert get_step_vertices(self.gpf1, 1) == set([22, 23])
+    assert get_step_vertices(self.gpf1, 2) == set([32])
+    assert get_step_vertices(self.gpf1, 3) == set([43])
 
   def test_constructor_illegal(self):
     graph.GraphPathFinder([11], [21], 2, DirectedGraph())
@@ -73,11 +75,11 @@ class TestGraphPathFinder(object):
 
   def test_constructor_self_loops(self):
     assert self.gpf1.is_disconnected() is False
-    assert self.gpf2._step_sets[0] == set([1])
-    assert self.gpf2._step_sets[1] == set([2])
-    assert self.gpf2._step_sets[2] == set([2, 3])
-    assert self.gpf2._step_sets[3] == set([2, 3])
-    assert self.gpf2._step_sets[4] == set([3])
+    assert get_step_vertices(self.gpf2, 0) == set([1])
+    assert get_step_vertices(self.gpf2, 1) == set([2])
+    assert get_step_vertices(self.gpf2, 2) == set([2, 3])
+    assert get_step_vertices(self.gpf2, 3) == set([2, 3])
+    assert get_step_vertices(self.gpf2, 4) == set([3])
 
   def test_random_paths_self_loops(self):
     result_set = set([(1, 2, 2, 2, 3), (1, 2, 2, 3, 3), (1, 2, 3, 2, 3), (1, 2, 3, 3, 3)])
@@ -92,6 +94,28 @@ class TestGraphPathFinder(object):
     assert (1, 2, 3, 2, 3) in paths
     assert (1, 2, 3, 3, 3) in paths
 
+  def test_uniform_random_paths(self):
+    for gpf in [self.gpf1, self.gpf2]:
+      paths = set(gpf.get_all_paths())
+      counter = collections.Counter(gpf.get_random_path(uniform=True) for _ in range(4000))
+      assert set(counter.keys()) == paths
+      for count in counter.values():
+        assert abs(count - 4000 / len(paths)) < 300
+
+  def test_count_paths(self):
+    assert self.gpf1.count_paths() == 3
+    assert self.gpf2.count_paths() == 4
+    # weighted by the first and the last vertex of the paths
+    assert self.gpf1.count_paths(lambda x: x, lambda x: 2) == 2 * (12 + 11 + 12)
+    assert self.gpf2.count_paths(end_weight_fn=lambda x: 5) == 20
+    assert graph.GraphPathFinder([1], [2], 5, DirectedGraph()).count_paths() == 0
+
+  def test_count_paths_large(self):
+    # every 2-gram of ten elements, with 100 * 10 ** 40 paths of 41 vertices
+    ngs = [a + b for a in "0123456789" for b in "0123456789"]
+    gpf = graph.GraphPathFinder(ngs, ngs, 41, dedge.DirectedEdgeGetter(ngs, ngs))
+    assert gpf.count_paths() == 10 ** 42
+
   def test_no_path(self):
     gpf = graph.GraphPathFinder([1], [2], 5, DirectedGraph())
     assert gpf.is_disconnected() is True
@@ -137,6 +161,18 @@ class TestGraphPathFinder(object):
     gpf = graph.GraphPathFinder([11], [32], 2, DirectedGraph())
     assert gpf.is_disconnected() is True
 
+  def test_directed_edge_getter(self):
+    ngs = ["ab", "bc", "ca", "bb", "cc"]
+    gpf = graph.GraphPathFinder(["ab"], ["ca", "cc"], 4, dedge.DirectedEdgeGetter(ngs, ngs))
+    assert gpf.is_disconnected() is False
+    assert get_step_vertices(gpf, 1) == set(["bb", "bc"])
+    assert get_step_vertices(gpf, 2) == set(["bc", "cc"])
+    paths = set([("ab", "bb", "bc", "ca"), ("ab", "bb", "bc", "cc"),
+        ("ab", "bc", "cc", "ca"), ("ab", "bc", "cc", "cc")])
+    assert set(gpf.get_all_paths()) == paths
+    for _ in range(100):
+      assert gpf.get_random_path() in paths
+
   def test_expand_update(self):
     expand_fn = lambda x: (10*x, 100*x)
     assert graph.expand_update(set([1, 20, 300]), set([1, 2, 3]), expand_fn) == set([20, 300])
@@ -145,6 +181,11 @@ class TestGraphPathFinder(object):
     expand_fn = lambda x: (10*x, 100*x)
     assert graph._expand([1, 2, 3], expand_fn) == set([10, 100, 20, 200, 30, 300])
 
+def get_step_vertices(gpf, step_index):
+  """Decode the vertices of a step set of a GraphPathFinder."""
+  return set(gpf._dedge.get_vertex(vertex_id)
+      for vertex_id in bitset.get_ids(gpf._step_sets[step_index]))
+
 class DirectedGraph(object):
   """A DirectedEdgeGetter implementation only used for testing."""
 
@@ -0,0 +1,60 @@
+import pytest
+
+from glabra import sketch
+
+class TestCountMinSketch(object):
+
+  def test_estimate(self):
+    cms = sketch.CountMinSketch(0.01, 0.01)
+    assert cms.add("a", 2) >= 2
+    cms.add("b", 1)
+    cms.add("a", 1)
+    assert cms.estimate("a") >= 3
+    assert cms.estimate("b") >= 1
+    assert cms.estimate("c") >= 0
+    assert cms.estimate("a") <= 3 + 0.01 * 4
+
+  def test_invalid(self):
+    with pytest.raises(ValueError):
+      sketch.CountMinSketch(0, 0.01)
+    with pytest.raises(ValueError):
+      sketch.CountMinSketch(0.01, 1)
+
+class TestHeavyHitters(object):
+
+  def test_exact(self):
+    hh = sketch.HeavyHitters(2, 0.01, 0.01)
+    for item in ["a", "b", "a"]:
+      hh.add(item, 1)
+    assert dict(hh.items()) == {"a": 2, "b": 1}
+    assert hh.is_exact()
+
+  def test_replace(self):
+    hh = sketch.HeavyHitters(2, 0.001, 0.01)
+    for item in ["a", "b", "a", "c"]:
+      hh.add(item, 1)
+    assert not hh.is_exact()
+    assert "c" not in hh
+    hh.add("c", 1)
+    assert dict(hh.items()) == {"a": 2, "c": 2}
+    assert len(hh) == 2
+
+  def test_heavy_hitters_kept(self):
+    hh = sketch.HeavyHitters(10, 0.001, 0.01)
+    for i in range(1000):
+      hh.add(i, 1)
+      hh.add("x", 1)
+      if i % 2 == 0:
+        hh.add("y", 1)
+    assert len(hh) == 10
+    assert hh.get("x") >= 1000
+    assert hh.get("y") >= 500
+
+  def test_copy(self):
+    hh = sketch.HeavyHitters(1, 0.01, 0.01)
+    hh.add("a", 1)
+    hh.add("b", 1)
+    hh_copy = hh.copy()
+    hh_copy.add("b", 1)
+    assert "b" in hh_copy
+    assert dict(hh.items()) == {"a": 1}
@@ -0,0 +1,36 @@
+from glabra import suffix
+
+class TestSuffix(object):
+
+  def test_get_suffix_array(self):
+    text = [1, 0, 1, 0]
+    assert suffix.get_suffix_array(text) == [3, 1, 2, 0]
+    assert suffix.get_suffix_array([]) == []
+    assert suffix.get_suffix_array([5]) == [0]
+
+  def test_get_lcp_array(self):
+    text = [1, 0, 1, 0]
+    assert suffix.get_lcp_array(text, suffix.get_suffix_array(text)) == [0, 1, 0, 2]
+
+  def test_count_ngrams(self):
+    (ngrams, leading, trailing) = suffix.count_ngrams([("abab", 1)])
+    assert ngrams == {1: {"a": 2, "b": 2}, 2: {"ab": 2, "ba": 1},
+                      3: {"aba": 1, "bab": 1}, 4: {"abab": 1}}
+    assert leading == {1: {"a": 1}, 2: {"ab": 1}, 3: {"aba": 1}, 4: {"abab": 1}}
+    assert trailing == {1: {"b": 1}, 2: {"ab": 1}, 3: {"bab": 1}, 4: {"abab": 1}}
+
+  def test_count_ngrams_frequencies(self):
+    (ngrams, leading, trailing) = suffix.count_ngrams([("ab", 2), ("b", 3)])
+    assert ngrams == {1: {"a": 2, "b": 5}, 2: {"ab": 2}}
+    assert leading == {1: {"a": 2, "b": 3}, 2: {"ab": 2}}
+    assert trailing == {1: {"b": 5}, 2: {"ab": 2}}
+
+  def test_count_ngrams_ngram_lengths(self):
+    (ngrams, leading, trailing) = suffix.count_ngrams([("abab", 1), ("ba", 2)], [2])
+    assert ngrams == {2: {"ab": 2, "ba": 3}}
+    assert leading == {2: {"ab": 1, "ba": 2}}
+    assert trailing == {2: {"ab": 1, "ba": 2}}
+
+  def test_count_ngrams_tuples(self):
+    (ngrams, _, _) = suffix.count_ngrams([(("to", "be", "to"), 1)], [1, 2])
+    assert ngrams == {1: {("to",): 2, ("be",): 1}, 2: {("to", "be"): 1, ("be", "to"): 1}}
@@ -3,6 +3,7 @@ import mock
 
 from glabra import analyze
 from glabra import text
+from glabra import vocabulary
 
 class TestTextGenerator(object):
 
@@ -37,10 +38,31 @@ class TestTextGenerator(object):
     for text in self.tg2.get_random_texts(100, unique=True):
       assert text == "abcde"
 
+  def test_count_texts(self):
+    assert self.tg.count_texts() == {4: 3}
+    assert self.tg2.count_texts() == {5: 2}
+    assert text.TextGenerator({3: (0, 100)}, self.sa).count_texts() == {}
+
+  def test_frozen_sequence_analyzer(self):
+    sa = analyze.SequenceAnalyzer(
+        [("ab", 1), ("bc", 1), ("cd", 1), ("de", 1), ("xxxx", 1)]).freeze()
+    tg = text.TextGenerator(self.bounds, sa)
+    assert set(tg.get_all_texts()) == set(self.tg.get_all_texts())
+    assert set(tg.get_all_texts(unique=True)) == set(["abcd", "bcde"])
+
   def test_post_process(self):
     tg = text.TextGenerator(self.bounds, self.sa2, lambda x: x.capitalize() + "!")
     assert set(tg.get_all_texts(unique=True)) == set(["Abcde!"])
 
+  def test_vocabulary(self):
+    sa = analyze.SequenceAnalyzer(
+        [(tuple("ab"), 1), (tuple("bc"), 1), (tuple("cd"), 1), (tuple("de"), 1),
+        (tuple("yyyyy"), 1)], vocabulary=vocabulary.Vocabulary())
+    tg = text.TextGenerator(self.bounds, sa, lambda x: "".join(x))
+    assert set(tg.get_all_texts()) == set(["yyyyy", "abcde"])
+    for random_text in tg.get_random_texts(10, unique=True):
+      assert random_text == "abcde"
+
   def test_get_sequence_analyzer(self):
     file_content = "ab bc cd de xxxx"
     seq_delim = r"\s"
@@ -61,6 +83,21 @@ class TestTextGenerator(object):
           "foo", seq_delim, element_delimiter_pattern=elem_delim)
       assert set(sa.get_sequences()) == set([('a', '5'), ('b', '34'), ('xx', '9', 'foo')])
 
+  def test_get_sequence_analyzer_with_vocabulary(self):
+    file_content = "a-5:b-34:xx-9-foo"
+    seq_delim = ":"
+    elem_delim = "-"
+    vocab = vocabulary.Vocabulary()
+
+    with mock.patch("glabra.text.codecs.open",
+        get_mock_file(file_content), create=True) as _:
+      sa = text.get_sequence_analyzer(
+          "foo", seq_delim, element_delimiter_pattern=elem_delim, vocabulary=vocab)
+      assert sa.get_vocabulary() is vocab
+      assert len(vocab) == 7
+      assert set(vocab.decode(seq) for seq in sa.get_sequences()) == \
+          set([('a', '5'), ('b', '34'), ('xx', '9', 'foo')])
+
   def test_get_sequence_analyzer_with_frequencies(self):
     file_content = "a:4,b:6,c:77"
     seq_delim = ","
@@ -83,6 +120,58 @@ class TestTextGenerator(object):
       with pytest.raises(ValueError):
         text.get_sequence_analyzer("foo", seq_delim)
 
+  def test_get_sequence_analyzers(self, tmpdir):
+    filename = str(tmpdir.join("sentences.txt"))
+    with open(filename, "wb") as f:
+      f.write(u"\u00e5 b c. b c. c \u00e5 \u00e5 d. e.".encode("utf8") * 50)
+    with mock.patch("glabra.text._MIN_CHUNK_SIZE", 16):
+      assert len(text._get_chunks(filename, text.re.compile(r"\."), 8)) == 8
+      vocab = vocabulary.Vocabulary()
+      [sa] = text.get_sequence_analyzers(
+          [filename], r"\.", r"\s", ngram_lengths=[2], vocabulary=vocab, processes=2)
+    vocab_expected = vocabulary.Vocabulary()
+    sa_expected = text.get_sequence_analyzer(
+        filename, r"\.", r"\s", ngram_lengths=[2], vocabulary=vocab_expected)
+    assert sa.get_vocabulary() is vocab
+    assert vocab.get_elements() == vocab_expected.get_elements()
+    assert list(sa.get_sequences()) == list(sa_expected.get_sequences())
+    for len_ng in range(1, 4):
+      assert list(sa.get_ngrams(len_ng, 0, 100)) == \
+          list(sa_expected.get_ngrams(len_ng, 0, 100))
+      assert list(sa.get_ngrams_leading(len_ng, 0, 100)) == \
+          list(sa_expected.get_ngrams_leading(len_ng, 0, 100))
+    assert sa.total_freq == sa_expected.total_freq
+
+  def test_get_sequence_analyzers_partial_files(self, tmpdir):
+    filename = str(tmpdir.join("sentences.txt"))
+    with open(filename, "wb") as f:
+      f.write(b"a b c. b c. c a a d. e." * 50)
+    temp_dir = tmpdir.mkdir("temp")
+    with mock.patch("glabra.text._MIN_CHUNK_SIZE", 16), \
+        mock.patch("glabra.text._load_partial", wraps=text._load_partial) as load_partial:
+      [sa] = text.get_sequence_analyzers(
+          [filename], r"\.", r"\s", temp_dir=str(temp_dir), processes=2)
+    # only the final analyzer is loaded by the parent process
+    assert load_partial.call_count == 1
+    assert temp_dir.listdir() == []
+    assert sa.total_freq == 200
+
+  def test_find_delimiter_end_invalid_utf8(self, tmpdir):
+    filename = str(tmpdir.join("invalid.txt"))
+    with open(filename, "wb") as f:
+      f.write(b"a b. c \xff\xfe d. e.")
+    with open(filename, "rb") as f, mock.patch("glabra.text._BUFFER_SIZE", 5):
+      assert text._find_delimiter_end(f, 0, text.re.compile(r"\.")) == 4
+      with pytest.raises(UnicodeDecodeError):
+        text._find_delimiter_end(f, 5, text.re.compile(r"\."))
+
+  def test_get_sequence_analyzers_empty(self, tmpdir):
+    filename = str(tmpdir.join("empty.txt"))
+    with open(filename, "wb") as f:
+      f.write(b"...")
+    with pytest.raises(ValueError):
+      text.get_sequence_analyzers([filename], r"\.", processes=2)
+
   def test_parse_bounds(self):
     bounds = text.parse_bounds(["3:0,100", "5:20,100"])
     assert bounds[3] == (0, 100)
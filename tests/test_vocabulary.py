@@ -0,0 +1,64 @@
+import pytest
+import mock
+import sys
+
+from glabra import vocabulary
+
+class TestVocabulary(object):
+
+  def test_encode_decode(self):
+    vocab = vocabulary.Vocabulary()
+    seq = ("to", "be", "or", "not", "to", "be")
+    encoded = vocab.encode(seq)
+    assert len(encoded) == len(seq)
+    assert len(vocab) == 4
+    assert encoded[:2] == encoded[-2:]
+    assert vocab.decode(encoded) == seq
+    assert vocab.decode(encoded[2:4]) == ("or", "not")
+
+  def test_encode_shared(self):
+    vocab = vocabulary.Vocabulary()
+    encoded1 = vocab.encode(("a", "b"))
+    encoded2 = vocab.encode(("b", "c", "a"))
+    assert encoded1[1] == encoded2[0]
+    assert encoded1[0] == encoded2[2]
+    assert len(vocab) == 3
+
+  def test_elements(self):
+    vocab = vocabulary.Vocabulary(["a", "b"])
+    assert vocab.encode(("b", "c")) == u"\x01\x02"
+    assert vocab.get_elements() == ["a", "b", "c"]
+
+  def test_get_translation(self):
+    vocab = vocabulary.Vocabulary(["a", "b"])
+    other = vocabulary.Vocabulary(["c", "a"])
+    table = vocab.get_translation(other.get_elements())
+    assert other.encode(("a", "c")).translate(table) == vocab.encode(("a", "c"))
+    assert vocab.get_elements() == ["a", "b", "c"]
+
+  def test_surrogates_skipped(self):
+    start = vocabulary._SURROGATES_START
+    end = vocabulary._SURROGATES_END
+    assert ord(vocabulary._get_char(start - 1)) == start - 1
+    assert ord(vocabulary._get_char(start)) == end
+    elem_ids = [0, start - 1, start, start + 1]
+    # code points above 0xFFFF are only single characters on wide builds
+    if sys.maxunicode > 0xFFFF:
+      elem_ids.append(0x10000)
+    for elem_id in elem_ids:
+      assert vocabulary._get_id(vocabulary._get_char(elem_id)) == elem_id
+      assert len(vocabulary._get_char(elem_id)) == 1
+
+  def test_too_many_elements(self):
+    max_id = vocabulary._MAX_CODE_POINT - vocabulary._SURROGATES_END + \
+        vocabulary._SURROGATES_START
+    vocabulary._get_char(max_id)
+    with pytest.raises(ValueError):
+      vocabulary._get_char(max_id + 1)
+
+  def test_too_many_elements_narrow_build(self):
+    with mock.patch("glabra.vocabulary._MAX_CODE_POINT", 0xFFFF):
+      max_id = 0xFFFF - vocabulary._SURROGATES_END + vocabulary._SURROGATES_START
+      assert ord(vocabulary._get_char(max_id)) == 0xFFFF
+      with pytest.raises(ValueError):
+        vocabulary._get_char(max_id + 1)